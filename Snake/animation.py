@@ -0,0 +1,109 @@
+# Animazioni che non bloccano il loop di gioco. Ogni effetto è un oggetto con una durata: lo
+# Scheduler lo fa avanzare a ogni frame con il tempo trascorso dal suo inizio e lo toglie quando
+# è finito, mentre eventi, simulazione e rete continuano. Gli effetti visibili restituiscono i loro
+# sprite (superficie, posizione), da passare al renderer insieme agli altri.
+#
+# I tempi sono in secondi, letti dal chiamante (es. time.perf_counter()).
+
+
+def linear(t):
+    return t
+
+
+def ease_out(t):
+    return 1 - (1 - t) * (1 - t)
+
+
+class Animation:
+    duration = 0.0
+
+    def update(self, elapsed):
+        # elapsed va da 0 a duration compresi: l'ultima chiamata ha sempre elapsed == duration
+        pass
+
+    def sprites(self):
+        return []
+
+
+class Tween(Animation):
+    # Valore che passa da start a end in duration secondi, seguendo la curva ease
+    def __init__(self, start, end, duration, ease=linear):
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.ease = ease
+        self.value = start
+
+    def update(self, elapsed):
+        t = elapsed / self.duration if self.duration > 0 else 1.0
+        self.value = self.start + (self.end - self.start) * self.ease(t)
+
+
+class FrameAnimation(Animation):
+    # Sequenza di immagini in una posizione fissa, ripetuta per tutta la durata
+    def __init__(self, frames, position, duration, frame_time):
+        self.frames = frames
+        self.position = position
+        self.duration = duration
+        self.frame_time = frame_time
+        self.frame = frames[0]
+
+    def update(self, elapsed):
+        self.frame = self.frames[int(elapsed / self.frame_time) % len(self.frames)]
+
+    def sprites(self):
+        return [(self.frame, self.position)]
+
+
+class Timeline(Animation):
+    # Più animazioni, ciascuna con il suo ritardo dall'inizio della timeline; la timeline dura
+    # finché non è finita l'ultima, o almeno duration secondi
+    def __init__(self, *entries, duration=0.0):
+        self.entries = list(entries)  # (ritardo, animazione)
+        self.duration = max([duration] + [delay + animation.duration for delay, animation in entries])
+        self.elapsed = 0.0
+
+    def update(self, elapsed):
+        self.elapsed = elapsed
+        for delay, animation in self.entries:
+            if elapsed >= delay:
+                animation.update(min(elapsed - delay, animation.duration))
+
+    def sprites(self):
+        return [sprite for delay, animation in self.entries if delay <= self.elapsed < delay + animation.duration
+                for sprite in animation.sprites()]
+
+
+class Scheduler:
+    def __init__(self):
+        self.running = []  # [animazione, istante di inizio]
+        self.now = None  # Istante dell'ultimo update()
+
+    def add(self, animation, now, delay=0.0):
+        self.running.append([animation, now + delay])
+        return animation
+
+    def update(self, now):
+        # Fa avanzare tutte le animazioni già iniziate e toglie quelle finite
+        self.now = now
+        still_running = []
+        for entry in self.running:
+            animation, start = entry
+            elapsed = now - start
+            if elapsed >= 0:
+                animation.update(min(elapsed, animation.duration))
+            if elapsed < animation.duration:
+                still_running.append(entry)
+        self.running = still_running
+
+    def sprites(self):
+        # Sprite delle animazioni già iniziate, nell'ordine in cui sono state aggiunte
+        if self.now is None:
+            return []
+        return [sprite for animation, start in self.running if start <= self.now for sprite in animation.sprites()]
+
+    def clear(self):
+        self.running = []
+
+    def __len__(self):
+        return len(self.running)
@@ -0,0 +1,280 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import engine
+from engine import (
+    GRID_WIDTH, GRID_HEIGHT, SINGLE_PLAYER_OBSTACLES, START_POSITIONS, DIRECTION_OFFSETS, OPPOSITE,
+    EVENT_BOMB, EVENT_SELF
+)
+
+# Motore "batch": N partite Single Player indipendenti tenute in array NumPy e fatte avanzare
+# tutte insieme con un solo passo vettorizzato. Le regole sono quelle di engine.step():
+# teletrasporto ai bordi, crescita al tick dopo la mela, morte su bomba o su se stesso,
+# e (se reshuffle_obstacles) una bomba in più rimescolata a ogni mela.
+
+# Cause di morte nell'array death_cause
+ALIVE = 0
+DEATH_BOMB = 1
+DEATH_SELF = 2
+DEATH_CAUSES = {DEATH_BOMB: EVENT_BOMB, DEATH_SELF: EVENT_SELF}
+
+NO_INPUT = -1
+
+
+class BatchGame:
+    def __init__(self, boards, width=GRID_WIDTH, height=GRID_HEIGHT, seed=None,
+                 num_obstacles=SINGLE_PLAYER_OBSTACLES, reshuffle_obstacles=True, start=START_POSITIONS[0]):
+        self.boards = boards
+        self.width = width
+        self.height = height
+        self.cells = width * height
+        self.capacity = self.cells + 1
+        self.initial_obstacles = num_obstacles
+        self.reshuffle_obstacles = reshuffle_obstacles
+        self.start_cell = start[1] * width + start[0]
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(boards)
+
+        # Tabella dei vicini con teletrasporto ai bordi, come in engine.GameState
+        x = np.arange(self.cells) % width
+        y = np.arange(self.cells) // width
+        self.neighbours = np.stack(
+            [((y + dy) % height) * width + (x + dx) % width for dx, dy in DIRECTION_OFFSETS], axis=1
+        ).astype(np.int32)
+        self.opposite = np.array(OPPOSITE, dtype=np.int8)
+
+        self.blocked = np.zeros(self.cells, dtype=bool)
+        self.blocked[engine.score_area_cells(width, height)] = True
+
+        # Stato di ogni partita
+        self.bodies = np.zeros((boards, self.capacity), dtype=np.int32)  # Buffer circolari dei corpi
+        self.start = np.zeros(boards, dtype=np.int32)  # Posizione della coda nel buffer
+        self.length = np.zeros(boards, dtype=np.int32)
+        self.heads = np.zeros(boards, dtype=np.int32)
+        self.directions = np.zeros(boards, dtype=np.int8)
+        self.occupied = np.zeros((boards, self.cells), dtype=np.uint8)  # Segmenti del serpente per cella
+        self.obstacles = np.zeros((boards, self.cells), dtype=bool)
+        self.food = np.zeros(boards, dtype=np.int32)
+        self.num_obstacles = np.zeros(boards, dtype=np.int32)
+        self.scores = np.zeros(boards, dtype=np.int32)
+        self.growing = np.zeros(boards, dtype=bool)
+        self.alive = np.zeros(boards, dtype=bool)
+        self.death_cause = np.zeros(boards, dtype=np.int8)
+        self.ticks = np.zeros(boards, dtype=np.int32)
+
+        self.reset()
+
+    def reset(self, boards=None):
+        # Ricomincia le partite indicate (tutte se boards è None)
+        rows = self.rows if boards is None else np.asarray(boards)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        if not len(rows):
+            return
+
+        self.occupied[rows] = 0
+        self.obstacles[rows] = False
+        self.start[rows] = 0
+        self.length[rows] = 1
+        self.bodies[rows, 0] = self.start_cell
+        self.heads[rows] = self.start_cell
+        self.occupied[rows, self.start_cell] = 1
+        self.directions[rows] = engine.UP
+        self.scores[rows] = 0
+        self.growing[rows] = False
+        self.alive[rows] = True
+        self.death_cause[rows] = ALIVE
+        self.ticks[rows] = 0
+        self.num_obstacles[rows] = self.initial_obstacles
+
+        self._spawn_food(rows)
+        self._spawn_obstacles(rows)
+
+    def _free_mask(self, rows, with_food=True):
+        free = (self.occupied[rows] == 0) & ~self.blocked & ~self.obstacles[rows]
+        if with_food:
+            food = self.food[rows]
+            has_food = food >= 0
+            free[np.flatnonzero(has_food), food[has_food]] = False
+        return free
+
+    def _random_keys(self, free):
+        # Chiavi casuali sulle celle libere, -1 su quelle occupate
+        return np.where(free, self.rng.random(free.shape, dtype=np.float32), np.float32(-1))
+
+    def _spawn_food(self, rows):
+        # Cella libera uniforme per ogni partita: massimo di chiavi casuali sulle sole celle libere
+        free = self._free_mask(rows, with_food=False)
+        keys = self._random_keys(free)
+        self.food[rows] = np.where(free.any(axis=1), np.argmax(keys, axis=1), -1)  # -1: campo pieno
+
+    def _spawn_obstacles(self, rows):
+        # Rimescola le bombe: le num_obstacles celle libere con le chiavi casuali più alte.
+        # Le partite vengono raggruppate per numero di bombe, così basta un argpartition per gruppo.
+        self.obstacles[rows] = False
+        free = self._free_mask(rows)
+        keys = self._random_keys(free)
+        counts = np.minimum(self.num_obstacles[rows], self.cells)
+        for count in np.unique(counts):
+            if count == 0:
+                continue
+            group = np.flatnonzero(counts == count)
+            chosen = np.argpartition(-keys[group], count - 1, axis=1)[:, :count]
+            sub = np.repeat(group, count)
+            cells = chosen.reshape(-1)
+            valid = free[sub, cells]
+            self.obstacles[rows[sub[valid]], cells[valid]] = True
+
+    def step(self, inputs=None):
+        # Avanza di un tick tutte le partite ancora in corso. inputs[b] è la nuova direzione
+        # della partita b, oppure NO_INPUT. Restituisce le maschere (mangiato, morto).
+        rows = np.flatnonzero(self.alive)
+        ate = np.zeros(self.boards, dtype=bool)
+        died = np.zeros(self.boards, dtype=bool)
+        if not len(rows):
+            return ate, died
+
+        directions = self.directions[rows]
+        if inputs is not None:
+            wanted = np.asarray(inputs, dtype=np.int8)[rows]
+            turn = (wanted != NO_INPUT) & (wanted != self.opposite[directions])
+            directions = np.where(turn, wanted, directions)
+            self.directions[rows] = directions
+
+        # Indici "piatti" nelle matrici (partita, cella) e (partita, posizione nel buffer)
+        occupied = self.occupied.reshape(-1)
+        bodies = self.bodies.reshape(-1)
+        row_cells = rows * self.cells
+        row_slots = rows * self.capacity
+
+        # Prima si libera la coda (se il serpente non sta crescendo)...
+        growing = self.growing[rows]
+        shrink = ~growing
+        start = self.start[rows]
+        tails = bodies[row_slots + start]
+        occupied[(row_cells + tails)[shrink]] -= 1
+        start = np.where(shrink, (start + 1) % self.capacity, start)
+        length = self.length[rows] - shrink
+        self.growing[rows] = False
+
+        # ...poi avanza la testa
+        heads = self.neighbours[self.heads[rows], directions]
+        bodies[row_slots + (start + length) % self.capacity] = heads
+        length += 1
+        head_cells = row_cells + heads
+        occupied[head_cells] += 1
+        self.start[rows] = start
+        self.length[rows] = length
+        self.heads[rows] = heads
+        self.ticks[rows] += 1
+
+        # Collisioni con le bombe e con se stesso
+        bomb = self.obstacles.reshape(-1)[head_cells]
+        self_hit = occupied[head_cells] > 1
+        dead = bomb | self_hit
+        self.death_cause[rows[self_hit]] = DEATH_SELF
+        self.death_cause[rows[bomb]] = DEATH_BOMB
+        self.alive[rows[dead]] = False
+        died[rows[dead]] = True
+
+        # Collisioni con il cibo
+        eaters = rows[~dead & (heads == self.food[rows])]
+        if len(eaters):
+            ate[eaters] = True
+            self.growing[eaters] = True
+            self.scores[eaters] += 1
+            self._spawn_food(eaters)
+            if self.reshuffle_obstacles:
+                self.num_obstacles[eaters] += 1
+                self._spawn_obstacles(eaters)
+
+        return ate, died
+
+    def body(self, board):
+        # Celle del serpente della partita board, dalla testa alla coda
+        positions = (self.start[board] + np.arange(self.length[board])[::-1]) % self.capacity
+        return self.bodies[board, positions]
+
+
+def divergence(boards=64, ticks=2000, seed=0):
+    # Confronta il motore batch con engine.step() tick per tick e restituisce la prima differenza
+    # (partita, tick, campo, valore scalare, valore batch), o None se i due motori coincidono.
+    # Le celle di cibo e bombe estratte dal batch vengono copiate nelle partite scalari, così i
+    # due motori restano sulla stessa sequenza di partita pur usando generatori casuali diversi.
+    batch = BatchGame(boards, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+
+    def sync(state, board):
+        engine.set_food(state, int(batch.food[board]))
+        engine.set_obstacles(state, np.flatnonzero(batch.obstacles[board]).tolist())
+
+    def new_state(board):
+        state = engine.new_game(spawn=False, reshuffle_obstacles=True, num_obstacles=batch.initial_obstacles,
+                                starts=[START_POSITIONS[0]])
+        sync(state, board)
+        return state
+
+    states = [new_state(board) for board in range(boards)]
+    for tick in range(ticks):
+        inputs = np.where(rng.random(boards) < 0.2, rng.integers(0, 4, boards), NO_INPUT)
+        ate, died = batch.step(inputs)
+        for board, state in enumerate(states):
+            if state.over:
+                continue
+            direction = None if inputs[board] == NO_INPUT else int(inputs[board])
+            events = engine.step(state, [direction])
+            snake = state.snakes[0]
+            if ate[board]:
+                sync(state, board)
+            compared = (
+                ('food', any(kind == engine.EVENT_FOOD for kind, _, _ in events), bool(ate[board])),
+                ('death', not snake.alive, bool(died[board])),
+                ('death_cause', snake.death_cause, DEATH_CAUSES.get(int(batch.death_cause[board]))),
+                ('score', snake.score, int(batch.scores[board])),
+                ('direction', snake.direction, int(batch.directions[board])),
+                ('body', list(snake.body), batch.body(board).tolist()),
+                ('num_obstacles', state.num_obstacles, int(batch.num_obstacles[board])),
+            )
+            for field, scalar, batched in compared:
+                if scalar != batched:
+                    return board, tick, field, scalar, batched
+
+        if not batch.alive.any():
+            batch.reset(batch.rows)
+            states = [new_state(board) for board in range(boards)]
+    return None
+
+
+def benchmark(boards, ticks, seed=0):
+    batch = BatchGame(boards, seed=seed)
+    rng = np.random.default_rng(seed)
+    inputs = rng.integers(0, 4, (ticks, boards), dtype=np.int8)
+    inputs[rng.random((ticks, boards)) < 0.8] = NO_INPUT
+
+    start_time = time.perf_counter()
+    for tick in range(ticks):
+        batch.step(inputs[tick])
+        batch.reset(~batch.alive)  # Le partite finite ricominciano subito
+    elapsed = time.perf_counter() - start_time
+    return boards * ticks / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Motore batch di PySnake')
+    parser.add_argument('--boards', type=int, default=10000)
+    parser.add_argument('--ticks', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', action='store_true', help='confronta il batch con engine.step() tick per tick')
+    args = parser.parse_args()
+
+    if args.verify:
+        found = divergence(seed=args.seed)
+        if found is not None:
+            board, tick, field, scalar, batched = found
+            sys.exit(f'Partita {board}, tick {tick}: {field} scalare {scalar!r}, batch {batched!r}')
+        print('Batch e motore scalare coincidono')
+    else:
+        print(f'{benchmark(args.boards, args.ticks, args.seed):,.0f} board-tick/s')
@@ -0,0 +1,144 @@
+import importlib
+import random
+import time
+
+from engine import BOMB, OPPOSITE, SNAKE
+from pathfinding import distance_field, first_step
+
+# Giocatori automatici. Un bot prende il posto della tastiera di game(): a ogni tick riceve lo
+# stato della partita e l'indice del suo serpente, e restituisce la nuova direzione (o None
+# per continuare dritto). I bot non modificano mai lo stato.
+
+PATH_BUDGET = 0.004  # Secondi massimi in cui PathBot sceglie una mossa, anche sui campi 200x200
+# Parte del tempo tenuta da parte: i controlli della scadenza arrivano a blocchi (un livello della BFS,
+# 64 celle di A* o della riparazione) e dopo l'ultimo resta da scegliere la mossa
+PATH_MARGIN = 0.2
+
+
+def is_deadly(state, cell):
+    # Vero se entrare nella cella al prossimo tick uccide il serpente
+    if state.grid[cell] == BOMB:
+        return True
+    if not state.counts[cell]:
+        return False
+
+    if state.counts[cell] > 1:
+        return True  # Segmenti sovrapposti: almeno uno resta nella cella
+
+    # Un solo segmento, del serpente indicato dal tag della cella: costo costante anche con molti
+    # serpenti. La coda si sposta nello stesso tick, quindi la sua cella è sicura (se il serpente non cresce).
+    other = state.snakes[state.grid[cell] - SNAKE]
+    return not (other.alive and not other.growing and not other.remote and other.body.tail == cell)
+
+
+def safe_moves(state, index):
+    snake = state.snakes[index]
+    head = snake.body.head
+    return [direction for direction in range(4)
+            if direction != OPPOSITE[snake.direction]
+            and not is_deadly(state, state.neighbours[head * 4 + direction])]
+
+
+class RandomBot:
+    # Cambia direzione a caso, evitando le mosse che portano subito alla morte
+    def __init__(self, seed=None, turn_probability=0.2):
+        self.rng = random.Random(seed)
+        self.turn_probability = turn_probability
+
+    def move(self, state, index):
+        moves = safe_moves(state, index)
+        if not moves:
+            return None
+        direction = state.snakes[index].direction
+        if direction in moves and self.rng.random() >= self.turn_probability:
+            return direction
+        return self.rng.choice(moves)
+
+
+class GreedyBot:
+    # Si avvicina alla mela sulla griglia toroidale, scegliendo tra le mosse sicure
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def move(self, state, index):
+        moves = safe_moves(state, index)
+        if not moves:
+            return None
+        if state.food is None:
+            return self.rng.choice(moves)
+
+        head = state.snakes[index].body.head
+        return min(moves, key=lambda direction: (
+            toroidal_distance(state, state.neighbours[head * 4 + direction], state.food), self.rng.random()
+        ))
+
+
+class PathBot:
+    # Segue il percorso più breve verso la mela (campo di distanze di pathfinding.py) e scarta le
+    # mosse che lo chiuderebbero in uno spazio più piccolo del suo corpo o che rischiano uno
+    # scontro frontale. Ogni mossa ha un tempo massimo: se il campo non è ancora pronto usa A*
+    # dalla testa, e se il tempo finisce prende la migliore tra le mosse già controllate.
+    def __init__(self, seed=None, budget=PATH_BUDGET):
+        self.rng = random.Random(seed)
+        self.budget = budget
+        self.late = 0  # Mosse scelte senza aver finito i controlli entro il tempo
+
+    def move(self, state, index):
+        budget = self.budget * (1 - PATH_MARGIN)
+        deadline = time.perf_counter() + budget
+        moves = safe_moves(state, index)
+        if not moves:
+            return None
+
+        snake = state.snakes[index]
+        head = snake.body.head
+        field = distance_field(state, deadline - budget / 2)  # Metà del tempo al campo, il resto alle mosse
+        targets = {direction: state.neighbours[head * 4 + direction] for direction in moves}
+        if field.ready:
+            distances = field.distances
+            rank = {direction: distances[cell] for direction, cell in targets.items()}
+        else:
+            step = first_step(state, field.walls, head, state.food, deadline)
+            rank = {direction: cell != step for direction, cell in targets.items()}
+        # Le celle in cui può entrare nello stesso tick la testa di un altro serpente vengono per ultime
+        contested = {state.neighbours[other.body.head * 4 + direction] for other in state.snakes
+                     if other is not snake and other.alive and len(other.body) for direction in range(4)}
+        moves.sort(key=lambda direction: (targets[direction] in contested, rank[direction], self.rng.random()))
+
+        # La prima mossa (la più vicina alla mela) che lascia abbastanza spazio, altrimenti quella con più spazio
+        best, best_space = moves[0], -1
+        for direction in moves:
+            if time.perf_counter() > deadline:
+                self.late += 1
+                break
+            space = field.space(targets[direction], len(snake), deadline)
+            if space >= len(snake):
+                return direction
+            if space > best_space:
+                best, best_space = direction, space
+        return best
+
+
+def toroidal_distance(state, a, b):
+    ax, ay = state.coords(a)
+    bx, by = state.coords(b)
+    dx = abs(ax - bx)
+    dy = abs(ay - by)
+    return min(dx, state.width - dx) + min(dy, state.height - dy)
+
+
+BOTS = {
+    'random': RandomBot,
+    'greedy': GreedyBot,
+    'path': PathBot,
+}
+
+
+def make_bot(name, seed=None):
+    # name è un nome registrato in BOTS oppure "modulo:Classe" per un bot esterno
+    if name in BOTS:
+        return BOTS[name](seed)
+    if ':' not in name:
+        raise ValueError(f'unknown bot: {name} (available: {", ".join(BOTS)} or module:Class)')
+    module_name, class_name = name.split(':', 1)
+    return getattr(importlib.import_module(module_name), class_name)(seed)
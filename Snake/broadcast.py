@@ -0,0 +1,93 @@
+# Trasmissione di una partita a molti spettatori in sola lettura. A ogni tick la stanza pubblica
+# un solo delta già codificato, e ogni spettatore ne tiene in coda un riferimento (lo stesso
+# oggetto bytes per tutti): aggiungere uno spettatore non aggiunge codifiche, solo l'invio.
+#
+# Uno spettatore nuovo, o che ha perso un delta (resync), riceve prima un keyframe: l'istantanea
+# completa dello stato attuale, codificata al più una volta per tick e condivisa da tutti quelli
+# che la aspettano. Poi riceve i delta dal tick successivo.
+#
+# Ogni spettatore può chiedere un ritmo massimo (invii al secondo: i delta accumulati partono
+# insieme) e una banda massima (byte al secondo). Se resta troppo indietro, la coda viene
+# scartata e riceve un keyframe nuovo: salta al presente invece di rivedere il passato.
+
+SPECTATOR_BACKLOG = 30  # Delta in coda oltre i quali uno spettatore lento riparte da un keyframe
+
+
+class Viewer:
+    def __init__(self, peer, rate=0, bandwidth=0, now=0.0):
+        self.peer = peer
+        self.interval = 1 / rate if rate else 0.0  # Secondi minimi tra due invii, 0 a ogni tick
+        self.bandwidth = bandwidth  # Byte al secondo, 0 senza limite
+        self.credit = bandwidth  # Byte che si possono inviare adesso (token bucket)
+        self.refilled = now
+        self.queue = []  # Payload condivisi da inviare
+        self.keyframe_due = True
+        self.next_send = 0.0
+        self.catch_ups = 0  # Volte in cui la coda è stata scartata per ripartire da un keyframe
+
+
+class Broadcast:
+    def __init__(self, backlog=SPECTATOR_BACKLOG):
+        self.viewers = []
+        self.backlog = backlog
+        self.keyframes = 0  # Keyframe codificati (non inviati: uno per tick al massimo)
+        self.catch_ups = 0
+
+    def add(self, viewer):
+        self.viewers.append(viewer)
+        return viewer
+
+    def remove(self, viewer):
+        self.viewers.remove(viewer)
+
+    def request_keyframe(self, viewer):
+        viewer.queue = []
+        viewer.keyframe_due = True
+
+    def publish(self, payload):
+        # Delta di un tick, codificato una volta sola dalla stanza
+        for viewer in self.viewers:
+            if viewer.keyframe_due:
+                continue  # Riceverà il keyframe, che comprende già questo tick
+            viewer.queue.append(payload)
+            if len(viewer.queue) > self.backlog:
+                self.request_keyframe(viewer)
+                viewer.catch_ups += 1
+                self.catch_ups += 1
+
+    def flush(self):
+        # Tutto ciò che è ancora in coda, senza limiti di ritmo e banda (es. stanza che chiude)
+        ready = [(viewer, viewer.queue) for viewer in self.viewers if viewer.queue]
+        for viewer in self.viewers:
+            viewer.queue = []
+        return ready
+
+    def due(self, now, keyframe):
+        # Spettatori a cui inviare qualcosa adesso, con i payload da inviare. keyframe() restituisce
+        # l'istantanea codificata dello stato attuale, chiamata solo se qualcuno ne ha bisogno.
+        cached = None
+        ready = []
+        for viewer in self.viewers:
+            if now < viewer.next_send:
+                continue
+            if viewer.keyframe_due:
+                if cached is None:
+                    cached = keyframe()
+                    self.keyframes += 1
+                viewer.queue = [cached]
+                viewer.keyframe_due = False
+            if not viewer.queue:
+                continue
+
+            if viewer.bandwidth:
+                viewer.credit = min(viewer.bandwidth, viewer.credit + (now - viewer.refilled) * viewer.bandwidth)
+                viewer.refilled = now
+                size = sum(map(len, viewer.queue))
+                if size > viewer.credit and viewer.credit < viewer.bandwidth:
+                    continue  # Aspetta la banda; se la coda cresce troppo publish() lo fa ripartire
+                viewer.credit -= size  # Può andare sotto zero: un keyframe grande si paga dopo
+
+            ready.append((viewer, viewer.queue))
+            viewer.queue = []
+            viewer.next_send = now + viewer.interval
+        return ready
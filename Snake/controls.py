@@ -0,0 +1,49 @@
+from collections import deque
+
+from engine import OPPOSITE
+from telemetry import LatencyStats
+
+# Coda delle svolte di un giocatore. La tastiera viene letta a ogni frame (più spesso dei tick),
+# e ogni pressione valida si accoda; la simulazione ne consuma una per tick. Così due tasti
+# premuti nello stesso tick diventano due svolte in tick consecutivi invece di far vincere
+# l'ultimo, e ogni svolta viene controllata rispetto alla direzione che sarà in vigore quando
+# verrà eseguita (l'ultima in coda), non a quella attuale: su, poi sinistra e giù non può più
+# far girare il serpente su se stesso.
+
+INPUT_QUEUE_SIZE = 3  # Svolte in attesa al massimo: oltre si scartano, il giocatore è troppo avanti
+
+
+class InputQueue:
+    def __init__(self, size=INPUT_QUEUE_SIZE):
+        self.size = size
+        self.moves = deque()  # (direzione, istante della pressione)
+        self.latency = LatencyStats()  # Tempo tra la pressione del tasto e il tick che la esegue
+
+        self.rejected = 0  # Svolte inutili (stessa direzione) o contrarie
+        self.dropped = 0  # Svolte scartate a coda piena
+
+    def push(self, direction, current, now):
+        # current è la direzione attuale del serpente; restituisce False se la svolta è scartata
+        last = self.moves[-1][0] if self.moves else current
+        if direction == last or direction == OPPOSITE[last]:
+            self.rejected += 1
+            return False
+        if len(self.moves) >= self.size:
+            self.dropped += 1
+            return False
+        self.moves.append((direction, now))
+        return True
+
+    def pop(self, now):
+        # Svolta da eseguire in questo tick, None se il serpente prosegue dritto
+        if not self.moves:
+            return None
+        direction, pressed = self.moves.popleft()
+        self.latency.add(now - pressed)
+        return direction
+
+    def clear(self):
+        self.moves.clear()
+
+    def __len__(self):
+        return len(self.moves)
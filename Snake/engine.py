@@ -0,0 +1,524 @@
+import argparse
+import math
+import random
+from array import array
+
+# Motore di gioco senza display: contiene tutte le regole di PySnake e può essere
+# importato senza Pygame (bot, replay, server, test).
+#
+# Il campo è una griglia di GRID_WIDTH x GRID_HEIGHT celle; ogni cella è identificata
+# dal suo indice y * larghezza + x. La conversione in pixel avviene solo nel renderer.
+
+# Impostazioni di base del gioco
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+BLOCK_SIZE = 50
+GRID_WIDTH = SCREEN_WIDTH // BLOCK_SIZE
+GRID_HEIGHT = SCREEN_HEIGHT // BLOCK_SIZE
+SCORE_AREA = (10, 10, 200, 140)  # x, y, larghezza, altezza dell'area del punteggio (in pixel)
+DIFFICULTY_LEVELS = {"Facile": 3, "Media": 5, "Difficile": 10}
+SINGLE_PLAYER_OBSTACLES = 5  # Numero di ostacoli iniziali per la modalità Single Player
+
+# Posizioni iniziali (in celle) dei giocatori: host e client
+START_POSITIONS = [(2, 2), (4, 4)]
+
+# Tutti contro tutti: campo grande per 8-64 serpenti (vedi spread_starts)
+FREE_FOR_ALL_SIZE = (64, 48)
+
+# Direzioni
+UP, RIGHT, DOWN, LEFT = DIRECTIONS = range(4)
+DIRECTION_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+OPPOSITE = (DOWN, LEFT, UP, RIGHT)
+
+# Tag della griglia di occupazione: un byte per cella con tipo di entità e proprietario.
+# Per i serpenti il tag è SNAKE + indice del serpente. Se più entità condividono una cella
+# vale la precedenza bomba > serpente > cibo.
+EMPTY = 0
+FOOD = 1
+BOMB = 2
+SNAKE = 3
+MAX_SNAKES = 256 - SNAKE
+
+# Eventi restituiti da step()
+EVENT_FOOD = 'food'
+EVENT_BOMB = 'bomb'
+EVENT_SELF = 'self'
+EVENT_SNAKE = 'snake'
+
+
+def board_size(text):
+    # "64x48" -> (64, 48), per le opzioni --board di tournament.py e match_server.py
+    try:
+        width, height = map(int, text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid board size: {text} (expected e.g. 64x48)')
+    return width, height
+
+
+class SnakeBody:
+    # Corpo del serpente come buffer circolare di indici di cella, più un contatore di
+    # occupazione per cella: avanzare, crescere e controllare se una cella appartiene al
+    # corpo costano O(1), indipendentemente dalla lunghezza del serpente.
+    __slots__ = ('cells', 'occupied', 'capacity', 'start', 'length')
+
+    def __init__(self, board_size, cells=()):
+        self.capacity = board_size + 1
+        self.cells = array('i', bytes(4 * self.capacity))  # La coda è in start, la testa in start + length - 1
+        self.occupied = bytearray(board_size)  # Quanti segmenti occupano ogni cella
+        self.start = 0
+        self.length = 0
+        self.reset(cells)
+
+    def reset(self, cells):
+        # cells va dalla testa alla coda, come il vecchio elenco di posizioni
+        for cell in self:
+            self.occupied[cell] = 0
+        self.start = 0
+        self.length = 0
+        for cell in reversed(list(cells)):
+            self.push_head(cell)
+
+    def push_head(self, cell):
+        self.cells[(self.start + self.length) % self.capacity] = cell
+        self.length += 1
+        self.occupied[cell] += 1
+
+    def pop_tail(self):
+        cell = self.cells[self.start]
+        self.start = (self.start + 1) % self.capacity
+        self.length -= 1
+        self.occupied[cell] -= 1
+        return cell
+
+    def advance(self, cell, grow=False):
+        # Muove il serpente di una cella; restituisce la cella liberata dalla coda (o -1 se cresce)
+        tail = -1 if grow else self.pop_tail()
+        self.push_head(cell)
+        return tail
+
+    @property
+    def head(self):
+        return self.cells[(self.start + self.length - 1) % self.capacity]
+
+    @property
+    def tail(self):
+        return self.cells[self.start]
+
+    def head_collides(self):
+        # La testa collide con il corpo se la sua cella è occupata da più di un segmento
+        return self.occupied[self.head] > 1
+
+    def __contains__(self, cell):
+        return self.occupied[cell] > 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        # index 0 è la testa, come nel vecchio elenco di posizioni
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.cells[(self.start + self.length - 1 - index) % self.capacity]
+
+    def __iter__(self):
+        # Dalla testa alla coda, senza copie
+        cells, capacity = self.cells, self.capacity
+        position = self.start + self.length - 1
+        for _ in range(self.length):
+            yield cells[position % capacity]
+            position -= 1
+
+
+class Snake:
+    __slots__ = ('body', 'direction', 'growing', 'score', 'alive', 'death_cause', 'death_length', 'remote')
+
+    def __init__(self, head, board_size, direction=UP, remote=False):
+        self.body = SnakeBody(board_size, (head,))  # Celle occupate, dalla testa alla coda
+        self.direction = direction
+        self.growing = False  # Flag per indicare se il serpente deve crescere
+        self.score = 0
+        self.alive = True
+        self.death_cause = None
+        self.death_length = None  # Lunghezza al momento della morte: tutti contro tutti il corpo sparisce dal campo
+        self.remote = remote  # Serpente controllato da un altro peer: non viene mosso da step()
+
+    @property
+    def head(self):
+        return self.body.head
+
+    def __len__(self):
+        return len(self.body)
+
+
+class FreeCells:
+    # Indice delle celle libere: array compatto più mappa cella -> posizione nell'array.
+    # Estrazione casuale uniforme, aggiunta e rimozione costano O(1) (rimozione per scambio
+    # con l'ultimo elemento), anche a campo quasi pieno.
+    __slots__ = ('cells', 'positions')
+
+    EXCLUDED = -2  # Celle che non possono mai essere libere (area del punteggio)
+
+    def __init__(self, board_size, excluded=()):
+        self.positions = array('i', [-1]) * board_size
+        for cell in excluded:
+            self.positions[cell] = self.EXCLUDED
+        self.cells = array('i', (cell for cell in range(board_size) if self.positions[cell] != self.EXCLUDED))
+        for i, cell in enumerate(self.cells):
+            self.positions[cell] = i
+
+    def add(self, cell):
+        if self.positions[cell] == -1:
+            self.positions[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def remove(self, cell):
+        i = self.positions[cell]
+        if i < 0:
+            return
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[i] = last
+            self.positions[last] = i
+        self.positions[cell] = -1
+
+    def sample(self, rng):
+        # Cella libera scelta uniformemente, o None se il campo è pieno
+        if not self.cells:
+            return None
+        return self.cells[rng.randrange(len(self.cells))]
+
+    def __contains__(self, cell):
+        return self.positions[cell] >= 0
+
+    def __len__(self):
+        return len(self.cells)
+
+
+class GameState:
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT, seed=None, num_obstacles=0,
+                 reshuffle_obstacles=False, free_for_all=False):
+        self.width = width
+        self.height = height
+        self.rng = random.Random(seed)
+        self.snakes = []
+        self.food = None
+        self.obstacles = {}  # Usato come insieme ordinato di celle
+        self.num_obstacles = num_obstacles
+        self.reshuffle_obstacles = reshuffle_obstacles  # Single Player: ogni mela aggiunge e rimescola le bombe
+        # Tutti contro tutti: i serpenti morti spariscono dal campo e si gioca finché ne resta uno
+        self.free_for_all = free_for_all
+        self.tick = 0
+
+        # Tabella dei vicini: neighbours[cella * 4 + direzione], con teletrasporto ai bordi
+        neighbours = []
+        for y in range(height):
+            for x in range(width):
+                for dx, dy in DIRECTION_OFFSETS:
+                    neighbours.append(((y + dy) % height) * width + (x + dx) % width)
+        self.neighbours = neighbours
+
+        # Celle coperte dall'area del punteggio, dove non possono comparire cibo e ostacoli
+        self.blocked = set(score_area_cells(width, height))
+        self.free = FreeCells(width * height, self.blocked)
+
+        # Griglia di occupazione unica per tutte le collisioni, più il numero di segmenti di
+        # serpente presenti in ogni cella (per riconoscere le sovrapposizioni)
+        self.grid = bytearray(width * height)
+        self.counts = bytearray(width * height)
+
+    def cell(self, x, y):
+        return y * self.width + x
+
+    def coords(self, cell):
+        y, x = divmod(cell, self.width)
+        return x, y
+
+    @property
+    def over(self):
+        if self.free_for_all:
+            return sum(snake.alive for snake in self.snakes) <= min(1, len(self.snakes) - 1)
+        return any(not snake.alive for snake in self.snakes)
+
+
+def score_area_cells(width=GRID_WIDTH, height=GRID_HEIGHT):
+    # Stesso criterio di pygame.Rect.colliderect: conta solo una sovrapposizione effettiva
+    area_x, area_y, area_width, area_height = SCORE_AREA
+    cells = []
+    for y in range(height):
+        for x in range(width):
+            left, top = x * BLOCK_SIZE, y * BLOCK_SIZE
+            if (left < area_x + area_width and area_x < left + BLOCK_SIZE and
+                    top < area_y + area_height and area_y < top + BLOCK_SIZE):
+                cells.append(y * width + x)
+    return cells
+
+
+def cell_to_pixel(cell, width=GRID_WIDTH):
+    y, x = divmod(cell, width)
+    return x * BLOCK_SIZE, y * BLOCK_SIZE
+
+
+def pixel_to_cell(position, width=GRID_WIDTH):
+    return (position[1] // BLOCK_SIZE) * width + position[0] // BLOCK_SIZE
+
+
+def direction_to(state, cell, target):
+    # Direzione per andare da cell alla cella adiacente target (None se non sono adiacenti)
+    neighbours = state.neighbours
+    for direction in range(4):
+        if neighbours[cell * 4 + direction] == target:
+            return direction
+    return None
+
+
+def spread_starts(players, width=GRID_WIDTH, height=GRID_HEIGHT):
+    # Posizioni iniziali distribuite su una griglia regolare che copre tutto il campo
+    columns = math.ceil(math.sqrt(players * width / height))
+    rows = math.ceil(players / columns)
+    return [(int((i % columns + 0.5) * width / columns), int((i // columns + 0.5) * height / rows))
+            for i in range(players)]
+
+
+def new_game(players=1, seed=None, width=GRID_WIDTH, height=GRID_HEIGHT, num_obstacles=0,
+             reshuffle_obstacles=False, spawn=True, starts=None, free_for_all=False):
+    if players > MAX_SNAKES:
+        raise ValueError(f'too many snakes: {players} (max {MAX_SNAKES})')
+
+    state = GameState(width, height, seed, num_obstacles, reshuffle_obstacles, free_for_all)
+    if starts is None:
+        starts = START_POSITIONS if players <= len(START_POSITIONS) else spread_starts(players, width, height)
+    for i in range(players):
+        x, y = starts[i % len(starts)]
+        state.snakes.append(Snake(state.cell(x, y), width * height))
+        enter_cell(state, i, state.cell(x, y))
+
+    if spawn:
+        generate_food(state)
+        generate_obstacles(state, num_obstacles)
+    return state
+
+
+def is_free(state, cell):
+    return state.grid[cell] == EMPTY and cell not in state.blocked
+
+
+def retag(state, cell):
+    # Ricalcola il tag di una cella da zero; serve solo quando un'entità lascia una cella condivisa
+    if cell in state.obstacles:
+        tag = BOMB
+    elif state.counts[cell]:
+        tag = SNAKE + next(i for i, snake in enumerate(state.snakes) if cell in snake.body)
+    elif cell == state.food:
+        tag = FOOD
+    else:
+        tag = EMPTY
+
+    state.grid[cell] = tag
+    if tag == EMPTY:
+        state.free.add(cell)
+    else:
+        state.free.remove(cell)
+
+
+def enter_cell(state, owner, cell):
+    # Un segmento del serpente owner entra nella cella
+    state.counts[cell] += 1
+    if state.grid[cell] != BOMB:
+        state.grid[cell] = SNAKE + owner
+    state.free.remove(cell)
+
+
+def leave_cell(state, cell):
+    # Un segmento di serpente lascia la cella
+    state.counts[cell] -= 1
+    if state.grid[cell] >= SNAKE:
+        if state.counts[cell] or cell == state.food:
+            retag(state, cell)
+        else:
+            state.grid[cell] = EMPTY
+            state.free.add(cell)
+
+
+def set_food(state, cell):
+    old, state.food = state.food, cell
+    if old is not None:
+        retag(state, old)
+    if cell is not None:
+        retag(state, cell)
+
+
+def generate_food(state):
+    set_food(state, None)
+    set_food(state, state.free.sample(state.rng))
+    return state.food
+
+
+def add_obstacle(state, cell=None):
+    # Aggiunge una bomba nella cella indicata o in una cella libera a caso
+    if cell is None:
+        cell = state.free.sample(state.rng)
+        if cell is None:
+            return None
+    state.obstacles[cell] = None
+    retag(state, cell)
+    return cell
+
+
+def remove_obstacle(state, cell):
+    if cell in state.obstacles:
+        del state.obstacles[cell]
+        retag(state, cell)
+
+
+def set_obstacles(state, cells):
+    for cell in list(state.obstacles):
+        remove_obstacle(state, cell)
+    for cell in cells:
+        add_obstacle(state, cell)
+
+
+def generate_obstacles(state, num_obstacles):
+    # Rimescola le bombe: O(num_obstacles) grazie all'indice delle celle libere
+    set_obstacles(state, ())
+    for _ in range(num_obstacles):
+        if add_obstacle(state) is None:
+            break
+    return state.obstacles
+
+
+def place_snake(state, index, body, direction=None):
+    # Sostituisce il corpo di un serpente (es. con la posizione ricevuta dall'altro peer)
+    snake = state.snakes[index]
+    clear_snake(state, index)
+    for cell in reversed(list(body)):
+        snake.body.push_head(cell)
+        enter_cell(state, index, cell)
+    if direction is not None:
+        snake.direction = direction
+
+
+def clear_snake(state, index):
+    # Toglie dal campo tutte le celle di un serpente (es. morto in una partita tutti contro tutti)
+    body = state.snakes[index].body
+    while len(body):
+        leave_cell(state, body.pop_tail())
+
+
+def advance_snake(state, index, head, grow=False):
+    # Muove un serpente remoto di una cella, come farebbe step() (es. con un delta ricevuto dalla rete)
+    snake = state.snakes[index]
+    if not grow:
+        leave_cell(state, snake.body.pop_tail())
+    snake.body.push_head(head)
+    enter_cell(state, index, head)
+
+
+def save_state(state):
+    # Copia di tutto ciò che step() può cambiare, generatore casuale compreso (rollback, replay)
+    snakes = [(snake.body.cells[:], snake.body.occupied[:], snake.body.start, snake.body.length, snake.direction,
+               snake.growing, snake.score, snake.alive, snake.death_cause, snake.death_length)
+              for snake in state.snakes]
+    return (state.tick, state.rng.getstate(), state.food, dict(state.obstacles), state.num_obstacles,
+            state.free.cells[:], state.free.positions[:], state.grid[:], state.counts[:], snakes)
+
+
+def load_state(state, saved):
+    # Ripristina una copia di save_state() sullo stesso stato: gli oggetti Snake restano gli stessi
+    (state.tick, rng, state.food, obstacles, state.num_obstacles, free_cells, free_positions, grid, counts,
+     snakes) = saved
+    state.rng.setstate(rng)
+    state.obstacles = dict(obstacles)
+    state.free.cells = free_cells[:]
+    state.free.positions = free_positions[:]
+    state.grid = grid[:]
+    state.counts = counts[:]
+    for snake, saved_snake in zip(state.snakes, snakes):
+        cells, occupied, start, length, direction, growing, score, alive, death_cause, death_length = saved_snake
+        body = snake.body
+        body.cells = cells[:]
+        body.occupied = occupied[:]
+        body.start = start
+        body.length = length
+        snake.direction = direction
+        snake.growing = growing
+        snake.score = score
+        snake.alive = alive
+        snake.death_cause = death_cause
+        snake.death_length = death_length
+
+
+def step(state, inputs=()):
+    # Avanza la partita di un tick. inputs[i] è la nuova direzione del serpente i (o None)
+    events = []
+    neighbours = state.neighbours
+    grid = state.grid
+    counts = state.counts
+    snakes = state.snakes
+    moved = []
+
+    for i, snake in enumerate(snakes):
+        if not snake.alive or snake.remote:
+            continue
+
+        direction = inputs[i] if i < len(inputs) else None
+        # Gli input possono arrivare dalla rete: una direzione che non esiste vale come nessun input
+        if direction in DIRECTIONS and direction != OPPOSITE[snake.direction]:
+            snake.direction = direction
+        moved.append(i)
+
+    # I serpenti si muovono insieme: prima si liberano tutte le code, poi avanzano le teste
+    for i in moved:
+        snake = snakes[i]
+        if snake.growing:
+            snake.growing = False
+        else:
+            leave_cell(state, snake.body.pop_tail())
+
+    for i in moved:
+        snake = snakes[i]
+        # Teletrasporto del serpente quando esce dai bordi (già incluso nella tabella dei vicini)
+        head = neighbours[snake.body.head * 4 + snake.direction]
+        snake.body.push_head(head)
+        enter_cell(state, i, head)
+
+    # Controlla collisioni con ostacoli, con se stesso e con gli altri serpenti: una lettura per cella
+    for i in moved:
+        snake = snakes[i]
+        head = snake.body.head
+        own = snake.body.occupied[head]
+        if grid[head] == BOMB:
+            cause = EVENT_BOMB
+        elif own > 1:
+            cause = EVENT_SELF
+        elif counts[head] > own:
+            cause = EVENT_SNAKE
+        else:
+            continue
+
+        snake.alive = False
+        snake.death_cause = cause
+        snake.death_length = len(snake.body)
+        events.append((cause, i, head))
+
+    if state.free_for_all:
+        # Dopo aver controllato tutte le collisioni, così due serpenti che si scontrano muoiono entrambi
+        for _, i, _ in events:
+            clear_snake(state, i)
+
+    # Controlla collisioni con il cibo
+    for i in moved:
+        snake = snakes[i]
+        head = snake.body.head
+        if snake.alive and head == state.food:
+            snake.growing = True  # Il serpente crescerà al prossimo movimento
+            snake.score += 1
+            generate_food(state)
+            if state.reshuffle_obstacles:
+                state.num_obstacles += 1
+                generate_obstacles(state, state.num_obstacles)
+            events.append((EVENT_FOOD, i, head))
+
+    state.tick += 1
+    return events
@@ -0,0 +1,232 @@
+import random
+import struct
+
+# Livello di framing sotto protocol.py. Ogni datagramma porta l'ID della connessione e un numero
+# di sequenza crescente, e contiene più messaggi (ciascuno preceduto dalla sua lunghezza) fino a
+# MAX_DATAGRAM_SIZE byte: tutto ciò che si invia in un tick parte in un solo pacchetto. Un messaggio
+# che da solo non ci sta viene spezzato in frammenti numerati e riassemblato da chi lo riceve.
+#
+# In ricezione i pacchetti duplicati o arrivati dopo uno più recente vengono scartati: ai
+# messaggi non affidabili serve solo lo stato più recente, e uno vecchio lo sovrascriverebbe.
+# I messaggi affidabili (con un ID, vedi reliable.py) vengono consegnati anche dai pacchetti in
+# ritardo. Ogni pacchetto conferma inoltre gli ultimi pacchetti ricevuti (ack + bitmask).
+#
+# L'ID di connessione è a 64 bit, estratto a caso dal generatore del sistema operativo: due
+# connessioni con lo stesso ID non capitano nemmeno con milioni di client, e chi non vede il
+# traffico non può indovinarlo (il server dedicato assegna il suo, vedi match_server.py).
+
+MAX_DATAGRAM_SIZE = 1200  # Sta in un pacchetto IP anche su Wi-Fi e tunnel, senza frammentazione IP
+MAX_RECEIVE_SIZE = 65535
+
+PACKET_HEADER = struct.Struct('!QIBII')  # Connessione, sequenza, flag, ack, bitmask degli ack
+MESSAGE_LENGTH = struct.Struct('!H')  # Bit alto: messaggio affidabile, seguito dal suo ID
+MESSAGE_ID = struct.Struct('!H')
+FRAGMENT_HEADER = struct.Struct('!HBBH')  # Messaggio, indice del frammento, numero di frammenti, ID affidabile
+
+FLAG_FRAGMENT = 1
+FLAG_RELIABLE = 2  # Solo per i frammenti
+RELIABLE_LENGTH = 0x8000
+
+UNRELIABLE = None  # ID dei messaggi non affidabili
+CONNECTION_IDS = 1 << 64  # ID di connessione possibili (0 escluso)
+
+SEQUENCE_WINDOW = 32  # Pacchetti recenti ricordati per riconoscere i duplicati
+MAX_PENDING_MESSAGES = 16  # Messaggi frammentati in attesa di riassemblaggio
+
+
+_system_random = random.SystemRandom()
+
+
+def new_connection(rng=_system_random):
+    return rng.randrange(1, CONNECTION_IDS)
+
+
+class PacketWriter:
+    def __init__(self, connection, max_size=MAX_DATAGRAM_SIZE):
+        self.connection = connection
+        self.max_size = max_size
+        self.sequence = 0
+        self.fragmented = 0  # ID dell'ultimo messaggio frammentato
+
+        self.packets = 0
+        self.messages = 0
+        self.fragments = 0
+
+    def header(self, flags, ack):
+        self.sequence += 1
+        self.packets += 1
+        return PACKET_HEADER.pack(self.connection, self.sequence, flags, *ack)
+
+    def pack(self, messages, ack=(0, 0)):
+        # Raggruppa i messaggi già codificati, coppie (ID affidabile o UNRELIABLE, dati), nel minor
+        # numero di datagrammi. Restituisce terne (sequenza, ID affidabili contenuti, datagramma).
+        packets = []
+        bundle = []
+        ids = []
+        size = PACKET_HEADER.size
+        for reliable_id, payload in messages:
+            self.messages += 1
+            length = MESSAGE_LENGTH.size + len(payload) + (MESSAGE_ID.size if reliable_id is not None else 0)
+            fragment = PACKET_HEADER.size + length > self.max_size
+            if bundle and (fragment or size + length > self.max_size):
+                packets.append((self.sequence + 1, ids, self.header(0, ack) + b''.join(bundle)))
+                bundle = []
+                ids = []
+                size = PACKET_HEADER.size
+
+            if fragment:
+                packets.extend(self.fragment(reliable_id, payload, ack))
+                continue
+
+            if reliable_id is None:
+                bundle.append(MESSAGE_LENGTH.pack(len(payload)))
+            else:
+                bundle.append(MESSAGE_LENGTH.pack(len(payload) | RELIABLE_LENGTH))
+                bundle.append(MESSAGE_ID.pack(reliable_id))
+                ids.append(reliable_id)
+            bundle.append(payload)
+            size += length
+
+        if bundle:
+            packets.append((self.sequence + 1, ids, self.header(0, ack) + b''.join(bundle)))
+        return packets
+
+    def empty(self, ack):
+        # Pacchetto senza messaggi, solo per confermare quelli ricevuti
+        return self.sequence + 1, [], self.header(0, ack)
+
+    def fragment(self, reliable_id, payload, ack):
+        chunk = self.max_size - PACKET_HEADER.size - FRAGMENT_HEADER.size
+        count = -(-len(payload) // chunk)
+        if count > 255:
+            raise ValueError(f'message too large: {len(payload)} bytes')
+
+        flags = FLAG_FRAGMENT
+        ids = []
+        if reliable_id is not None:
+            flags |= FLAG_RELIABLE
+            ids.append(reliable_id)
+
+        self.fragmented = (self.fragmented + 1) & 0xFFFF
+        self.fragments += count
+        return [
+            (self.sequence + 1, ids, self.header(flags, ack)
+             + FRAGMENT_HEADER.pack(self.fragmented, i, count, reliable_id or 0)
+             + payload[i * chunk:(i + 1) * chunk])
+            for i in range(count)
+        ]
+
+
+class PacketReader:
+    def __init__(self):
+        self.retired = set()  # Connessioni precedenti: i loro pacchetti in ritardo si scartano
+        self.connection = None
+        self.reset(None)
+
+    def reset(self, connection):
+        # Una nuova connessione (es. l'avversario ha riavviato la partita) riparte da zero
+        if self.connection is not None:
+            self.retired.add(self.connection)
+        self.connection = connection
+        self.latest = None  # Sequenza più alta ricevuta
+        self.window = 0  # Bit i: ricevuto il pacchetto latest - i
+        self.pending = {}  # ID messaggio -> frammenti ricevuti
+
+        self.received = 0
+        self.duplicates = 0
+        self.late = 0
+        self.lost = 0
+
+    @property
+    def ack(self):
+        # Da inviare all'altro peer: ultima sequenza ricevuta e bitmask delle precedenti
+        return (0, 0) if self.latest is None else (self.latest, self.window)
+
+    def accept(self, sequence):
+        # True se il pacchetto è il più recente, False se è in ritardo, None se è un duplicato
+        if self.latest is None:
+            self.latest = sequence
+            self.window = 1
+            return True
+
+        if sequence > self.latest:
+            gap = sequence - self.latest
+            self.lost += gap - 1
+            self.window = (self.window << gap | 1) & ((1 << SEQUENCE_WINDOW) - 1)
+            self.latest = sequence
+            return True
+
+        offset = self.latest - sequence
+        if offset < SEQUENCE_WINDOW:
+            if self.window >> offset & 1:
+                self.duplicates += 1
+                return None
+            self.window |= 1 << offset  # Confermato: i suoi messaggi affidabili non vanno ritrasmessi
+        self.late += 1  # Già contato come perso quando è arrivato il successivo
+        return False
+
+    def unpack(self, data):
+        # Restituisce (ack, bitmask degli ack, messaggi) con i messaggi come coppie (ID affidabile o
+        # UNRELIABLE, dati); dei pacchetti in ritardo restano solo i messaggi affidabili.
+        # ValueError se il datagramma non è valido.
+        view = memoryview(data)
+        try:
+            connection, sequence, flags, ack, ack_bits = PACKET_HEADER.unpack_from(view)
+        except struct.error as error:
+            raise ValueError(f'malformed packet: {error}') from error
+
+        if connection != self.connection:
+            if connection in self.retired:
+                raise ValueError(f'packet from a previous connection: {connection}')
+            self.reset(connection)
+        latest = self.accept(sequence)
+        if latest is None:
+            return ack, ack_bits, []
+        self.received += 1
+
+        offset = PACKET_HEADER.size
+        if flags & FLAG_FRAGMENT:
+            return ack, ack_bits, self.reassemble(view, offset, flags, latest)
+
+        messages = []
+        try:
+            while offset < len(view):
+                length, = MESSAGE_LENGTH.unpack_from(view, offset)
+                offset += MESSAGE_LENGTH.size
+                reliable_id = UNRELIABLE
+                if length & RELIABLE_LENGTH:
+                    length &= ~RELIABLE_LENGTH
+                    reliable_id, = MESSAGE_ID.unpack_from(view, offset)
+                    offset += MESSAGE_ID.size
+                if offset + length > len(view):
+                    raise ValueError('truncated message')
+                if latest or reliable_id is not None:
+                    messages.append((reliable_id, bytes(view[offset:offset + length])))
+                offset += length
+        except struct.error as error:
+            raise ValueError(f'malformed packet: {error}') from error
+        return ack, ack_bits, messages
+
+    def reassemble(self, view, offset, flags, latest):
+        try:
+            message, index, count, reliable_id = FRAGMENT_HEADER.unpack_from(view, offset)
+        except struct.error as error:
+            raise ValueError(f'malformed fragment: {error}') from error
+        if index >= count:
+            raise ValueError(f'bad fragment index: {index}/{count}')
+        if not flags & FLAG_RELIABLE:
+            if not latest:
+                return []
+            reliable_id = UNRELIABLE
+
+        parts = self.pending.get(message)
+        if parts is None or len(parts) != count:
+            if len(self.pending) >= MAX_PENDING_MESSAGES:
+                del self.pending[next(iter(self.pending))]  # Il messaggio più vecchio non arriverà più
+            parts = self.pending[message] = [None] * count
+        parts[index] = bytes(view[offset + FRAGMENT_HEADER.size:])
+
+        if None in parts:
+            return []
+        del self.pending[message]
+        return [(reliable_id, b''.join(parts))]
@@ -0,0 +1,80 @@
+import math
+from array import array
+
+# Gestione dell'interesse per le partite con molti serpenti: ogni giocatore riceve solo i
+# serpenti vicini alla sua testa. Il campo è diviso in settori quadrati e per ogni settore si
+# tiene quanti segmenti vi ha ciascun serpente; l'indice si aggiorna solo con le teste entrate e
+# le code uscite a ogni tick, quindi costa quanto i serpenti che si muovono, non quanto sono lunghi.
+# Un serpente è "vicino" se almeno un suo segmento è in un settore entro il raggio, così anche il
+# corpo di un serpente con la testa lontana resta visibile a chi ci sta per sbattere contro.
+
+INTEREST_RADIUS = 12  # Celle attorno alla testa del giocatore
+SECTOR_SIZE = 8  # Lato di un settore in celle
+
+
+class SectorIndex:
+    def __init__(self, width, height, size=SECTOR_SIZE):
+        self.size = size
+        self.columns = math.ceil(width / size)
+        self.rows = math.ceil(height / size)
+        self.width = width
+        # Settore di ogni cella, calcolato una volta sola
+        self.sector_of = array('H', ((cell // width) // size * self.columns + (cell % width) // size
+                                     for cell in range(width * height)))
+        self.sectors = [{} for _ in range(self.columns * self.rows)]  # Settore -> {serpente: segmenti}
+        self.snakes = {}  # Serpente -> {settore: segmenti}
+
+    def add(self, snake, cell):
+        sector = self.sector_of[cell]
+        counts = self.sectors[sector]
+        counts[snake] = counts.get(snake, 0) + 1
+        sectors = self.snakes.setdefault(snake, {})
+        sectors[sector] = sectors.get(sector, 0) + 1
+
+    def remove(self, snake, cell):
+        sector = self.sector_of[cell]
+        counts = self.sectors[sector]
+        if counts[snake] == 1:
+            del counts[snake]
+        else:
+            counts[snake] -= 1
+        sectors = self.snakes[snake]
+        if sectors[sector] == 1:
+            del sectors[sector]
+        else:
+            sectors[sector] -= 1
+
+    def add_snake(self, snake, cells):
+        for cell in cells:
+            self.add(snake, cell)
+
+    def remove_snake(self, snake):
+        for sector in self.snakes.pop(snake, {}):
+            del self.sectors[sector][snake]
+
+    def update(self, state, moved, tails, lengths):
+        # Dopo step(): moved, tails e lengths sono stato, coda e lunghezza di ogni serpente prima del tick
+        for i, snake in enumerate(state.snakes):
+            if not moved[i]:
+                continue
+            body = snake.body
+            if not len(body):
+                self.remove_snake(i)  # Morto e tolto dal campo
+                continue
+            if len(body) == lengths[i]:
+                self.remove(i, tails[i])
+            self.add(i, body.head)
+
+    def nearby(self, cell, radius=INTEREST_RADIUS):
+        # Serpenti con almeno un segmento nei settori entro radius celle (sul campo toroidale)
+        reach = math.ceil(radius / self.size)
+        x = cell % self.width // self.size
+        y = cell // self.width // self.size
+        columns = {(x + dx) % self.columns for dx in range(-reach, reach + 1)}
+        rows = {(y + dy) % self.rows for dy in range(-reach, reach + 1)}
+        found = set()
+        sectors = self.sectors
+        for row in rows:
+            for column in columns:
+                found.update(sectors[row * self.columns + column])
+        return found
@@ -0,0 +1,142 @@
+from engine import load_state, save_state, step
+
+# Multiplayer deterministico: entrambi i peer creano la stessa partita dallo stesso seed e
+# simulano tutti e due i serpenti con step(); in rete viaggiano solo le direzioni scelte a ogni
+# tick, qualche byte per tick invece del corpo intero. Per non aspettare l'avversario a ogni tick
+# si prevede il suo input (nessuna svolta) e si va avanti; quando arriva l'input vero e la
+# previsione era sbagliata si torna allo stato salvato di quel tick e si risimula fino al tick
+# corrente (rollback). Oltre MAX_ROLLBACK tick senza input dell'avversario la partita si ferma
+# ad aspettarlo.
+#
+# Ogni messaggio ripete tutti gli input che l'altro peer non ha ancora confermato, quindi un
+# pacchetto perso non va ritrasmesso: basta il successivo.
+
+MAX_ROLLBACK = 20  # Tick massimi di vantaggio sull'ultimo input confermato dell'avversario
+MAX_INPUTS = 64  # Input ripetuti al massimo in un messaggio
+PREDICTED = None  # Input previsto per l'avversario: continua dritto
+
+
+class LockstepSession:
+    def __init__(self, state, local, max_rollback=MAX_ROLLBACK):
+        self.state = state
+        self.local = local  # Indice del serpente di questo peer
+        self.remote = 1 - local
+        self.max_rollback = max_rollback
+
+        self.local_inputs = {}  # Tick -> direzione locale
+        self.remote_inputs = {}  # Tick -> direzione ricevuta dall'avversario
+        self.predicted = {}  # Tick già simulati con un input previsto -> input usato
+        self.snapshots = {}  # Tick -> stato salvato prima di simularlo
+        self.confirmed = state.tick  # Fino a questo tick gli input dell'avversario sono tutti noti
+        self.peer_confirmed = state.tick  # Fino a questo tick l'avversario ha tutti i nostri input
+        self.peer_running = True
+
+        self.rollbacks = 0
+        self.resimulated = 0
+
+        # Se è una lista, vi si aggiungono gli input definitivi di ogni tick confermato e già simulato (replay)
+        self.history = None
+        self.recorded = state.tick
+
+    @property
+    def settled(self):
+        # Lo stato corrente non può più cambiare per un rollback
+        return self.confirmed >= self.state.tick
+
+    @property
+    def peer_settled(self):
+        return self.peer_confirmed >= self.state.tick
+
+    def can_advance(self):
+        return self.state.tick - self.confirmed < self.max_rollback
+
+    def advance(self, direction):
+        # Simula il prossimo tick con la direzione locale; restituisce gli eventi di step().
+        # Un input già inviato per quel tick (prima di un rollback) non può più cambiare.
+        tick = self.state.tick + 1
+        self.local_inputs.setdefault(tick, direction)
+        self.snapshots[tick] = save_state(self.state)
+        events = self.simulate(tick)
+        self.record()
+        return events
+
+    def simulate(self, tick):
+        inputs = [None] * len(self.state.snakes)
+        inputs[self.local] = self.local_inputs[tick]
+        if tick in self.remote_inputs:
+            inputs[self.remote] = self.remote_inputs[tick]
+        else:
+            inputs[self.remote] = self.predicted[tick] = PREDICTED
+        return step(self.state, inputs)
+
+    def rollback(self, tick):
+        # Torna a prima del tick e risimula, con gli input ora noti, fino all'ultimo tick per cui
+        # c'è un input locale o finché la partita non finisce
+        last = max(self.local_inputs)
+        load_state(self.state, self.snapshots[tick])
+        for resimulated in range(tick, last + 1):
+            if self.state.over:
+                break
+            self.snapshots[resimulated] = save_state(self.state)
+            self.simulate(resimulated)
+            self.resimulated += 1
+
+        # Tick simulati solo con la previsione sbagliata, oltre la nuova fine della partita
+        for stale in range(self.state.tick + 1, last + 1):
+            self.snapshots.pop(stale, None)
+            self.predicted.pop(stale, None)
+        self.rollbacks += 1
+
+    def message(self, running):
+        # Input locali non ancora confermati dall'avversario
+        first = max(self.peer_confirmed + 1, self.state.tick - MAX_INPUTS + 1)
+        return {
+            'type': 'inputs',
+            'tick': self.state.tick,
+            'confirmed': self.confirmed,
+            'directions': [self.local_inputs[tick] for tick in range(first, self.state.tick + 1)],
+            'running': running
+        }
+
+    def receive(self, message):
+        self.peer_running = message['running']
+        self.peer_confirmed = max(self.peer_confirmed, min(message['confirmed'], self.state.tick))
+
+        first = message['tick'] - len(message['directions']) + 1
+        mispredicted = None
+        for tick, direction in enumerate(message['directions'], first):
+            if tick <= self.confirmed or tick in self.remote_inputs:
+                continue
+            self.remote_inputs[tick] = direction
+            if tick in self.predicted and self.predicted.pop(tick) != direction:
+                if mispredicted is None or tick < mispredicted:
+                    mispredicted = tick
+
+        while self.confirmed + 1 in self.remote_inputs:
+            self.confirmed += 1
+
+        if mispredicted is not None:
+            self.rollback(mispredicted)
+
+        # I tick confermati e già simulati non verranno più risimulati
+        self.record()
+        simulated = min(self.confirmed, self.state.tick)
+        prune(self.remote_inputs, simulated)
+        prune(self.snapshots, simulated)
+        prune(self.predicted, simulated)
+        prune(self.local_inputs, min(simulated, self.peer_confirmed))
+
+    def record(self):
+        if self.history is None:
+            return
+        while self.recorded < min(self.confirmed, self.state.tick):
+            self.recorded += 1
+            inputs = [None] * len(self.state.snakes)
+            inputs[self.local] = self.local_inputs[self.recorded]
+            inputs[self.remote] = self.remote_inputs[self.recorded]
+            self.history.append(inputs)
+
+
+def prune(inputs, last):
+    for tick in [tick for tick in inputs if tick <= last]:
+        del inputs[tick]
@@ -1,121 +1,60 @@
 from array import array
 
 import pygame
-import random
+import glob
+import logging
 import os
-
-import socket as net
-import json
-
-from threading import Thread
-from queue import Queue, Empty
+import random
+import time
+
+from engine import (
+    SCREEN_WIDTH, SCREEN_HEIGHT, BLOCK_SIZE, DIFFICULTY_LEVELS, SINGLE_PLAYER_OBSTACLES, START_POSITIONS,
+    UP, DOWN, LEFT, RIGHT, EVENT_FOOD, EVENT_BOMB, new_game, step, set_food, set_obstacles, cell_to_pixel
+)
+from render import DirtyRenderer, SnakeSprites
+from controls import InputQueue
+from animation import FrameAnimation, Scheduler, Timeline, Tween, ease_out
+from bots import make_bot
+from profiler import FrameProfiler
+from menu import Menu, MessageScreen, TextInputScreen, NO_RESULT
+from lockstep import LockstepSession
+from replay import REPLAY_DIR, REPLAY_SUFFIX, ReplayPlayer, ReplayRecorder, replay_path
+from network import ServerTask
+from protocol import CHECKSUM_INTERVAL, SnakeSender, SnakeReceiver, extra_checksum, extra_message, valid_extra
+
+# Log su stderr; PYSNAKE_LOG_LEVEL=DEBUG mostra anche i messaggi inviati e ricevuti (a campione)
+logging.basicConfig(level=os.environ.get('PYSNAKE_LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('pysnake')
 
 # Inizializzazione di Pygame
 pygame.init()
 pygame.mixer.init()
 
 
-class ServerTask:
-    GAME_PORT = 7777
-
-    def __init__(self):
-        self.address = net.gethostbyname(net.gethostname())
-        self.client_address = None
-        self.thread = Thread(target=self.run)
-
-        socket = net.socket(net.AF_INET, net.SOCK_DGRAM)
-        socket.bind((self.address, self.GAME_PORT))
-        socket.setblocking(False)
-        self.socket = socket
-
-        self.is_running = False
-        self.is_connected = False
-
-        self.client_queue = Queue()
-        self.server_queue = Queue()
-
-    def start(self):
-        self.is_running = True
-
-        self.thread = Thread(target=self.run)
-        self.thread.start()
-
-    def stop(self):
-        if self.is_running:
-            self.is_running = False
-            self.is_connected = False
-            self.thread.join()
-
-    def connect(self, address):
-        if self.is_connected:
-            return
-
-        self.client_address = address
-        self.send({
-            'type': 'identify',
-            'address': address
-        })
-
-    def run(self):
-        while self.is_running:
-            data, address = self.receive()
-            if data is not None:
-                message = json.loads(data.decode())
-                print(f'Received: {message}')
-                match message['type']:
-                    case 'identify':
-                        self.client_address = address[0]
-                        self.is_connected = True
-
-                    case _:
-                        self.client_queue.put(message)
-
-            try:
-                message = self.server_queue.get(False)
-                self.send(message)
-            except Empty:
-                pass
-
-    def receive(self):
-        try:
-            data, address = self.socket.recvfrom(4096)
-            if not data:
-                return None, None
-
-            if len(data) == 0:
-                return bytes(), None
-
-            while len(data) == 4096:
-                (next_data, next_address) = self.socket.recvfrom(4096)
-                assert address == next_address
-
-                data += next_data
-
-            return data, address
-        except BlockingIOError:
-            return None, None
-
-    def send(self, message):
-        if not self.is_running:
-            return
-
-        print(f'Sent: {message}')
-        data = json.dumps(message).encode()
-        self.socket.sendto(data, (self.client_address, self.GAME_PORT))
-
-
 # Impostazioni di base del gioco
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 explosion_sound = pygame.mixer.Sound("explosion-91872.mp3")
 game_over_sound = pygame.mixer.Sound("videogame-death-sound-43894.mp3")
 
-BLOCK_SIZE = 50
 SNAKE_SIZE = BLOCK_SIZE
-SCORE_AREA = pygame.Rect(10, 10, 200, 140)  # Modifica questo rettangolo in base all'area effettiva
 FPS = 5  # FPS iniziale per la difficoltà media
-DIFFICULTY_LEVELS = {"Facile": 3, "Media": 5, "Difficile": 10}
+
+# Netcode del Multiplayer, scelto dall'host: "state" invia i serpenti, "lockstep" solo gli input (vedi lockstep.py)
+NETCODE = os.environ.get('PYSNAKE_NETCODE', 'state')
+
+# Con PYSNAKE_AUTOPLAY il serpente locale è guidato da un bot invece che dalla tastiera (es. "path",
+# vedi bots.BOTS): partite dimostrative e prove di durata, anche in Multiplayer
+AUTOPLAY = os.environ.get('PYSNAKE_AUTOPLAY')
+
+# Frequenze indipendenti: la simulazione avanza a passo fisso alla velocità della difficoltà (tick al
+# secondo), il disegno va a RENDER_FPS con i serpenti interpolati tra due tick, la rete a NET_RATE
+RENDER_FPS = int(os.environ.get('PYSNAKE_RENDER_FPS', 60))
+NET_RATE = int(os.environ.get('PYSNAKE_NET_RATE', 30))
+MAX_FRAME_TIME = 0.25  # Secondi massimi recuperati dopo un blocco, per non accumulare troppi tick
+
+KEY_DIRECTIONS = {pygame.K_UP: UP, pygame.K_DOWN: DOWN, pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT}
+
 music_files = {
     "Facile": 'easy.mp3',
     "Media": 'medium.mp3',
@@ -138,34 +77,47 @@ font = pygame.font.Font('PixelOperatorMono.ttf', 24)  # Font più piccolo per i
 big_font = pygame.font.Font('PixelOperatorMono.ttf', 48)  # Font grande per la schermata di fine gioco
 menu_font = pygame.font.Font('PixelOperatorMono.ttf', 36)  # Font grande per il menu
 selected_menu_font = pygame.font.Font('PixelOperatorMono.ttf', 48)  # Font più grande per l'opzione selezionata
+profiler_font = pygame.font.Font('PixelOperatorMono.ttf', 16)  # Font piccolo per i tempi del profiler
+title_font = pygame.font.Font('PixelOperatorMono.ttf', 100)  # Font di dimensione 100 per il titolo
 
 # Immagini
 red_player_body = pygame.image.load('body_red.png')
-red_player_body = pygame.transform.scale(red_player_body, (SNAKE_SIZE, SNAKE_SIZE))
+red_player_body = pygame.transform.scale(red_player_body, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 red_player_head = pygame.image.load('snake_red1.png')
-red_player_head = pygame.transform.scale(red_player_head, (SNAKE_SIZE, SNAKE_SIZE))
+red_player_head = pygame.transform.scale(red_player_head, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 red_player_tail = pygame.image.load('tale_red.png')
-red_player_tail = pygame.transform.scale(red_player_tail, (SNAKE_SIZE, SNAKE_SIZE))
+red_player_tail = pygame.transform.scale(red_player_tail, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 
 blue_player_body = pygame.image.load('body_blue.png')
-blue_player_body = pygame.transform.scale(blue_player_body, (SNAKE_SIZE, SNAKE_SIZE))
+blue_player_body = pygame.transform.scale(blue_player_body, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 blue_player_head = pygame.image.load('snake_blue1.png')
-blue_player_head = pygame.transform.scale(blue_player_head, (SNAKE_SIZE, SNAKE_SIZE))
+blue_player_head = pygame.transform.scale(blue_player_head, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 blue_player_tail = pygame.image.load('tale_blue.png')
-blue_player_tail = pygame.transform.scale(blue_player_tail, (SNAKE_SIZE, SNAKE_SIZE))
+blue_player_tail = pygame.transform.scale(blue_player_tail, (SNAKE_SIZE, SNAKE_SIZE)).convert_alpha()
 
 apple_icon = pygame.image.load('apple.png')
-apple_icon = pygame.transform.scale(apple_icon, (BLOCK_SIZE, BLOCK_SIZE))
+apple_icon = pygame.transform.scale(apple_icon, (BLOCK_SIZE, BLOCK_SIZE)).convert_alpha()
 bomb_icon = pygame.image.load('bomb.png')
-bomb_icon = pygame.transform.scale(bomb_icon, (BLOCK_SIZE, BLOCK_SIZE))
+bomb_icon = pygame.transform.scale(bomb_icon, (BLOCK_SIZE, BLOCK_SIZE)).convert_alpha()
 
 # Sfondi
 menu_background_image = pygame.image.load('sfondoForesta.jpg')
-menu_background_image = pygame.transform.scale(menu_background_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
+menu_background_image = pygame.transform.scale(menu_background_image, (SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
 field_background_image = pygame.image.load('CampoDaGioco.jpeg')
-field_background_image = pygame.transform.scale(field_background_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
+field_background_image = pygame.transform.scale(field_background_image, (SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+
+# Sprite dei serpenti già orientati, convertiti nel formato del display come tutte le immagini
+red_player_sprites = SnakeSprites(red_player_head, red_player_body, red_player_tail)
+blue_player_sprites = SnakeSprites(blue_player_head, blue_player_body, blue_player_tail)
 
 EXPLOSION_FRAMES_DIR = 'esplosione'
+EXPLOSION_DURATION = 0.5  # Secondi
+EXPLOSION_FRAME_TIME = 0.1
+SCORE_STEP_TIME = 0.05  # Secondi per ogni punto nel conteggio del punteggio a fine partita
+GAME_OVER_DURATION = 3.0
+REPLAY_SPEEDS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)  # Velocità di riproduzione dei replay (SU/GIÙ)
+REPLAY_SEEK_SECONDS = 10  # Secondi di gioco saltati con SINISTRA/DESTRA
+REPLAY_MENU_SIZE = 8  # Replay più recenti elencati nel menu
 explosion_frames = []
 
 # Server
@@ -173,11 +125,23 @@ server = ServerTask()
 is_game_host = False
 
 
+def network_report():
+    # Righe con le metriche principali della rete, per il riquadro del profiler
+    metrics = server.metrics()
+    return [
+        f"rtt {metrics['rtt_ms']:.1f} ms  jitter {metrics['jitter_ms']:.1f} ms",
+        f"loss {metrics.get('loss', 0.0):.1%}  resent {metrics.get('resent', 0)}",
+        f"in  {metrics['packets_in_per_s']:.0f} pkt/s {metrics['bytes_in_per_s']:.0f} B/s",
+        f"out {metrics['packets_out_per_s']:.0f} pkt/s {metrics['bytes_out_per_s']:.0f} B/s",
+        f"queues send {metrics['send_queue']} updates {metrics['update_queue']} events {metrics['event_queue']}",
+    ]
+
+
 def load_explosion_frames(directory):
     global explosion_frames
     for filename in sorted(os.listdir(directory)):
         if filename.endswith('.jpg'):
-            frame = pygame.image.load(os.path.join(directory, filename))
+            frame = pygame.image.load(os.path.join(directory, filename)).convert()
             explosion_frames.append(frame)
 
 
@@ -185,54 +149,13 @@ load_explosion_frames(EXPLOSION_FRAMES_DIR)
 
 
 def animate_explosion(position):
-    frame_index = 0
-    num_frames = len(explosion_frames)
-    animation_duration = 500  # Durata totale dell'animazione in millisecondi
-    start_time = pygame.time.get_ticks()
-
-    # Riproduci il suono dell'esplosione
+    # Esplosione sopra il campo di gioco, mentre la partita continua: va aggiunta a uno Scheduler
     explosion_sound.play()
+    return FrameAnimation(explosion_frames, position, EXPLOSION_DURATION, EXPLOSION_FRAME_TIME)
 
-    while pygame.time.get_ticks() - start_time < animation_duration:
-        screen.fill((0, 0, 0))  # Pulisce lo schermo con il colore nero
-        screen.blit(explosion_frames[frame_index], position)  # Disegna il frame corrente dell'esplosione
-        pygame.display.flip()
-
-        # Avanza al frame successivo
-        frame_index = (frame_index + 1) % num_frames
-        pygame.time.wait(100)  # Pausa per la durata del frame (adatta questo valore se necessario)
-
-
-def generate_food(snake_pos):
-    while True:
-        x = random.randint(0, (SCREEN_WIDTH // BLOCK_SIZE) - 1) * BLOCK_SIZE
-        y = random.randint(0, (SCREEN_HEIGHT // BLOCK_SIZE) - 1) * BLOCK_SIZE
-        food_pos = (x, y)
-        food_rect = pygame.Rect(food_pos[0], food_pos[1], BLOCK_SIZE, BLOCK_SIZE)
-        if food_pos not in snake_pos and not SCORE_AREA.colliderect(food_rect):
-            return food_pos
 
-
-def generate_obstacles(num_obstacles, snake_pos, food_pos):
-    obstacles = []
-    while len(obstacles) < num_obstacles:
-        x = random.randint(0, (SCREEN_WIDTH // BLOCK_SIZE) - 1) * BLOCK_SIZE
-        y = random.randint(0, (SCREEN_HEIGHT // BLOCK_SIZE) - 1) * BLOCK_SIZE
-        obstacle_pos = (x, y)
-        obstacle_rect = pygame.Rect(obstacle_pos[0], obstacle_pos[1], BLOCK_SIZE, BLOCK_SIZE)
-        if (
-                obstacle_pos not in snake_pos and
-                obstacle_pos not in obstacles and
-                obstacle_pos not in food_pos and
-                not SCORE_AREA.colliderect(obstacle_rect)
-        ):
-            obstacles.append(obstacle_pos)
-    return obstacles
-
-
-# Collisione con se stesso
-def check_self_collision(snake_pos):  # Controlla se la testa del serpente collide con una parte del corpo
-    return snake_pos[0] in snake_pos[1:]
+# Area occupata dal pannello dei punteggi (blocchi più ombra)
+SCORE_PANEL = pygame.Rect(10, 10, 206, 130)
 
 
 # Disegna il punteggio
@@ -263,16 +186,11 @@ def draw_score(score1, score2=None):
 
 
 def animate_score_increase(score1, score2=None):
-    for i in range(0, score1 + 1):
-        screen.blit(field_background_image, (0, 0))
-        draw_score(i, score2)
-        pygame.display.flip()
-        pygame.time.delay(50)
-    for i in range(0, score2 + 1):
-        screen.blit(field_background_image, (0, 0))
-        draw_score(score1, i)
-        pygame.display.flip()
-        pygame.time.delay(50)
+    # Conteggio da zero dei punteggi, prima il primo giocatore e poi il secondo (se c'è):
+    # restituisce la timeline e i due tween, il cui valore è il punteggio da mostrare
+    count1 = Tween(0, score1, score1 * SCORE_STEP_TIME)
+    count2 = Tween(0, score2 or 0, (score2 or 0) * SCORE_STEP_TIME)
+    return Timeline((0.0, count1), (count1.duration, count2)), count1, count2
 
 
 def draw_text_with_shadow(text, font, color, shadow_color, position):
@@ -283,26 +201,6 @@ def draw_text_with_shadow(text, font, color, shadow_color, position):
     screen.blit(text_surface, position)
 
 
-def draw_snake(snake_pos, snake_dir, head_icon, body_icon):
-    # Disegna la testa del serpente
-
-    rotated_head: pygame.Surface
-    if snake_dir == (0, -BLOCK_SIZE):
-        rotated_head = pygame.transform.rotate(head_icon, 90)
-    elif snake_dir == (0, BLOCK_SIZE):
-        rotated_head = pygame.transform.rotate(head_icon, -90)
-    elif snake_dir == (-BLOCK_SIZE, 0):
-        rotated_head = pygame.transform.flip(head_icon, True, False)
-    elif snake_dir == (BLOCK_SIZE, 0):
-        rotated_head = head_icon
-
-    screen.blit(rotated_head, (snake_pos[0][0], snake_pos[0][1]), pygame.Rect(0, 0, BLOCK_SIZE, BLOCK_SIZE))
-
-    # Disegna il corpo del serpente
-    for pos in snake_pos[1:]:
-        screen.blit(body_icon, (pos[0], pos[1]), pygame.Rect(0, 0, BLOCK_SIZE, BLOCK_SIZE))
-
-
 # Funzione per il menu principale
 def main_menu():
     pygame.mixer.music.load('menu.mp3')
@@ -310,180 +208,45 @@ def main_menu():
     pygame.mixer.music.play(-1)
     server.stop()
 
-    menu_items = ["Inizia Gioco", "Esci"]
-    selected_item = 0
-
-    title_font = pygame.font.Font('PixelOperatorMono.ttf', 100)  # Font di dimensione 100
-    title_color = (255, 255, 255)  # Colore bianco
-    while True:
-        # Disegna l'immagine di sfondo
-        screen.blit(menu_background_image, (0, 0))
-        # Visualizza il nome del gioco
-        title_text = title_font.render("PYSNAKE", True, title_color)
-        title_rect = title_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4))  # Posiziona il titolo in alto
-        screen.blit(title_text, title_rect)
-
-        # Visualizza le opzioni del menu
-        for i, item in enumerate(menu_items):
-            if i == selected_item:
-                label = selected_menu_font.render(item, True, WHITE)
-            else:
-                label = menu_font.render(item, True, WHITE)
-
-            label_rect = label.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + i * 50))
-            pygame.draw.rect(screen, BLACK, label_rect.inflate(20, 20))  # Disegna un rettangolo nero dietro il testo
-            screen.blit(label, label_rect)
-
-        pygame.display.flip()
-
-        # Gestione degli eventi
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_DOWN:
-                    selected_item = (selected_item + 1) % len(menu_items)
-                if event.key == pygame.K_UP:
-                    selected_item = (selected_item - 1) % len(menu_items)
-
-                if event.key == pygame.K_RETURN:
-                    if selected_item == 0:
-                        return "play"
-                    elif selected_item == 1:
-                        pygame.quit()
-                        exit()
+    # Con PYSNAKE_REPLAY_DIR le partite vengono registrate e si possono rivedere
+    items = ["Inizia Gioco", "Replay", "Esci"] if REPLAY_DIR else ["Inizia Gioco", "Esci"]
+    menu = Menu(items, menu_background_image, menu_font, selected_menu_font, title="PYSNAKE", title_font=title_font)
+    selected = menu.run(screen)
+    if selected == "Inizia Gioco":
+        return "play"
+    if selected == "Replay":
+        return "replay"
 
-
-def check_obstacle_collision(snake_head, obstacles):
-    for obs in obstacles:
-        if snake_head[0] == obs[0] and snake_head[1] == obs[1]:
-            return True, obs
-    return False, None
+    pygame.quit()
+    exit()
 
 
 def pause_game():
-    paused = True
+    # Lo sfondo del menu di pausa è fisso: viene composto una volta sola
+    background = field_background_image.copy()
     alpha_overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
     alpha_overlay.fill((0, 0, 0, 180))  # Imposta il colore con trasparenza
+    background.blit(alpha_overlay, (0, 0))  # Aggiungi l'overlay trasparente
 
-    menu_items = ["Riprendi", "Torna al Menu"]
-    selected_item = 0
-
-    while paused:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:  # Riprendi il gioco quando premi ESC
-                    paused = False
-                if event.key == pygame.K_DOWN:
-                    selected_item = (selected_item + 1) % len(menu_items)
-                if event.key == pygame.K_UP:
-                    selected_item = (selected_item - 1) % len(menu_items)
-                if event.key == pygame.K_RETURN:
-                    if selected_item == 0:  # Riprendi
-                        paused = False
-                    elif selected_item == 1:  # Esci
-                        main_menu()
-                        exit()
-
-        # Disegna lo sfondo e gli elementi del gioco
-        screen.blit(field_background_image, (0, 0))  # Riporta lo sfondo del gioco
-        screen.blit(alpha_overlay, (0, 0))  # Aggiungi l'overlay trasparente
-
-        # Visualizza le opzioni del menu di pausa
-        for i, item in enumerate(menu_items):
-            if i == selected_item:
-                label = selected_menu_font.render(item, True, WHITE)
-            else:
-                label = menu_font.render(item, True, WHITE)
-
-            label_rect = label.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + i * 50))
-            pygame.draw.rect(screen, BLACK, label_rect.inflate(20, 20))  # Disegna un rettangolo nero dietro il testo
-            screen.blit(label, label_rect)
-
-        pygame.display.flip()
-        clock.tick(30)
+    # ESC riprende il gioco come "Riprendi"
+    menu = Menu(["Riprendi", "Torna al Menu"], background, menu_font, selected_menu_font, escape="Riprendi")
+    if menu.run(screen) == "Torna al Menu":
+        main_menu()
+        exit()
 
 
 # Funzione per il menu delle difficoltà
 def difficulty_menu():
-    difficulty_levels = list(DIFFICULTY_LEVELS.keys())
-    selected_difficulty = 0  # Default: "Media"
-    while True:
-        # Disegna l'immagine di sfondo
-        screen.blit(menu_background_image, (0, 0))
-
-        # Visualizza le opzioni di difficoltà
-        for i, difficulty in enumerate(difficulty_levels):
-            if i == selected_difficulty:
-                label = selected_menu_font.render(difficulty, True, WHITE)
-            else:
-                label = menu_font.render(difficulty, True, WHITE)
-
-            label_rect = label.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + i * 50))
-            pygame.draw.rect(screen, BLACK, label_rect.inflate(20, 20))  # Disegna un rettangolo nero dietro il testo
-            screen.blit(label, label_rect)
-
-        pygame.display.flip()
-
-        # Gestione degli eventi
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_DOWN:
-                    selected_difficulty = (selected_difficulty + 1) % len(difficulty_levels)
-                if event.key == pygame.K_UP:
-                    selected_difficulty = (selected_difficulty - 1) % len(difficulty_levels)
-
-                if event.key == pygame.K_RETURN:
-                    return difficulty_levels[selected_difficulty]  # Restituisce la difficoltà selezionata
+    menu = Menu(list(DIFFICULTY_LEVELS.keys()), menu_background_image, menu_font, selected_menu_font)
+    return menu.run(screen)  # Restituisce la difficoltà selezionata
 
 
 # Funzione per il menu delle modalità di gioco
 def mode_menu():
-    mode_items = ["Single Player", "Multiplayer"]
-    selected_mode = 0
-    while True:
-        # Disegna l'immagine di sfondo
-        screen.blit(menu_background_image, (0, 0))
-
-        # Visualizza le opzioni del menu
-        for i, mode in enumerate(mode_items):
-            if i == selected_mode:
-                label = selected_menu_font.render(mode, True, WHITE)
-            else:
-                label = menu_font.render(mode, True, WHITE)
-
-            label_rect = label.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + i * 50))
-            pygame.draw.rect(screen, BLACK, label_rect.inflate(20, 20))  # Disegna un rettangolo nero dietro il testo
-            screen.blit(label, label_rect)
-
-        pygame.display.flip()
-
-        # Gestione degli eventi
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_DOWN:
-                    selected_mode = (selected_mode + 1) % len(mode_items)
-                if event.key == pygame.K_UP:
-                    selected_mode = (selected_mode - 1) % len(mode_items)
-
-                if event.key == pygame.K_RETURN:
-                    if mode_items[selected_mode] == "Single Player":
-                        return "Single Player"
-                    elif mode_items[selected_mode] == "Multiplayer":
-                        return multiplayer_menu()
+    menu = Menu(["Single Player", "Multiplayer"], menu_background_image, menu_font, selected_menu_font)
+    if menu.run(screen) == "Multiplayer":
+        return multiplayer_menu()
+    return "Single Player"
 
 
 def draw_text(text, font, color, surface, x, y):
@@ -495,108 +258,42 @@ def draw_text(text, font, color, surface, x, y):
 
 def multiplayer_menu():
     # Opzioni per il multiplayer
-    multiplayer_items = ["Host", "Client"]
-    selected_item = 0
     server.start()
 
-    while True:
-        # Disegna l'immagine di sfondo
-        screen.blit(menu_background_image, (0, 0))
-
-        # Visualizza le opzioni di multiplayer
-        for i, item in enumerate(multiplayer_items):
-            if i == selected_item:
-                label = selected_menu_font.render(item, True, WHITE)
-            else:
-                label = menu_font.render(item, True, WHITE)
-
-            label_rect = label.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + i * 50))
-            pygame.draw.rect(screen, BLACK, label_rect.inflate(20, 20))  # Rettangolo dietro il testo
-            screen.blit(label, label_rect)
-
-        pygame.display.flip()
+    menu = Menu(["Host", "Client"], menu_background_image, menu_font, selected_menu_font)
+    if menu.run(screen) == "Host":
+        return host_game()
+    return client_game()
 
-        # Gestione degli eventi
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_DOWN:
-                    selected_item = (selected_item + 1) % len(multiplayer_items)
-                if event.key == pygame.K_UP:
-                    selected_item = (selected_item - 1) % len(multiplayer_items)
-
-                if event.key == pygame.K_RETURN:
-                    if selected_item == 0:  # Host
-                        return host_game()
-                    elif selected_item == 1:  # Client
-                        return client_game()
-                    else:
-                        return "Singleplayer"
 
 def host_game():
-    waiting_for_client = True
-
     global is_game_host
     is_game_host = True
 
-    while waiting_for_client:
-        screen.fill((0, 0, 0))  # Pulisce lo schermo
-        draw_text("In attesa della connessione dell'avversario.", font, (255, 255, 255), screen, 100, 250)
-        draw_text("Premi ESC per tornare al menu", font, (255, 255, 255), screen, 100, 300)
-
-        if server.is_connected:
-            waiting_for_client = False
-
-        # Ciclo eventi di Pygame
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    return mode_menu()  # Ritorna al menu principale interrompendo l'attesa
-
-        pygame.display.flip()
+    # La schermata controlla la connessione a ogni risveglio; ESC torna al menu
+    waiting = MessageScreen(
+        ["In attesa della connessione dell'avversario.", "Premi ESC per tornare al menu"], font,
+        escape=None, poll_result=lambda: "Multiplayer" if server.is_connected else NO_RESULT
+    )
+    if waiting.run(screen) is None:
+        return mode_menu()  # Ritorna al menu principale interrompendo l'attesa
 
     return "Multiplayer"
 
 
 def client_game():
-    server_address = ""
-    max_length = 15
-    valid_chars = "0123456789."
-
-    entering_address = True
-
     global is_game_host
     is_game_host = False
 
-    while entering_address:
-        screen.fill((0, 0, 0))  # Pulisce lo schermo
-        draw_text("Inserisci l'indirizzo del server: " + server_address, font, (255, 255, 255), screen, 100, 250)
-        draw_text("Premi ESC per tornare al menu", font, (255, 255, 255), screen, 100, 300)
-
-        # Ciclo eventi di Pygame per inserire l'indirizzo del server
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    server.connect(server_address)
-                    entering_address = False  # Esci dal ciclo dopo aver premuto invio
-                elif event.key == pygame.K_BACKSPACE:
-                    server_address = server_address[:-1]  # Cancella l'ultimo carattere
-                elif event.key == pygame.K_ESCAPE:
-                    return mode_menu()  # Ritorna al menu principale
-                elif len(server_address) < max_length and event.unicode in valid_chars:
-                    server_address += event.unicode  # Aggiungi il carattere digitato
-
-        pygame.display.flip()
+    address_input = TextInputScreen(
+        "Inserisci l'indirizzo del server: ", "Premi ESC per tornare al menu", font,
+        escape=None, valid_chars="0123456789.", max_length=15
+    )
+    server_address = address_input.run(screen)
+    if server_address is None:
+        return mode_menu()  # Ritorna al menu principale
 
+    server.connect(server_address)
     return "Multiplayer"
 
 
@@ -606,7 +303,7 @@ def game(fps, mode):
         # Mostra il menu di difficoltà
         selected_difficulty = difficulty_menu()
         fps = DIFFICULTY_LEVELS[selected_difficulty]  # Imposta il nuovo FPS in base alla difficoltà selezionata
-        num_obstacles = 5  # Numero di ostacoli per la modalità Single Player
+        num_obstacles = SINGLE_PLAYER_OBSTACLES  # Numero di ostacoli per la modalità Single Player
         if selected_difficulty == "Facile":
             pygame.mixer.music.load(music_files["Facile"])
         elif selected_difficulty == "Media":
@@ -621,150 +318,264 @@ def game(fps, mode):
         pygame.mixer.music.load("multiplayer.mp3")
         pygame.mixer.music.play(-1)
 
-    snake1_pos = [(100, 100)] if is_game_host else [(200, 200)]
-    snake1_dir = (0, -BLOCK_SIZE)
-    score1 = 0
-    snake1_growing = False  # Flag per indicare se il serpente deve crescere
+    # Il serpente locale è sempre il numero 0, quello dell'avversario il numero 1
+    starts = START_POSITIONS if is_game_host or mode == "Single Player" else START_POSITIONS[::-1]
+    seed = random.getrandbits(32)  # Salvato nel replay
+    state = new_game(
+        players=2 if mode == "Multiplayer" else 1,
+        seed=seed,
+        num_obstacles=num_obstacles,
+        reshuffle_obstacles=mode == "Single Player",
+        spawn=is_game_host or mode == "Single Player",
+        starts=starts
+    )
+    player = state.snakes[0]
+    opponent = state.snakes[1] if mode == "Multiplayer" else None
+    session = None  # Partita in lockstep: il client la crea quando riceve il seed dall'host
+    if mode == "Multiplayer":
+        if is_game_host and NETCODE == 'lockstep':
+            # Stessa partita su entrambi i peer: il serpente dell'host è il numero 0, quello del client l'1
+            seed = random.getrandbits(32)
+            state = new_game(players=2, seed=seed)
+            session = LockstepSession(state, 0)
+            player, opponent = state.snakes
+            server.send({'type': 'start', 'seed': seed})
+        else:
+            opponent.remote = True
+            if is_game_host:
+                server.send(extra_message(state))  # Cibo e bombe viaggiano sul canale affidabile
 
-    snake2_pos = snake1_pos
-    snake2_dir = snake1_dir
-    score2 = 0
-    is_other_running = True
+    # Il serpente locale viene inviato come delta, quello dell'avversario ricostruito dai delta ricevuti
+    sender = SnakeSender()
+    receiver = SnakeReceiver()
 
-    food_pos = None
-    obstacles = None
+    renderer = DirtyRenderer(screen, field_background_image, SCORE_PANEL)
 
-    if is_game_host or mode == "Single Player":
-        food_pos = generate_food(snake1_pos)
-        obstacles = generate_obstacles(num_obstacles, snake1_pos, food_pos)
+    # Checksum consecutivi diversi da quelli dell'host: uno solo può dipendere da una mela appena
+    # mangiata dal client e non ancora arrivata all'host, due indicano uno stato davvero divergente
+    checksum_mismatches = 0
 
-        if mode == "Multiplayer":
-            server.send({
-                'type': 'extra',
-                'food': food_pos,
-                'obstacles': obstacles
-            })
+    settle_ticks = 0  # Tick passati ad aspettare che l'avversario riceva i nostri ultimi input
 
+    tick_length = 1 / fps
+    accumulator = 0.0  # Tempo reale non ancora simulato
+    last_time = time.perf_counter()
+    next_network = last_time
+    outgoing = []  # Messaggi in attesa del prossimo invio di rete: più tick nello stesso datagramma
+    previous = {}  # Serpente -> celle al tick precedente, per l'interpolazione
+
+    # Svolte del giocatore locale, lette a ogni frame ed eseguite una per tick
+    inputs = InputQueue()
+    autoplay = make_bot(AUTOPLAY, seed) if AUTOPLAY else None
+
+    # Esplosioni in corso: a fine partita il loop continua, senza simulare, finché non sono finite
+    animations = Scheduler()
+
+    recorder = None  # Replay della partita, creato al primo tick (vedi replay.py)
+    record = bool(REPLAY_DIR)  # Diventa False se il replay di questa partita non si può registrare
+
+    is_other_running = True
     running = True
-    while running and is_other_running:
+    while (running and is_other_running) or animations:
+        profiler.begin()
+        playing = running and is_other_running
+        now = time.perf_counter()
+        accumulator += min(now - last_time, MAX_FRAME_TIME)
+        last_time = now
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+                animations.clear()
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE and mode == "Single Player":  # Pausa se si preme ESC
                     pause_game()
-                if event.key == pygame.K_UP and snake1_dir != (0, BLOCK_SIZE):
-                    snake1_dir = (0, -BLOCK_SIZE)
-                if event.key == pygame.K_DOWN and snake1_dir != (0, -BLOCK_SIZE):
-                    snake1_dir = (0, BLOCK_SIZE)
-                if event.key == pygame.K_LEFT and snake1_dir != (BLOCK_SIZE, 0):
-                    snake1_dir = (-BLOCK_SIZE, 0)
-                if event.key == pygame.K_RIGHT and snake1_dir != (-BLOCK_SIZE, 0):
-                    snake1_dir = (BLOCK_SIZE, 0)
-
-        # Aggiornamento della posizione del serpente
-        new_head1 = (snake1_pos[0][0] + snake1_dir[0], snake1_pos[0][1] + snake1_dir[1])
-        # Teletrasporto del serpente quando esce dai bordi
-        new_head1 = (new_head1[0] % SCREEN_WIDTH, new_head1[1] % SCREEN_HEIGHT)
-        if snake1_growing:
-            snake1_pos = [new_head1] + snake1_pos
-            snake1_growing = False
-        else:
-            snake1_pos = [new_head1] + snake1_pos[:-1]
-
-        while True:
-            try:
-                message = server.client_queue.get(False)
+                    renderer.invalidate()
+                    inputs.clear()
+                    last_time = time.perf_counter()  # Il tempo in pausa non va recuperato
+                if event.key == pygame.K_F3:  # Mostra o nasconde i tempi del frame
+                    profiler.toggle()
+                if event.key in KEY_DIRECTIONS:
+                    inputs.push(KEY_DIRECTIONS[event.key], player.direction, now)
+        profiler.mark('input')
+
+        network = mode == "Multiplayer" and now >= next_network
+        if network:
+            next_network = now + 1 / NET_RATE
+
+            # Prima gli eventi in ordine (cibo e bombe), poi lo stato più recente dell'avversario
+            for message in server.events.drain():
                 match message['type']:
-                    case 'update':
-                        snake2_pos = [tuple(p) for p in message['position']]
-                        snake2_dir = tuple(message['direction'])
-                        score2 = int(message['score'])
-                        is_other_running = bool(message['running'])
-
-                    case 'extra':
-                        food_pos = tuple(message['food'])
-                        obstacles = [tuple(p) for p in message['obstacles']]
-
-            except Empty:
-                break
-
-        if food_pos is None or obstacles is None:
+                    case 'extra' if valid_extra(state, message):
+                        set_food(state, message['food'])
+                        set_obstacles(state, message['obstacles'])
+                        if recorder is not None:
+                            recorder.message(0, message)
+
+                    case 'resync':
+                        server.send(extra_message(state))
+
+                    case 'start':
+                        seed = message['seed']
+                        state = new_game(players=2, seed=seed)
+                        session = LockstepSession(state, 1)
+                        opponent, player = state.snakes
+
+            for messages in server.updates.take().values():
+                for message in messages:
+                    match message['type']:
+                        case 'update' | 'snapshot':
+                            receiver.apply(state, 1, message)
+                            is_other_running = message['running']
+                            if recorder is not None:
+                                recorder.message(1, message)
+
+                        case 'inputs':
+                            if session is not None:
+                                session.receive(message)
+                                is_other_running = message['running']
+
+                        case 'checksum':
+                            if message['value'] == extra_checksum(state):
+                                checksum_mismatches = 0
+                            else:
+                                checksum_mismatches += 1
+                            if checksum_mismatches == 2:
+                                server.send({'type': 'resync'})  # L'host risponde con un messaggio extra
+                                checksum_mismatches = 0
+        profiler.mark('network')
+
+        if state.food is None:
+            # In attesa del primo messaggio dall'host (extra o start): si aspetta comunque il prossimo frame
+            accumulator = 0.0
+            clock.tick(RENDER_FPS)
+            profiler.mark('wait')
+            profiler.end()
             continue
 
-        # Controlla collisioni con il cibo
-        if snake1_pos[0] == food_pos:
-            snake1_growing = True  # Imposta il flag per far crescere il serpente
-            food_pos = generate_food(snake1_pos)
-            score1 += 1
-
-            if mode == "Single Player":
-                num_obstacles += 1
-                obstacles = generate_obstacles(num_obstacles, snake1_pos, food_pos)
-            else:
-                server.send({
-                    'type': 'extra',
-                    'food': food_pos,
-                    'obstacles': obstacles
-                })
-
-        # Controlla collisioni con ostacoli
-        collision, hit_obstacle = check_obstacle_collision(snake1_pos[0], obstacles)
-        if collision:
-            animate_explosion(hit_obstacle)
-            running = False
-
-        # Controlla collisione con se stesso
-        if check_self_collision(snake1_pos):
-            running = False
-
-        # Controlla collisioni tra i serpenti
-        if mode == "Multiplayer" and set(snake1_pos).intersection(snake2_pos):
-            running = False
-
-        if mode == "Multiplayer":
-            server.send({
-                'type': 'update',
-                'position': snake1_pos,
-                'direction': snake1_dir,
-                'score': score1,
-                'running': running
-            })
-
-        # Disegna lo sfondo e la griglia
-        screen.blit(field_background_image, (0, 0))
-
-        # Disegna il serpente
-        draw_snake(snake1_pos, snake1_dir, blue_player_head, blue_player_body)
-
-        if mode == "Multiplayer":
-            draw_snake(snake2_pos, snake2_dir, red_player_head, red_player_body)
+        if recorder is None and record and playing:
+            # La partita comincia adesso (il client la riceve dall'host): da qui parte il replay
+            try:
+                recorder = ReplayRecorder(replay_path(), state, fps, state.snakes.index(player),
+                                          session is not None, seed, receiver)
+            except ValueError as error:
+                logger.warning('replay not recorded error=%s', error)
+                record = False
+            if recorder is not None and session is not None:
+                session.history = []
+
+        # Simulazione a passo fisso: tanti tick quanti ne stanno nel tempo trascorso
+        while playing and accumulator >= tick_length and running:
+            accumulator -= tick_length
+            previous = {snake: list(snake.body) for snake in state.snakes}
+
+            if session is not None:
+                # Lockstep: si simulano entrambi i serpenti e si inviano solo gli input. Se l'avversario
+                # è troppo indietro si aspetta, tenendo da parte la direzione scelta.
+                if not state.over and session.can_advance():
+                    direction = autoplay.move(state, session.local) if autoplay else inputs.pop(time.perf_counter())
+                    for kind, _, cell in session.advance(direction):
+                        if kind == EVENT_BOMB:
+                            animations.add(animate_explosion(cell_to_pixel(cell)), now)
+
+                if state.over and session.settled:
+                    # Fine partita confermata: si aspetta un poco che anche l'avversario abbia i nostri input
+                    settle_ticks += 1
+                    if session.peer_settled or settle_ticks > 2 * fps:
+                        running = False
+                continue
+
+            # Movimento e collisioni (cibo, ostacoli, se stesso, altro serpente) sono gestiti dal motore
+            direction = autoplay.move(state, 0) if autoplay else inputs.pop(time.perf_counter())
+            for kind, _, cell in step(state, [direction]):
+                if kind == EVENT_FOOD and mode == "Multiplayer":
+                    outgoing.append(extra_message(state))
+                elif kind == EVENT_BOMB:
+                    animations.add(animate_explosion(cell_to_pixel(cell)), now)
+            if recorder is not None:
+                recorder.inputs([direction])
+                if recorder.keyframe_due:
+                    recorder.keyframe(state, receiver)
+
+            running = running and player.alive
+
+            if mode == "Multiplayer":
+                outgoing.append(sender.message(player, running))
+                if is_game_host and state.tick % CHECKSUM_INTERVAL == 0:
+                    outgoing.append({'type': 'checksum', 'value': extra_checksum(state)})
+
+        if recorder is not None and session is not None:
+            # Lockstep: nel replay vanno solo i tick confermati, con gli input di entrambi
+            for confirmed_inputs in session.history:
+                recorder.inputs(confirmed_inputs)
+            session.history.clear()
+            if recorder.keyframe_due and session.settled:
+                recorder.keyframe(state)
+        profiler.mark('simulation')
+
+        if mode == "Multiplayer" and playing and (network or not running):
+            # Lo stato dei serpenti viaggia un messaggio per tick, il lockstep con l'ultimo messaggio
+            # (che contiene tutti gli input non confermati); l'ultimo invio comunica la fine della partita
+            if session is not None:
+                outgoing.append(session.message(running))
+            elif not running:
+                outgoing.append(sender.message(player, running))
+            server.send(*outgoing)
+            outgoing = []
+            profiler.mark('network')
+
+        # Scena del frame: cibo e ostacoli nelle loro celle, i serpenti sopra, interpolati tra due tick
+        scene = {}
 
         # Disegna il cibo (mela)
-        screen.blit(apple_icon, food_pos)
+        scene[state.food] = apple_icon
 
         # Disegna gli ostacoli (bombe)
-        for pos in obstacles:
-            screen.blit(bomb_icon, pos)
+        for cell in state.obstacles:
+            scene[cell] = bomb_icon
 
-        # Disegna il punteggio
-        draw_score(score1, score2 if mode == "Multiplayer" else None)
+        alpha = min(accumulator / tick_length, 1.0)
+        sprites = blue_player_sprites.interpolated(state, player, previous.get(player, ()), alpha)
+        if mode == "Multiplayer":
+            sprites += red_player_sprites.interpolated(state, opponent, previous.get(opponent, ()), alpha)
+        animations.update(now)
+        sprites += animations.sprites()
+        sprites += profiler.overlay(profiler_font, (0, SCREEN_HEIGHT),
+                                    network_report if mode == "Multiplayer" else None)
+        profiler.mark('scene')
+
+        # Disegna solo ciò che è cambiato e, se serve, il punteggio
+        score2 = opponent.score if mode == "Multiplayer" else None
+        renderer.render(scene, (player.score, score2), lambda: draw_score(player.score, score2), sprites)
+        profiler.mark('render')
+
+        clock.tick(RENDER_FPS)
+        profiler.mark('wait')
+        profiler.end()
+    profiler.flush()
+    if recorder is not None:
+        recorder.close(state, receiver)
+        logger.info('replay saved path=%s ticks=%d', recorder.path, recorder.tick)
+
+    if inputs.latency.count:
+        logger.info('input moves=%d latency_mean_ms=%.0f latency_max_ms=%.0f discarded=%d', inputs.latency.count,
+                    inputs.latency.mean * 1000, inputs.latency.max * 1000, inputs.rejected + inputs.dropped)
+    if mode == "Multiplayer":
+        logger.info('network %s', ' '.join(f'{key}={value}' for key, value in server.metrics().items()))
 
-        pygame.display.flip()
-        clock.tick(fps)
+    score1 = player.score
+    score2 = opponent.score if mode == "Multiplayer" else None
 
     pygame.mixer.music.stop()
     game_over_sound.play()
     game_over_sound.set_volume(5)
-    # Mostra schermata di fine gioco
-    screen.fill((0, 0, 0))  # Sfondo nero per migliorare il contrasto
+    game_over_screen(mode, score1, score2)
 
-    # Aggiungi un rettangolo opaco dietro il testo
-    game_over_rect = pygame.Rect(
-        SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT // 2 - 100, 300, 100)
-    pygame.draw.rect(screen, (0, 0, 0, 180), game_over_rect)  # Rettangolo semitrasparente
 
+def game_over_screen(mode, score1, score2):
+    # Schermata di fine gioco con il conteggio dei punteggi. Non blocca: gli eventi vengono letti
+    # e i messaggi di rete arrivati nel frattempo scartati, a ogni frame per GAME_OVER_DURATION secondi.
     if mode == "Multiplayer":
         if score1 > score2:
             game_over_text = big_font.render('Giocatore 1 Vince!', True, GREEN)
@@ -776,23 +587,141 @@ def game(fps, mode):
     else:
         game_over_text = big_font.render('Game Over', True, RED)
 
-    screen.blit(game_over_text, (
-        SCREEN_WIDTH // 2 - game_over_text.get_width() // 2, SCREEN_HEIGHT // 2 - game_over_text.get_height() // 2))
+    counting, count1, count2 = animate_score_increase(score1, score2)
+    title = Tween(0, 255, 0.5, ease_out)  # Dissolvenza della scritta
+    animations = Scheduler()
+    start = time.perf_counter()
+    animations.add(Timeline((0.0, title), (0.0, counting), duration=GAME_OVER_DURATION), start)
 
-    if mode == "Single Player":
-        score_text = font.render(f"Score : {score1}", True, WHITE)
-        screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
-    else:
-        score_text = font.render(f"Score 1: {score1}", True, WHITE)
-        screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
+    while animations:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                animations.clear()
+        if mode == "Multiplayer":
+            server.events.drain()
+            server.updates.take()
 
-    if mode == "Multiplayer":
-        score2_text = font.render(f"Score 2: {score2}", True, WHITE)
-        screen.blit(score2_text, (SCREEN_WIDTH // 2 - score2_text.get_width() // 2, SCREEN_HEIGHT // 2 + 80))
+        animations.update(time.perf_counter())
+
+        # Mostra schermata di fine gioco
+        screen.fill((0, 0, 0))  # Sfondo nero per migliorare il contrasto
+
+        # Aggiungi un rettangolo opaco dietro il testo
+        game_over_rect = pygame.Rect(
+            SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT // 2 - 100, 300, 100)
+        pygame.draw.rect(screen, (0, 0, 0, 180), game_over_rect)  # Rettangolo semitrasparente
+
+        game_over_text.set_alpha(int(title.value))
+        screen.blit(game_over_text, (
+            SCREEN_WIDTH // 2 - game_over_text.get_width() // 2, SCREEN_HEIGHT // 2 - game_over_text.get_height() // 2))
+
+        if mode == "Single Player":
+            score_text = font.render(f"Score : {round(count1.value)}", True, WHITE)
+            screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
+        else:
+            score_text = font.render(f"Score 1: {round(count1.value)}", True, WHITE)
+            screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
+
+        if mode == "Multiplayer":
+            score2_text = font.render(f"Score 2: {round(count2.value)}", True, WHITE)
+            screen.blit(score2_text, (SCREEN_WIDTH // 2 - score2_text.get_width() // 2, SCREEN_HEIGHT // 2 + 80))
+
+        pygame.display.flip()
+        clock.tick(RENDER_FPS)
+
+
+def replay_menu():
+    # Elenco dei replay più recenti nella cartella dei replay
+    paths = sorted(glob.glob(os.path.join(REPLAY_DIR, '*' + REPLAY_SUFFIX)), key=os.path.getmtime, reverse=True)
+    names = {os.path.basename(path)[:-len(REPLAY_SUFFIX)]: path for path in paths[:REPLAY_MENU_SIZE]}
+    menu = Menu(list(names) + ["Indietro"], menu_background_image, font, menu_font, escape="Indietro")
+    selected = menu.run(screen)
+    if selected in names:
+        replay_game(names[selected])
+
+
+def replay_game(path):
+    # Riproduce un replay nella finestra: SPAZIO pausa, SU/GIÙ velocità, SINISTRA/DESTRA salta
+    # indietro o avanti di REPLAY_SEEK_SECONDS (partendo dal keyframe precedente), ESC esce
+    try:
+        replay = ReplayPlayer(path)
+    except (OSError, ValueError) as error:
+        logger.warning('replay not loaded path=%s error=%s', path, error)
+        return
+
+    state = replay.state
+    local = state.snakes[replay.local]
+    others = [snake for snake in state.snakes if snake is not local]
+    renderer = DirtyRenderer(screen, field_background_image, SCORE_PANEL)
+    animations = Scheduler()
+    tick_length = 1 / replay.fps
+    speed = REPLAY_SPEEDS.index(1)
+    paused = False
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    previous = {}
+
+    running = True
+    while running:
+        now = time.perf_counter()
+        if not paused:
+            accumulator += min(now - last_time, MAX_FRAME_TIME) * REPLAY_SPEEDS[speed]
+        last_time = now
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_UP:
+                    speed = min(speed + 1, len(REPLAY_SPEEDS) - 1)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed - 1, 0)
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    offset = REPLAY_SEEK_SECONDS * replay.fps
+                    replay.seek(state.tick + (offset if event.key == pygame.K_RIGHT else -offset))
+                    previous = {}
+                    accumulator = 0.0
+                    animations.clear()
+
+        while accumulator >= tick_length:
+            accumulator -= tick_length
+            previous = {snake: list(snake.body) for snake in state.snakes}
+            events = replay.step()
+            if events is None:
+                accumulator = 0.0  # Fine del replay: resta sull'ultimo tick
+                break
+            for kind, _, cell in events:
+                if kind == EVENT_BOMB:
+                    animations.add(animate_explosion(cell_to_pixel(cell)), now)
+
+        scene = {cell: bomb_icon for cell in state.obstacles}
+        if state.food is not None:
+            scene[state.food] = apple_icon
+
+        alpha = min(accumulator / tick_length, 1.0)
+        sprites = blue_player_sprites.interpolated(state, local, previous.get(local, ()), alpha)
+        for snake in others:
+            sprites += red_player_sprites.interpolated(state, snake, previous.get(snake, ()), alpha)
+        animations.update(now)
+        sprites += animations.sprites()
+
+        status = f"x{REPLAY_SPEEDS[speed]:g}  tick {state.tick}/{replay.last_tick}"
+        if paused:
+            status += "  pausa"
+        if replay.diverged is not None:
+            status += f"  divergenza al tick {replay.diverged}"
+        status_text = profiler_font.render(status, True, WHITE)
+        sprites.append((status_text, (0, SCREEN_HEIGHT - status_text.get_height())))
+
+        score2 = others[0].score if others else None
+        renderer.render(scene, (local.score, score2), lambda: draw_score(local.score, score2), sprites)
+        clock.tick(RENDER_FPS)
 
-    pygame.display.flip()
-    pygame.time.wait(3000)
 
+# Tempi del loop di gioco, per tutte le partite (vedi profiler.py)
+profiler = FrameProfiler()
 
 # Loop principale del gioco
 while True:
@@ -800,3 +729,5 @@ while True:
     if mode == "play":
         selected_mode = mode_menu()
         game(DIFFICULTY_LEVELS["Media"], selected_mode)  # Avvia il gioco con la difficoltà predefinita
+    elif mode == "replay":
+        replay_menu()
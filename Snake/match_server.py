@@ -0,0 +1,947 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import selectors
+import signal
+import socket as net
+import struct
+import sys
+import time
+from collections import deque
+from multiprocessing import Process, Queue
+
+import protocol
+from bots import make_bot
+from broadcast import Broadcast, Viewer
+from engine import DIFFICULTY_LEVELS, DIRECTIONS, FREE_FOR_ALL_SIZE, GRID_HEIGHT, GRID_WIDTH, board_size, new_game, step
+from framing import MAX_RECEIVE_SIZE, PACKET_HEADER, UNRELIABLE, PacketReader, PacketWriter, new_connection
+from interest import INTEREST_RADIUS, SectorIndex
+from reliable import ReliableChannel
+from telemetry import RateLimitedLog
+
+# Server dedicato senza display: un solo processo ospita molte partite (stanze) sullo stesso
+# socket UDP. Ogni pacchetto porta l'ID di connessione del client (framing.py), che decide a quale
+# peer appartiene, indipendentemente dall'indirizzo da cui arriva. L'ID lo sceglie il server: il
+# client manda hello con un ID suo, usato solo per questo scambio, e il server risponde con welcome
+# e un ID a 64 bit casuale e ancora libero. Un hello con l'ID temporaneo di un client già accettato
+# da un altro indirizzo viene rifiutato; i pacchetti con un ID sconosciuto e senza hello scartati.
+# Chi conosce l'ID assegnato può cambiare indirizzo (NAT che riassegna la porta): l'ID fa da
+# segreto, e chi non vede il traffico del client non lo indovina. Il server è autoritativo: i
+# client inviano solo le svolte (messaggio inputs) e ricevono a ogni tick lo stato della stanza,
+# codificato una volta sola e spedito a tutti i suoi giocatori.
+#
+# Con più di due giocatori per stanza (--players, fino a 64) si gioca tutti contro tutti su un
+# campo più grande, e ognuno riceve solo i serpenti entro --interest celle dalla sua testa
+# (interest.py, messaggio area_update), così il traffico per giocatore non cresce con la stanza.
+#
+# Chiunque può guardare una partita con spectate: riceve un keyframe e poi i delta di tutta la
+# stanza, codificati una volta per tick e condivisi tra tutti gli spettatori (broadcast.py).
+#
+# Tutte le stanze avanzano con lo stesso scheduler: un heap ordinato per istante del prossimo tick,
+# svuotato tra una lettura del socket e l'altra. Con --workers le stanze si dividono tra più
+# processi, ciascuno con il suo socket sulla stessa porta (SO_REUSEPORT: il kernel manda sempre
+# allo stesso processo i pacchetti di uno stesso client); dove non è disponibile ogni processo
+# usa la porta successiva. Con SO_REUSEPORT il processo si sceglie dall'indirizzo del client, non
+# dal suo ID: un client che cambia indirizzo finisce in genere su un processo che non lo conosce,
+# che scarta i suoi pacchetti, e deve ricollegarsi. Il cambio di indirizzo vale solo con un processo.
+#
+# Uso:
+#   python match_server.py serve [--port 7778] [--workers 4] [--players 16]
+#   python match_server.py bench --rooms 200 [--spectators 1000] [--bot path] [--record benchmarks.jsonl]
+#   python match_server.py watch [--room 3] [--rate 10] [--bandwidth 20000]
+#
+# bench avvia il server in un processo a parte e gli collega --rooms partite di client automatici
+# (tutti su un solo socket, distinti dall'ID di connessione); dal tempo di CPU usato dal server
+# ricava quante partite contemporanee regge un core. Con --record il risultato viene aggiunto al
+# file come riga JSON, per seguirne l'andamento nel tempo.
+
+logger = logging.getLogger(__name__)
+
+SERVER_PORT = 7778
+ROOM_PLAYERS = 2
+MAX_ROOM_PLAYERS = 64
+TICK_RATE = DIFFICULTY_LEVELS['Media']  # Tick al secondo di ogni stanza
+MAX_PENDING_INPUTS = 3  # Svolte in attesa per giocatore, una consumata per tick (come controls.InputQueue)
+MAX_LATE_TICKS = 5  # Tick di ritardo oltre i quali una stanza riparte da adesso invece di recuperare
+ROOM_LINGER = 1.0  # Secondi in cui si continua a inviare lo stato finale prima di chiudere la stanza
+PEER_TIMEOUT = 10.0  # Secondi di silenzio dopo cui un client viene dimenticato
+MAINTENANCE_INTERVAL = 0.05  # Secondi tra due controlli di ritrasmissioni e client scaduti
+MAX_PEERS = 4096
+PING_INTERVAL = 1.0  # Secondi tra due ping degli spettatori
+RESYNC_INTERVAL = 0.5  # Secondi prima di ripetere una richiesta di resync rimasta senza risposta
+HELLO_INTERVAL = 0.2  # Secondi tra due hello finché il server non risponde
+SPECTATOR_DELAY = 1.0  # bench: secondi dopo cui collegare gli spettatori
+
+
+class Peer:
+    def __init__(self, connection, address):
+        self.connection = connection  # Assegnato dal server, usato in entrambe le direzioni
+        self.address = address
+        self.hello = None  # ID scelto dal client per hello
+        self.writer = PacketWriter(connection)
+        self.reader = PacketReader()
+        self.channel = ReliableChannel()
+        self.room = None
+        self.index = None
+        self.inputs = deque()
+        self.last_input = 0  # Numero dell'ultima svolta ricevuta
+        self.last_seen = 0.0
+        # Tutti contro tutti: serpenti che il client conosce, centro della sua area e messaggio completo dovuto
+        self.known = set()
+        self.center = 0
+        self.resync = True
+        self.viewer = None  # Spettatore: Viewer della stanza che guarda
+
+
+class Room:
+    def __init__(self, room_id, players, seed, tick_rate, width=GRID_WIDTH, height=GRID_HEIGHT, interest=None):
+        self.id = room_id
+        self.seed = seed
+        self.interval = 1 / tick_rate
+        self.members = [None] * players  # Indice del serpente -> Peer
+        self.width = width
+        self.height = height
+        self.free_for_all = players > 2
+        self.interest = interest  # Raggio dell'area di ogni giocatore, None per mandare tutto a tutti
+        self.index = None  # SectorIndex dei serpenti, solo con interest
+        self.state = None  # Creato quando la stanza è piena
+        self.snapshot_due = True
+        self.finished_at = None
+        self.last_payloads = []
+        self.broadcast = Broadcast()  # Spettatori
+        self.keyframe_tick = None
+        self.keyframe_payload = None
+
+    @property
+    def full(self):
+        return None not in self.members
+
+    def join(self, peer):
+        index = self.members.index(None)
+        self.members[index] = peer
+        peer.room = self
+        peer.index = index
+        peer.known = set()
+        peer.resync = True
+        return index
+
+    def leave(self, peer):
+        if peer.viewer is not None:
+            self.broadcast.remove(peer.viewer)
+            peer.viewer = None
+        else:
+            self.members[peer.index] = None
+        peer.room = None
+
+    def spectate(self, peer, rate, bandwidth, now):
+        peer.viewer = self.broadcast.add(Viewer(peer, rate, bandwidth, now))
+        peer.room = self
+        peer.index = None
+
+    def keyframe(self):
+        # Istantanea dello stato attuale per gli spettatori, codificata al più una volta per tick
+        if self.keyframe_tick != self.state.tick:
+            self.keyframe_tick = self.state.tick
+            self.keyframe_payload = protocol.encode(protocol.room_snapshot(self.state))
+        return self.keyframe_payload
+
+    def start(self):
+        self.state = new_game(players=len(self.members), seed=self.seed, width=self.width, height=self.height,
+                              free_for_all=self.free_for_all)
+        if self.interest is not None:
+            self.index = SectorIndex(self.width, self.height)
+            for i, snake in enumerate(self.state.snakes):
+                self.index.add_snake(i, snake.body)
+                self.members[i].center = snake.body.head
+
+    def request_snapshot(self, peer):
+        if peer.viewer is not None:
+            self.broadcast.request_keyframe(peer.viewer)
+            return
+        self.snapshot_due = True
+        peer.resync = True
+
+    def tick(self):
+        # Avanza di un tick e restituisce i messaggi da inviare, già codificati, come (peer, payload)
+        state = self.state
+        if state.over:
+            return self.last_payloads  # Partita finita: si ripete lo stato finale
+
+        inputs = [peer.inputs.popleft() if peer is not None and peer.inputs else None for peer in self.members]
+        moved = [snake.alive for snake in state.snakes]
+        lengths = [len(snake.body) for snake in state.snakes]
+        tails = [snake.body.tail if moved[i] else None for i, snake in enumerate(state.snakes)]
+        step(state, inputs)
+
+        if self.index is not None:
+            self.index.update(state, moved, tails, lengths)
+            records = protocol.AreaRecords(state, moved, lengths)
+            self.last_payloads = [(peer, self.area_update(peer, records)) for peer in self.members
+                                  if peer is not None]
+            if self.broadcast.viewers:
+                # Gli spettatori vedono tutta la stanza: un delta in più, sempre uno solo per tick
+                self.broadcast.publish(protocol.encode(protocol.room_update(state, moved, lengths)))
+            return self.last_payloads
+
+        if self.snapshot_due or state.tick % protocol.SNAPSHOT_INTERVAL == 0:
+            self.snapshot_due = False
+            message = protocol.room_snapshot(state)
+        else:
+            message = protocol.room_update(state, moved, lengths)
+        payload = protocol.encode(message)  # Uguale per tutti, spettatori compresi: codificato una volta sola
+        self.last_payloads = [(peer, payload) for peer in self.members if peer is not None]
+        self.broadcast.publish(payload)
+        return self.last_payloads
+
+    def area_update(self, peer, records):
+        # Messaggio per un giocatore: delta dei serpenti che vedeva già, corpo intero di quelli
+        # appena entrati nella sua area, indici di quelli usciti. I messaggi completi periodici
+        # sono sfalsati tra i giocatori, per non mandarli tutti nello stesso tick.
+        state = self.state
+        own = state.snakes[peer.index].body
+        if len(own):
+            peer.center = own.head  # Da morto continua a vedere l'area in cui è caduto
+        visible = self.index.nearby(peer.center, self.interest)
+        died = [i for i in peer.known if not len(state.snakes[i].body)]  # Tolti dal campo in questo tick
+
+        complete = peer.resync or (state.tick + peer.index) % protocol.SNAPSHOT_INTERVAL == 0
+        if complete:
+            peer.resync = False
+            entered, stayed, left = visible, (), ()
+        else:
+            known = peer.known
+            entered, stayed, left = visible - known, visible & known, known - visible - set(died)
+        peer.known = visible
+
+        deltas = [records.delta(i) for i in stayed]
+        snakes = [records.snake(i) for i in entered]
+        snakes += [records.snake(i) for i in died]
+        return protocol.pack_area_update(state.tick, state.food, complete, deltas, snakes, left)
+
+
+class MatchServer:
+    def __init__(self, host='0.0.0.0', port=SERVER_PORT, players=ROOM_PLAYERS, tick_rate=TICK_RATE,
+                 reuse_port=False, seed=None, board=None, interest=INTEREST_RADIUS):
+        self.players = players
+        self.tick_rate = tick_rate
+        if board is None:
+            board = FREE_FOR_ALL_SIZE if players > 2 else (GRID_WIDTH, GRID_HEIGHT)
+        self.board = board
+        self.interest = interest if players > 2 and interest else None
+        self.rng = random.Random(seed)
+
+        socket = net.socket(net.AF_INET, net.SOCK_DGRAM)
+        if reuse_port:
+            socket.setsockopt(net.SOL_SOCKET, net.SO_REUSEPORT, 1)
+        socket.bind((host, port))
+        socket.setblocking(False)
+        self.socket = socket
+        self.port = socket.getsockname()[1]
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(socket, selectors.EVENT_READ)
+
+        self.peers = {}  # ID di connessione -> Peer
+        self.hellos = {}  # ID scelto dal client per hello -> Peer
+        self.rooms = {}  # ID della stanza -> Room
+        self.waiting = []  # Stanze con posti liberi, in ordine di creazione
+        self.schedule = []  # Heap di (istante del prossimo tick, ID della stanza)
+        self.next_room = 1
+        self.next_maintenance = 0.0
+        self.log = RateLimitedLog(logger)
+
+        self.room_ticks = 0
+        self.late_ticks = 0  # Tick eseguiti con più di un intervallo di ritardo
+        self.matches = 0  # Partite finite
+        self.packets_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.keyframes = 0  # Delle stanze già chiuse
+        self.catch_ups = 0
+
+    def serve(self, duration=None):
+        end = None if duration is None else time.perf_counter() + duration
+        while end is None or time.perf_counter() < end:
+            now = time.perf_counter()
+            timeout = MAINTENANCE_INTERVAL
+            if self.schedule:
+                timeout = min(timeout, max(0.0, self.schedule[0][0] - now))
+            if self.selector.select(timeout):
+                self.on_readable()
+
+            now = time.perf_counter()
+            self.run_ticks(now)
+            if now >= self.next_maintenance:
+                self.maintenance(now)
+                self.next_maintenance = now + MAINTENANCE_INTERVAL
+
+    def on_readable(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(MAX_RECEIVE_SIZE)
+            except BlockingIOError:
+                return
+            self.packets_in += 1
+            now = time.perf_counter()
+
+            # Il peer si riconosce dall'ID di connessione, prima ancora di decodificare il pacchetto
+            try:
+                connection = PACKET_HEADER.unpack_from(data)[0]
+            except struct.error as error:
+                self.log.log(logging.WARNING, 'malformed', 'discarded datagram peer=%s error=%s', address[0], error)
+                continue
+            peer = self.peers.get(connection)
+            if peer is None:
+                self.welcome(connection, data, address, now)
+                continue
+            if address != peer.address:
+                # Solo chi ha ricevuto welcome conosce l'ID: è lo stesso client da un nuovo indirizzo (NAT)
+                self.log.log(logging.INFO, 'address', 'peer moved from=%s to=%s', peer.address[0], address[0])
+                peer.address = address
+            peer.last_seen = now
+
+            try:
+                ack, ack_bits, packed = peer.reader.unpack(data)
+                peer.channel.acknowledge(ack, ack_bits, now)
+                payloads = []
+                for reliable_id, payload in packed:
+                    if reliable_id is UNRELIABLE:
+                        payloads.append(payload)
+                    else:
+                        payloads.extend(peer.channel.receive(reliable_id, payload))
+                messages = [protocol.decode(payload) for payload in payloads]
+            except ValueError as error:
+                self.log.log(logging.WARNING, 'malformed', 'discarded datagram peer=%s error=%s', address[0], error)
+                continue
+
+            for message in messages:
+                self.handle(peer, message, now)
+
+    def welcome(self, hello, data, address, now):
+        # Pacchetto con un ID che il server non ha assegnato: vale solo se contiene hello, e hello
+        # è l'ID temporaneo del client, a cui si risponde con quello assegnato
+        try:
+            _, _, packed = PacketReader().unpack(data)
+            kinds = [protocol.decode(payload)['type'] for _, payload in packed]
+        except ValueError as error:
+            self.log.log(logging.WARNING, 'malformed', 'discarded datagram peer=%s error=%s', address[0], error)
+            return
+        if 'hello' not in kinds:
+            self.log.log(logging.WARNING, 'unknown', 'discarded datagram for unknown connection peer=%s',
+                         address[0])
+            return
+
+        peer = self.hellos.get(hello)
+        if peer is None:
+            if len(self.peers) >= MAX_PEERS:
+                self.log.log(logging.WARNING, 'full', 'server full, discarded datagram peer=%s', address[0])
+                return
+            connection = new_connection()
+            while connection in self.peers:
+                connection = new_connection()
+            peer = self.peers[connection] = Peer(connection, address)
+            peer.hello = hello
+            self.hellos[hello] = peer
+        elif peer.address != address:
+            # Lo stesso ID temporaneo da un altro indirizzo: non si cede la connessione di un altro client
+            self.log.log(logging.WARNING, 'hello', 'rejected hello for a connection in use peer=%s', address[0])
+            return
+        peer.last_seen = now  # Hello ripetuto: il welcome precedente è andato perso
+
+        payload = protocol.encode({'type': 'welcome', 'connection': peer.connection})
+        for _, _, packet in PacketWriter(hello).pack([(UNRELIABLE, payload)]):
+            try:
+                self.socket.sendto(packet, address)
+                self.packets_out += 1
+                self.bytes_out += len(packet)
+            except OSError as error:
+                self.log.log(logging.WARNING, 'send', 'send failed peer=%s error=%s', address[0], error)
+
+    def handle(self, peer, message, now):
+        match message['type']:
+            case 'join':
+                if peer.room is None:
+                    self.join(peer, message['room'], now)
+
+            case 'spectate':
+                if peer.room is None:
+                    self.spectate(peer, message['room'], message['rate'], message['bandwidth'], now)
+
+            case 'inputs':
+                # Ogni messaggio ripete le ultime svolte: si accodano solo quelle nuove, e solo se sono
+                # direzioni vere (un byte qualsiasi dalla rete manderebbe il serpente fuori dal campo)
+                first = message['tick'] - len(message['directions']) + 1
+                for number, direction in enumerate(message['directions'], first):
+                    if number > peer.last_input and direction in DIRECTIONS:
+                        if len(peer.inputs) < MAX_PENDING_INPUTS:
+                            peer.inputs.append(direction)
+                        peer.last_input = number
+
+            case 'resync':
+                if peer.room is not None:
+                    peer.room.request_snapshot(peer)
+
+            case 'ping':
+                self.send(peer, [(UNRELIABLE, protocol.encode({'type': 'pong', 'time': message['time']}))], now)
+
+            case 'leave':
+                self.remove(peer)
+
+    def join(self, peer, room_id, now):
+        # La stanza richiesta solo se è ancora in attesa: in una partita iniziata non si entra,
+        # nemmeno al posto di un giocatore uscito
+        room = self.rooms.get(room_id)
+        if room not in self.waiting:
+            room = self.waiting[0] if self.waiting else self.create_room()
+        index = room.join(peer)
+        if room.full:
+            self.waiting.remove(room)
+            room.start()
+            heapq.heappush(self.schedule, (now + room.interval, room.id))
+
+        peer.channel.queue(protocol.encode({'type': 'joined', 'room': room.id, 'index': index,
+                                            'players': len(room.members), 'tick': 0, 'width': room.width,
+                                            'height': room.height, 'free_for_all': room.free_for_all}))
+        self.send(peer, [], now)
+
+    def spectate(self, peer, room_id, rate, bandwidth, now):
+        # Stanza richiesta, altrimenti la partita in corso con meno spettatori, altrimenti la prossima
+        room = self.rooms.get(room_id)
+        if room is None:
+            playing = [room for room in self.rooms.values() if room.state is not None and not room.state.over]
+            if playing:
+                room = min(playing, key=lambda room: len(room.broadcast.viewers))
+            else:
+                room = self.waiting[0] if self.waiting else self.create_room()
+        room.spectate(peer, rate, bandwidth, now)
+
+        peer.channel.queue(protocol.encode({'type': 'joined', 'room': room.id, 'index': protocol.SPECTATOR,
+                                            'players': len(room.members), 'tick': 0, 'width': room.width,
+                                            'height': room.height, 'free_for_all': room.free_for_all}))
+        self.send(peer, [], now)
+
+    def create_room(self):
+        room = Room(self.next_room, self.players, self.rng.getrandbits(32), self.tick_rate, *self.board,
+                    self.interest)
+        self.next_room = self.next_room % 0xFFFF + 1
+        self.rooms[room.id] = room
+        self.waiting.append(room)
+        return room
+
+    def close_room(self, room):
+        for peer in room.members:
+            if peer is not None:
+                peer.room = None
+        # Agli spettatori tutto ciò che avevano in coda, fino all'ultimo tick, poi lo stato finale
+        # completo (anche per chi aveva perso un delta) e leave: la stanza non manderà più niente
+        now = time.perf_counter()
+        queues = dict(room.broadcast.flush())
+        final = [room.keyframe()] if room.state is not None else []
+        for viewer in room.broadcast.viewers:
+            viewer.peer.channel.queue(protocol.encode({'type': 'leave'}))
+            self.send(viewer.peer, [(UNRELIABLE, payload) for payload in queues.get(viewer, []) + final], now)
+            viewer.peer.room = None
+            viewer.peer.viewer = None
+        self.keyframes += room.broadcast.keyframes
+        self.catch_ups += room.broadcast.catch_ups
+        self.rooms.pop(room.id, None)
+        if room in self.waiting:
+            self.waiting.remove(room)
+
+    def remove(self, peer):
+        room = peer.room
+        if room is not None:
+            room.leave(peer)
+            if not any(room.members):
+                self.close_room(room)  # Nessun giocatore rimasto: la partita finisce anche per gli spettatori
+        self.peers.pop(peer.connection, None)
+        self.hellos.pop(peer.hello, None)
+
+    def run_ticks(self, now):
+        # Esegue i tick di tutte le stanze scadute, nell'ordine in cui scadono
+        schedule = self.schedule
+        while schedule and schedule[0][0] <= now:
+            due, room_id = heapq.heappop(schedule)
+            room = self.rooms.get(room_id)
+            if room is None:
+                continue
+
+            payloads = room.tick()
+            self.room_ticks += 1
+            if now - due > room.interval:
+                self.late_ticks += 1
+            for peer, payload in payloads:
+                if peer.room is room:
+                    self.send(peer, [(UNRELIABLE, payload)], now)
+            for viewer, shared in room.broadcast.due(now, room.keyframe):
+                self.send(viewer.peer, [(UNRELIABLE, payload) for payload in shared], now)
+
+            if room.state.over:
+                if room.finished_at is None:
+                    room.finished_at = now
+                    self.matches += 1
+                elif now - room.finished_at >= ROOM_LINGER:
+                    self.close_room(room)
+                    continue
+
+            due += room.interval
+            if now - due > MAX_LATE_TICKS * room.interval:
+                due = now  # Troppo indietro: si perde il ritardo invece di eseguire una raffica di tick
+            heapq.heappush(schedule, (due, room_id))
+
+    def maintenance(self, now):
+        # Ritrasmette i messaggi affidabili scaduti e dimentica i client spariti
+        for peer in list(self.peers.values()):
+            if now - peer.last_seen > PEER_TIMEOUT:
+                self.remove(peer)
+            elif peer.channel.unacked and peer.channel.next_deadline(now) == 0:
+                self.send(peer, [], now)
+
+    def send(self, peer, messages, now):
+        messages = peer.channel.due(now) + messages
+        if messages:
+            packets = peer.writer.pack(messages, peer.reader.ack)
+        else:
+            packets = [peer.writer.empty(peer.reader.ack)]
+        for sequence, ids, data in packets:
+            peer.channel.sent(sequence, ids, now)
+            try:
+                self.socket.sendto(data, peer.address)
+                self.packets_out += 1
+                self.bytes_out += len(data)
+            except OSError as error:
+                self.log.log(logging.WARNING, 'send', 'send failed peer=%s error=%s', peer.address[0], error)
+
+    def stats(self):
+        return {
+            'peers': len(self.peers),
+            'rooms': len(self.rooms),
+            'spectators': sum(len(room.broadcast.viewers) for room in self.rooms.values()),
+            'keyframes': self.keyframes + sum(room.broadcast.keyframes for room in self.rooms.values()),
+            'catch_ups': self.catch_ups + sum(room.broadcast.catch_ups for room in self.rooms.values()),
+            'playing': len(self.rooms) - len(self.waiting),
+            'room_ticks': self.room_ticks,
+            'late_ticks': self.late_ticks,
+            'matches': self.matches,
+            'packets_in': self.packets_in,
+            'packets_out': self.packets_out,
+            'bytes_out': self.bytes_out,
+        }
+
+    def close(self):
+        self.selector.close()
+        self.socket.close()
+
+
+def stop(signum, frame):
+    sys.exit(0)  # SIGTERM chiude il server come Ctrl+C, passando dai finally
+
+
+def serve_worker(host, port, players, tick_rate, reuse_port, board=None, interest=INTEREST_RADIUS, duration=None,
+                 results=None):
+    signal.signal(signal.SIGTERM, stop)
+    server = MatchServer(host, port, players, tick_rate, reuse_port, board=board, interest=interest)
+    logger.info('worker pid=%d port=%d', os.getpid(), server.port)
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        server.serve(duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats = server.stats()
+        stats.update(wall=time.perf_counter() - start_time, cpu=time.process_time() - start_cpu)
+        if results is not None:
+            results.put(stats)
+        logger.info('worker pid=%d %s', os.getpid(), ' '.join(f'{key}={value}' for key, value in stats.items()))
+        server.close()
+
+
+def serve(args):
+    if args.workers <= 1:
+        serve_worker(args.host, args.port, args.players, args.tick_rate, False, args.board, args.interest)
+        return
+
+    reuse_port = hasattr(net, 'SO_REUSEPORT')
+    workers = [Process(target=serve_worker,
+                       args=(args.host, args.port if reuse_port else args.port + i, args.players, args.tick_rate,
+                             reuse_port, args.board, args.interest))
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for worker in workers:
+            worker.join()
+    except (KeyboardInterrupt, SystemExit):
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
+
+class Client:
+    # Lato client di una connessione con il server: framing, ack e messaggi affidabili. Finché il
+    # server non risponde con welcome si manda solo hello, con l'ID temporaneo hello; i messaggi
+    # affidabili già in coda partono dopo, con l'ID assegnato.
+    def __init__(self, hello):
+        self.hello = hello
+        self.connection = None  # Assegnato dal server con welcome
+        self.next_hello = 0.0
+        self.writer = PacketWriter(hello)
+        self.reader = PacketReader()
+        self.channel = ReliableChannel()
+        self.updates = 0
+        self.last_update = None
+        self.over = False
+        self.resyncs = 0
+        self.resync_sent = None  # Istante dell'ultima richiesta di resync ancora senza risposta
+
+    def messages(self, data, now):
+        if PACKET_HEADER.unpack_from(data)[0] != (self.hello if self.connection is None else self.connection):
+            return  # Welcome ripetuto quando l'ID è già assegnato, o pacchetto di un'altra connessione
+        ack, ack_bits, packed = self.reader.unpack(data)
+        self.channel.acknowledge(ack, ack_bits, now)
+        for reliable_id, payload in packed:
+            payloads = [payload] if reliable_id is UNRELIABLE else self.channel.receive(reliable_id, payload)
+            for message in map(protocol.decode, payloads):
+                if message['type'] != 'welcome':
+                    yield message
+                elif self.connection is None:
+                    self.connection = self.writer.connection = message['connection']
+
+    def due(self, now):
+        # C'è da inviare anche senza messaggi nuovi: hello finché il server non risponde, poi i
+        # messaggi affidabili mai partiti o da ritrasmettere
+        if self.connection is None:
+            return now >= self.next_hello
+        return bool(self.channel.due(now))
+
+    def maintenance(self, now):
+        # Messaggi da inviare anche senza aver ricevuto niente
+        return []
+
+    def resync(self, now):
+        # Stato da ricostruire perso: si chiede un messaggio completo, senza ripetere la richiesta troppo spesso
+        if self.resync_sent is not None and now - self.resync_sent <= RESYNC_INTERVAL:
+            return []
+        self.resyncs += 1
+        self.resync_sent = now
+        return [(UNRELIABLE, protocol.encode({'type': 'resync'}))]
+
+    def packets(self, messages, now):
+        if self.connection is None:
+            self.next_hello = now + HELLO_INTERVAL
+            hello = [(UNRELIABLE, protocol.encode({'type': 'hello'}))]
+            return [data for _, _, data in self.writer.pack(hello, self.reader.ack)]
+        messages = self.channel.due(now) + messages
+        packets = self.writer.pack(messages, self.reader.ack) if messages else [self.writer.empty(self.reader.ack)]
+        for sequence, ids, _ in packets:
+            self.channel.sent(sequence, ids, now)
+        return [data for _, _, data in packets]
+
+
+class BotClient(Client):
+    # Client automatico per il benchmark: entra in una stanza e ogni tanto svolta a caso, senza
+    # ricostruire lo stato (conta solo gli aggiornamenti ricevuti). Con un bot (bots.py) ricostruisce
+    # invece la stanza, o la sua area nel tutti contro tutti, e a ogni tick gioca la mossa del bot.
+    def __init__(self, hello, rng, bot=None):
+        super().__init__(hello)
+        self.rng = rng
+        self.bot = bot
+        self.state = None
+        self.receivers = {'room_update': protocol.RoomReceiver(), 'area_update': protocol.AreaReceiver()}
+        self.receivers['room_snapshot'] = self.receivers['room_update']
+        self.turns = []  # Ultime svolte inviate, ripetute in ogni messaggio
+        self.turn = 0
+        self.index = None
+        self.channel.queue(protocol.encode({'type': 'join', 'room': 0}))
+
+    def receive(self, data, now):
+        reply = []
+        for message in self.messages(data, now):
+            if message['type'] == 'joined':
+                self.index = message['index']
+                if self.bot is not None:
+                    self.state = new_game(message['players'], 0, message['width'], message['height'], spawn=False,
+                                          free_for_all=message['free_for_all'])
+            elif message['type'] in ('room_update', 'room_snapshot', 'area_update') and self.bot is not None:
+                if self.state is None:
+                    continue
+                self.last_update = now
+                if not self.receivers[message['type']].apply(self.state, message):
+                    reply += self.resync(now)
+                    continue
+                self.updates += 1
+                self.resync_sent = None
+                snake = self.state.snakes[self.index]
+                self.over = self.state.over or not snake.alive
+                direction = self.bot.move(self.state, self.index) if snake.alive and len(snake.body) else None
+                if direction is not None and direction != snake.direction:
+                    reply.append(self.send_turn(direction))
+            elif message['type'] in ('room_update', 'room_snapshot', 'area_update'):
+                self.updates += 1
+                self.last_update = now
+                if message['type'] != 'area_update':
+                    self.over = any(not snake['flags'] & protocol.FLAG_RUNNING for snake in message['snakes'])
+                else:
+                    # Tutti contro tutti: si esce quando si muore (o quando la stanza chiude, vedi run_bots)
+                    for snake in message['deltas'] + message['snakes']:
+                        if snake['index'] == self.index and not snake['flags'] & protocol.FLAG_RUNNING:
+                            self.over = True
+                if self.rng.random() < 0.2:
+                    reply.append(self.send_turn(self.rng.randrange(4)))
+        return reply
+
+    def send_turn(self, direction):
+        self.turn += 1
+        self.turns = (self.turns + [direction])[-3:]
+        return (UNRELIABLE, protocol.encode({'type': 'inputs', 'tick': self.turn, 'confirmed': 0,
+                                             'directions': self.turns, 'running': True}))
+
+
+class SpectatorClient(Client):
+    # Spettatore: ricostruisce lo stato della stanza da keyframe e delta, e chiede un nuovo
+    # keyframe (resync) quando ne perde uno. Il ping periodico tiene viva la connessione. Quando
+    # la stanza chiude, anche a partita in corso perché i giocatori sono usciti, arriva leave.
+    def __init__(self, hello, room=0, rate=0, bandwidth=0):
+        super().__init__(hello)
+        self.room = None
+        self.state = None
+        self.receiver = protocol.RoomReceiver()
+        self.next_ping = 0.0
+        self.closed = False
+        self.channel.queue(protocol.encode({'type': 'spectate', 'room': room, 'rate': rate,
+                                            'bandwidth': bandwidth}))
+
+    def receive(self, data, now):
+        reply = []
+        for message in self.messages(data, now):
+            if message['type'] == 'joined':
+                self.room = message['room']
+                self.state = new_game(message['players'], 0, message['width'], message['height'], spawn=False,
+                                      free_for_all=message['free_for_all'])
+            elif message['type'] in ('room_update', 'room_snapshot') and self.state is not None:
+                self.last_update = now
+                if self.receiver.apply(self.state, message):
+                    self.updates += 1
+                    self.resync_sent = None
+                    self.over = self.state.over
+                else:
+                    reply += self.resync(now)
+            elif message['type'] == 'leave':
+                self.closed = self.over = True
+        return reply
+
+    def maintenance(self, now):
+        if now < self.next_ping:
+            return []
+        self.next_ping = now + PING_INTERVAL
+        return [(UNRELIABLE, protocol.encode({'type': 'ping', 'time': now}))]
+
+
+def run_bots(address, count, duration, seed=0, spectators=0, spectator_rate=0, spectator_bandwidth=0, bot=None):
+    # Collega count client su un solo socket e li fa giocare per duration secondi; le partite
+    # finite vengono sostituite da nuovi client. Con bot i client giocano con quel bot (bots.BOTS),
+    # altrimenti svoltano a caso. Con spectators si collegano anche altrettanti spettatori, dopo
+    # SPECTATOR_DELAY secondi perché ci siano partite da guardare.
+    # Restituisce gli aggiornamenti ricevuti da giocatori e spettatori.
+    rng = random.Random(seed)
+    socket = net.socket(net.AF_INET, net.SOCK_DGRAM)
+    socket.setsockopt(net.SOL_SOCKET, net.SO_RCVBUF, 1 << 22)
+    socket.connect(address)
+    socket.settimeout(MAINTENANCE_INTERVAL)
+
+    clients = {}  # ID temporaneo (hello) -> client
+    routes = {}  # ID di connessione dei pacchetti in arrivo, temporaneo o assegnato -> client
+
+    def add(make_client):
+        hello = new_connection(rng)
+        while hello in clients:
+            hello = new_connection(rng)
+        client = clients[hello] = routes[hello] = make_client(hello)
+        for data in client.packets([], time.perf_counter()):
+            socket.send(data)
+
+    def add_bot():
+        add(lambda hello: BotClient(hello, random.Random(hello), make_bot(bot, hello) if bot else None))
+
+    def add_spectator():
+        add(lambda hello: SpectatorClient(hello, 0, spectator_rate, spectator_bandwidth))
+
+    for _ in range(count):
+        add_bot()
+
+    updates = 0
+    start = time.perf_counter()
+    end = start + duration
+    next_maintenance = 0.0
+    spectators_added = spectators == 0
+    while time.perf_counter() < end:
+        try:
+            data = socket.recv(MAX_RECEIVE_SIZE)
+        except (TimeoutError, net.timeout):
+            data = None
+        now = time.perf_counter()
+        if data is not None:
+            client = routes.get(PACKET_HEADER.unpack_from(data)[0])
+            if client is not None:
+                accepted = client.connection is not None
+                reply = client.receive(data, now)
+                if not accepted and client.connection is not None:
+                    routes[client.connection] = client
+                if reply or client.due(now):
+                    for packet in client.packets(reply, now):
+                        socket.send(packet)
+        if not spectators_added and now - start >= SPECTATOR_DELAY:
+            spectators_added = True
+            for _ in range(spectators):
+                add_spectator()
+        if now >= next_maintenance:
+            next_maintenance = now + MAINTENANCE_INTERVAL
+            for hello, client in list(clients.items()):
+                messages = client.maintenance(now)
+                if messages or client.due(now):
+                    for packet in client.packets(messages, now):
+                        socket.send(packet)
+                if client.over or (client.last_update is not None and now - client.last_update > 2 * ROOM_LINGER):
+                    updates += client.updates
+                    del clients[hello]
+                    routes.pop(hello, None)
+                    routes.pop(client.connection, None)
+                    for packet in client.packets([(UNRELIABLE, protocol.encode({'type': 'leave'}))], now):
+                        socket.send(packet)
+                    if isinstance(client, BotClient):
+                        add_bot()
+                    else:
+                        add_spectator()
+    updates += sum(client.updates for client in clients.values())
+    socket.close()
+    return updates
+
+
+def watch(args):
+    # Guarda una partita del server e ne stampa l'andamento una volta al secondo
+    socket = net.socket(net.AF_INET, net.SOCK_DGRAM)
+    socket.connect((args.host if args.host != '0.0.0.0' else '127.0.0.1', args.port))
+    socket.settimeout(MAINTENANCE_INTERVAL)
+    spectator = SpectatorClient(new_connection(), args.room, args.rate, args.bandwidth)
+    for packet in spectator.packets([], time.perf_counter()):
+        socket.send(packet)
+
+    next_report = time.perf_counter() + 1.0
+    try:
+        while not spectator.over:
+            try:
+                data = socket.recv(MAX_RECEIVE_SIZE)
+            except (TimeoutError, net.timeout):
+                data = None
+            now = time.perf_counter()
+            reply = spectator.receive(data, now) if data is not None else []
+            reply += spectator.maintenance(now)
+            if reply or spectator.due(now):
+                for packet in spectator.packets(reply, now):
+                    socket.send(packet)
+            if spectator.last_update is not None and now - spectator.last_update > 2 * ROOM_LINGER:
+                logger.info('room=%s closed', spectator.room)
+                break
+            if now >= next_report and spectator.state is not None:
+                next_report = now + 1.0
+                state = spectator.state
+                logger.info('room=%s tick=%d alive=%d/%d scores=%s updates=%d resyncs=%d', spectator.room,
+                            state.tick, sum(snake.alive for snake in state.snakes), len(state.snakes),
+                            [snake.score for snake in state.snakes], spectator.updates, spectator.resyncs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if spectator.state is not None and spectator.over:
+            logger.info('room=%s %s tick=%d scores=%s', spectator.room,
+                        'over' if spectator.state.over else 'closed', spectator.state.tick,
+                        [snake.score for snake in spectator.state.snakes])
+        for packet in spectator.packets([(UNRELIABLE, protocol.encode({'type': 'leave'}))], time.perf_counter()):
+            socket.send(packet)
+        socket.close()
+
+
+def bench(args):
+    # Server in un processo a parte, client in questo: il tempo di CPU misurato è solo del server
+    results = Queue()
+    port = args.port
+    server = Process(target=serve_worker,
+                     args=('127.0.0.1', port, args.players, args.tick_rate, False, args.board, args.interest,
+                           args.duration + 1.0, results))
+    server.start()
+    time.sleep(0.5)
+    updates = run_bots(('127.0.0.1', port), args.rooms * args.players, args.duration, spectators=args.spectators,
+                       spectator_rate=args.rate, spectator_bandwidth=args.bandwidth, bot=args.bot)
+    stats = results.get()
+    server.join()
+
+    load = stats['cpu'] / stats['wall']  # Frazione di un core usata dal server
+    result = {
+        'time': round(time.time()),
+        'python': sys.version.split()[0],
+        'rooms': args.rooms,
+        'players': args.players,
+        'spectators': args.spectators,
+        'bot': args.bot,
+        'tick_rate': args.tick_rate,
+        'room_ticks': stats['room_ticks'],
+        'late_ticks': stats['late_ticks'],
+        'updates_received': updates,
+        'keyframes': stats['keyframes'],
+        'catch_ups': stats['catch_ups'],
+        'bytes_per_update': round(stats['bytes_out'] / max(1, stats['packets_out']), 1),
+        'server_load': round(load, 3),
+        'room_tick_us': round(stats['cpu'] / max(1, stats['room_ticks']) * 1e6, 1),
+        # Partite contemporanee che un core reggerebbe allo stesso costo per stanza
+        'matches_per_core': round(args.rooms / load) if load else None,
+    }
+    print(json.dumps(result))
+    if args.record:
+        with open(args.record, 'a', encoding='utf-8') as record:
+            record.write(json.dumps(result) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server dedicato di PySnake')
+    parser.add_argument('command', choices=['serve', 'bench', 'watch'])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--players', type=int, default=ROOM_PLAYERS, help='giocatori per stanza')
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE)
+    parser.add_argument('--board', type=board_size, help='campo LARGHEZZAxALTEZZA (predefinito: 64x48 con più '
+                                                             'di due giocatori)')
+    parser.add_argument('--interest', type=int, default=INTEREST_RADIUS,
+                        help='tutti contro tutti: celle visibili attorno alla testa, 0 per inviare tutto a tutti')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processi tra cui dividere le stanze (un client che cambia indirizzo deve ricollegarsi)')
+    parser.add_argument('--rooms', type=int, default=100, help='bench: partite contemporanee')
+    parser.add_argument('--duration', type=float, default=10.0, help='bench: secondi di misura')
+    parser.add_argument('--spectators', type=int, default=0, help='bench: spettatori da collegare')
+    parser.add_argument('--bot', help='bench: bot dei client (bots.BOTS o "modulo:Classe"), altrimenti svolte a caso')
+    parser.add_argument('--room', type=int, default=0, help='watch: stanza da guardare, 0 per una qualsiasi')
+    parser.add_argument('--rate', type=int, default=0, help='watch, bench: invii al secondo per spettatore, 0 a ogni tick')
+    parser.add_argument('--bandwidth', type=int, default=0, help='watch, bench: byte al secondo per spettatore, '
+                                                                 '0 senza limite')
+    parser.add_argument('--record', help='bench: file JSON lines a cui aggiungere il risultato')
+    args = parser.parse_args()
+    if not 2 <= args.players <= MAX_ROOM_PLAYERS:
+        parser.error(f'--players must be between 2 and {MAX_ROOM_PLAYERS}')
+    if args.bot:
+        make_bot(args.bot)  # Errore subito, prima di avviare il server, se il bot non esiste
+
+    logging.basicConfig(level=os.environ.get('PYSNAKE_LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.command == 'serve':
+        serve(args)
+    elif args.command == 'watch':
+        watch(args)
+    else:
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
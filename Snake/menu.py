@@ -0,0 +1,164 @@
+import pygame
+
+# Sistema di menu e schermate guidato dagli eventi. Ogni schermata viene ridisegnata solo
+# quando cambia qualcosa (selezione, testo, stato) e tra un evento e l'altro il programma
+# resta fermo in pygame.event.wait: un menu inattivo non consuma CPU.
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+WAIT_TIMEOUT = 250  # Millisecondi massimi di attesa di un evento prima di chiamare poll()
+
+NO_RESULT = object()
+
+_labels = {}
+
+
+def render_label(font, text, color):
+    # Le scritte dei menu vengono renderizzate una volta sola e poi riusate
+    key = (font, text, color)
+    label = _labels.get(key)
+    if label is None:
+        label = _labels[key] = font.render(text, True, color)
+    return label
+
+
+class Screen:
+    poll_interval = WAIT_TIMEOUT
+
+    def __init__(self):
+        self.dirty = True
+
+    def draw(self, surface):
+        pass
+
+    def handle(self, event):
+        # Gestisce un evento; restituisce il risultato della schermata o NO_RESULT per restare
+        return NO_RESULT
+
+    def poll(self):
+        # Chiamata a ogni risveglio, anche senza eventi (es. per controllare la rete)
+        return NO_RESULT
+
+    def run(self, surface):
+        self.dirty = True
+        while True:
+            if self.dirty:
+                self.draw(surface)
+                pygame.display.flip()
+                self.dirty = False
+
+            event = pygame.event.wait(self.poll_interval)
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                exit()
+            if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                self.dirty = True
+
+            result = NO_RESULT if event.type == pygame.NOEVENT else self.handle(event)
+            if result is NO_RESULT:
+                result = self.poll()
+            if result is not NO_RESULT:
+                return result
+
+
+class Menu(Screen):
+    # Elenco di voci selezionabili con le frecce; Invio restituisce la voce scelta
+    def __init__(self, items, background, font, selected_font, title=None, title_font=None, escape=NO_RESULT):
+        super().__init__()
+        self.items = items
+        self.background = background
+        self.font = font
+        self.selected_font = selected_font
+        self.title = title
+        self.title_font = title_font
+        self.escape = escape  # Risultato restituito premendo ESC (NO_RESULT: ESC ignorato)
+        self.selected = 0
+
+    def draw(self, surface):
+        # Disegna l'immagine di sfondo
+        surface.blit(self.background, (0, 0))
+        width, height = surface.get_size()
+
+        # Visualizza il titolo
+        if self.title is not None:
+            title_text = render_label(self.title_font, self.title, WHITE)
+            surface.blit(title_text, title_text.get_rect(center=(width // 2, height // 4)))
+
+        # Visualizza le opzioni del menu
+        for i, item in enumerate(self.items):
+            label = render_label(self.selected_font if i == self.selected else self.font, item, WHITE)
+            label_rect = label.get_rect(center=(width // 2, height // 2 + i * 50))
+            pygame.draw.rect(surface, BLACK, label_rect.inflate(20, 20))  # Disegna un rettangolo nero dietro il testo
+            surface.blit(label, label_rect)
+
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return NO_RESULT
+
+        if event.key == pygame.K_DOWN:
+            self.selected = (self.selected + 1) % len(self.items)
+            self.dirty = True
+        if event.key == pygame.K_UP:
+            self.selected = (self.selected - 1) % len(self.items)
+            self.dirty = True
+        if event.key == pygame.K_ESCAPE:
+            return self.escape
+        if event.key == pygame.K_RETURN:
+            return self.items[self.selected]
+        return NO_RESULT
+
+
+class MessageScreen(Screen):
+    # Righe di testo su sfondo nero; ESC restituisce escape, poll_result() viene controllata
+    # a ogni risveglio e termina la schermata quando restituisce qualcosa di diverso da NO_RESULT
+    def __init__(self, lines, font, escape, poll_result=None):
+        super().__init__()
+        self.lines = lines
+        self.font = font
+        self.escape = escape
+        self.poll_result = poll_result
+
+    def draw(self, surface):
+        surface.fill(BLACK)  # Pulisce lo schermo
+        for i, line in enumerate(self.lines):
+            surface.blit(render_label(self.font, line, WHITE), (100, 250 + i * 50))
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            return self.escape
+        return NO_RESULT
+
+    def poll(self):
+        return NO_RESULT if self.poll_result is None else self.poll_result()
+
+
+class TextInputScreen(MessageScreen):
+    # Campo di testo sulla prima riga: Invio restituisce il testo inserito
+    def __init__(self, prompt, hint, font, escape, valid_chars, max_length):
+        super().__init__([prompt, hint], font, escape)
+        self.prompt = prompt
+        self.valid_chars = valid_chars
+        self.max_length = max_length
+        self.text = ""
+
+    def draw(self, surface):
+        # Il testo cambia a ogni tasto, quindi non passa dalla cache delle scritte
+        surface.fill(BLACK)
+        surface.blit(self.font.render(self.prompt + self.text, True, WHITE), (100, 250))
+        surface.blit(render_label(self.font, self.lines[1], WHITE), (100, 300))
+
+    def handle(self, event):
+        if event.type != pygame.KEYDOWN:
+            return NO_RESULT
+
+        if event.key == pygame.K_RETURN:
+            return self.text
+        if event.key == pygame.K_ESCAPE:
+            return self.escape
+        if event.key == pygame.K_BACKSPACE:
+            self.text = self.text[:-1]  # Cancella l'ultimo carattere
+            self.dirty = True
+        elif len(self.text) < self.max_length and event.unicode and event.unicode in self.valid_chars:
+            self.text += event.unicode  # Aggiungi il carattere digitato
+            self.dirty = True
+        return NO_RESULT
@@ -0,0 +1,378 @@
+import json
+import logging
+import os
+import selectors
+import socket as net
+import struct
+import time
+
+from collections import deque
+from threading import Lock, Thread
+from queue import Queue, Empty
+
+import protocol
+from framing import MAX_RECEIVE_SIZE, PACKET_HEADER, UNRELIABLE, PacketReader, PacketWriter, new_connection
+from reliable import ReliableChannel
+from telemetry import LatencyStats, NetworkMetrics, RateLimitedLog
+
+logger = logging.getLogger(__name__)
+
+# Con PYSNAKE_NET_METRICS=percorso le metriche della rete vengono aggiunte al file come JSON lines
+# ogni METRICS_INTERVAL secondi e alla chiusura; a runtime si leggono con ServerTask.metrics()
+METRICS_PATH = os.environ.get('PYSNAKE_NET_METRICS')
+
+
+class StateMailbox:
+    # Casella dello stato più recente per ogni chiave (es. il peer), al posto di una coda che
+    # cresce quando il gioco rallenta. Un messaggio "keyframe" (istantanea completa) sostituisce
+    # tutto ciò che era in attesa per la sua chiave; gli altri (delta) si accodano dietro
+    # all'ultimo keyframe, al massimo limit, perché servono tutti per ricostruire lo stato.
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = Lock()
+        self.messages = {}
+        self.overwritten = 0  # Messaggi sostituiti da un keyframe prima di essere letti
+        self.dropped = 0  # Delta scartati per aver superato il limite
+
+    def put(self, key, message, keyframe):
+        with self.lock:
+            pending = self.messages.get(key)
+            if pending is None or keyframe:
+                if pending:
+                    self.overwritten += len(pending)
+                self.messages[key] = [message]
+                return
+
+            if len(pending) >= self.limit:
+                del pending[0]
+                self.dropped += 1
+            pending.append(message)
+
+    def take(self):
+        # Restituisce e svuota i messaggi in attesa, chiave -> lista in ordine di arrivo
+        with self.lock:
+            messages, self.messages = self.messages, {}
+        return messages
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(pending) for pending in self.messages.values())
+
+
+class EventQueue:
+    # Piccola coda limitata per gli eventi che vanno elaborati in ordine (cibo e bombe, resync).
+    # Se il gioco non la svuota in tempo si perdono i più vecchi, contati in dropped.
+    def __init__(self, size):
+        self.lock = Lock()
+        self.events = deque(maxlen=size)
+        self.dropped = 0
+
+    def put(self, event):
+        with self.lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+
+    def drain(self):
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def __len__(self):
+        return len(self.events)
+
+
+class ServerTask:
+    GAME_PORT = 7777
+    SELECT_TIMEOUT = 1.0  # Secondi massimi di attesa, solo come rete di sicurezza
+    ACK_DELAY = 0.02  # Attesa massima prima di confermare un messaggio affidabile con un pacchetto vuoto
+    MAILBOX_LIMIT = 2 * protocol.SNAPSHOT_INTERVAL  # Dopo un'istantanea i delta più vecchi non servono più
+    EVENT_QUEUE_SIZE = 16
+    PING_INTERVAL = 1.0  # Secondi tra due ping per misurare RTT e jitter
+    METRICS_INTERVAL = 5.0
+
+    def __init__(self):
+        self.address = net.gethostbyname(net.gethostname())
+        self.client_address = None
+        self.thread = Thread(target=self.run)
+
+        socket = net.socket(net.AF_INET, net.SOCK_DGRAM)
+        socket.bind((self.address, self.GAME_PORT))
+        socket.setblocking(False)
+        self.socket = socket
+
+        # Il thread di rete dorme in select() finché il socket non è leggibile o finché send()
+        # non lo sveglia scrivendo un byte su questa coppia di socket
+        self.wakeup_reader, self.wakeup_writer = net.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ, self.on_readable)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self.on_wakeup)
+
+        self.is_running = False
+        self.is_connected = False
+
+        self.writer = None  # Creati a ogni start(), vedi framing.py e reliable.py
+        self.reader = None
+        self.channel = None
+        self.ack_due = None  # Istante entro cui confermare i messaggi affidabili ricevuti
+
+        # Messaggi ricevuti per il gioco: lo stato più recente dei serpenti e gli eventi in ordine
+        self.updates = StateMailbox(self.MAILBOX_LIMIT)
+        self.events = EventQueue(self.EVENT_QUEUE_SIZE)
+        self.server_queue = Queue()
+        self.send_latency = LatencyStats()  # Tempo tra send() e l'invio effettivo sul socket
+        self.telemetry = NetworkMetrics()
+        self.log = RateLimitedLog(logger)
+        self.next_ping = 0.0
+        self.next_dump = 0.0
+
+    def start(self):
+        self.is_running = True
+
+        # Ogni avvio è una nuova connessione: l'altro peer riazzera le sue sequenze in ricezione
+        self.writer = PacketWriter(new_connection())
+        self.reader = PacketReader()
+        self.channel = ReliableChannel()
+        self.ack_due = None
+        self.updates = StateMailbox(self.MAILBOX_LIMIT)
+        self.events = EventQueue(self.EVENT_QUEUE_SIZE)
+        self.telemetry = NetworkMetrics()
+        self.next_ping = 0.0
+        self.next_dump = time.perf_counter() + self.METRICS_INTERVAL
+
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+
+    def stop(self):
+        if self.is_running:
+            self.is_running = False
+            self.is_connected = False
+            self.wake()
+            self.thread.join()
+            if METRICS_PATH:
+                self.dump_metrics(METRICS_PATH)
+
+    def connect(self, address):
+        if self.is_connected:
+            return
+
+        self.client_address = address
+        self.send({
+            'type': 'identify'
+        })
+
+    def wake(self):
+        try:
+            self.wakeup_writer.send(b'\0')
+        except BlockingIOError:
+            pass  # Il buffer è pieno: il thread ha già un risveglio in sospeso
+
+    def run(self):
+        while self.is_running:
+            for key, _ in self.selector.select(self.timeout()):
+                key.data()
+            if self.timeout() == 0:
+                self.flush()  # Ritrasmissioni, ack o ping scaduti
+            if METRICS_PATH and time.perf_counter() >= self.next_dump:
+                self.dump_metrics(METRICS_PATH)
+                self.next_dump = time.perf_counter() + self.METRICS_INTERVAL
+
+    def timeout(self):
+        now = time.perf_counter()
+        timeout = self.SELECT_TIMEOUT
+        if self.client_address is not None:
+            deadline = self.channel.next_deadline(now)
+            if deadline is not None:
+                timeout = min(timeout, deadline)
+            timeout = min(timeout, max(0.0, self.next_ping - now))
+        if self.ack_due is not None:
+            timeout = min(timeout, max(0.0, self.ack_due - now))
+        return timeout
+
+    def on_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.flush()
+
+    def on_readable(self):
+        # Svuota tutti i datagrammi in attesa in un solo passaggio
+        while True:
+            data, address = self.receive()
+            if data is None:
+                return
+
+            now = time.perf_counter()
+            self.telemetry.received(len(data), now)
+            connection = self.reader.connection
+            try:
+                # Un ID nuovo vale solo con identify (l'altro peer ha riavviato la partita): altrimenti è un
+                # pacchetto estraneo, che azzererebbe il canale affidabile della connessione attuale
+                new = PACKET_HEADER.unpack_from(data)[0] != connection
+                if connection is not None and new and not self.identifies(data):
+                    raise ValueError('unknown connection')
+                ack, ack_bits, packed = self.reader.unpack(data)
+            except (struct.error, ValueError) as error:
+                self.discard(address, error)
+                continue
+
+            if self.reader.connection != connection:
+                self.channel.reset_receiver()
+            self.channel.acknowledge(ack, ack_bits, now)
+
+            payloads = []
+            for reliable_id, payload in packed:
+                if reliable_id is UNRELIABLE:
+                    payloads.append(payload)
+                else:
+                    payloads.extend(self.channel.receive(reliable_id, payload))
+                    if self.ack_due is None:
+                        self.ack_due = now + self.ACK_DELAY
+
+            try:
+                messages = [protocol.decode(payload) for payload in payloads]
+            except ValueError as error:
+                self.discard(address, error)
+                continue
+            if payloads:
+                self.telemetry.decode.add((time.perf_counter() - now) / len(payloads))
+
+            for message in messages:
+                self.log.log(logging.DEBUG, 'received', 'received type=%s peer=%s', message['type'], address[0])
+                match message['type']:
+                    case 'identify':
+                        self.client_address = address[0]
+                        self.is_connected = True
+
+                    case 'ping':
+                        # Risposta immediata dal thread di rete, senza passare dal gioco
+                        if self.client_address is not None:
+                            pong = protocol.encode({'type': 'pong', 'time': message['time']})
+                            self.send_now([(UNRELIABLE, pong)], time.perf_counter())
+
+                    case 'pong':
+                        self.telemetry.pong(time.perf_counter() - message['time'])
+
+                    case 'update' | 'snapshot':
+                        self.updates.put(address, message, message['type'] == 'snapshot')
+
+                    case 'checksum':
+                        self.updates.put('checksum', message, True)  # Conta solo l'ultimo
+
+                    case 'inputs':
+                        # Ogni messaggio ripete tutti gli input non ancora confermati: basta l'ultimo
+                        self.updates.put(address, message, True)
+
+                    case _:
+                        self.events.put(message)
+
+    @staticmethod
+    def identifies(data):
+        # Vero se il pacchetto contiene identify; lo si legge a parte, senza toccare self.reader
+        _, _, packed = PacketReader().unpack(data)
+        return any(protocol.decode(payload)['type'] == 'identify' for _, payload in packed)
+
+    def flush(self):
+        # Invia tutti i messaggi accodati da send(), raggruppati nel minor numero di datagrammi,
+        # insieme ai messaggi affidabili ancora da confermare e scaduti
+        unreliable = []
+        queued = []
+        while True:
+            try:
+                queued_at, batch = self.server_queue.get(False)
+            except Empty:
+                break
+
+            started = time.perf_counter()
+            for message in batch:
+                self.log.log(logging.DEBUG, 'sent', 'sent type=%s peer=%s', message['type'], self.client_address)
+                if protocol.is_reliable(message):
+                    self.channel.queue(protocol.encode(message))
+                else:
+                    unreliable.append((UNRELIABLE, protocol.encode(message)))
+            if batch:
+                self.telemetry.encode.add((time.perf_counter() - started) / len(batch))
+            queued.append(queued_at)
+
+        if self.client_address is None:
+            return
+
+        now = time.perf_counter()
+        if now >= self.next_ping:
+            unreliable.append((UNRELIABLE, protocol.encode({'type': 'ping', 'time': now})))
+            self.next_ping = now + self.PING_INTERVAL
+        messages = self.channel.due(now) + unreliable
+        if messages or self.ack_due is not None:
+            self.send_now(messages, now)
+            sent_at = time.perf_counter()
+            for queued_at in queued:
+                self.send_latency.add(sent_at - queued_at)
+
+    def receive(self):
+        # Un datagramma è sempre un pacchetto completo: i messaggi grandi sono frammentati da framing.py
+        try:
+            data, address = self.socket.recvfrom(MAX_RECEIVE_SIZE)
+        except BlockingIOError:
+            return None, None
+
+        return data, address
+
+    def send(self, *messages):
+        # Accoda i messaggi e sveglia il thread di rete, che li invierà subito. I messaggi passati
+        # nella stessa chiamata (es. tutto ciò che produce un tick) partono nello stesso datagramma.
+        if not self.is_running:
+            return
+
+        self.server_queue.put((time.perf_counter(), messages))
+        self.wake()
+
+    def send_now(self, messages, now):
+        # Ogni pacchetto porta anche gli ack di quelli ricevuti; senza messaggi si invia solo l'ack
+        packets = self.writer.pack(messages, self.reader.ack) if messages else [self.writer.empty(self.reader.ack)]
+        for sequence, ids, data in packets:
+            self.channel.sent(sequence, ids, now)
+            self.socket.sendto(data, (self.client_address, self.GAME_PORT))
+            self.telemetry.sent(len(data), now)
+        self.ack_due = None
+
+    def discard(self, address, error):
+        self.telemetry.discarded += 1
+        self.log.log(logging.WARNING, 'discarded', 'discarded datagram peer=%s error=%s', address[0], error)
+
+    def metrics(self):
+        # Fotografia delle metriche di rete, leggibile dal gioco in qualsiasi momento
+        metrics = self.telemetry.snapshot(time.perf_counter())
+        reader = self.reader
+        if reader is not None:
+            # I pacchetti arrivati in ritardo erano già stati contati come persi
+            missing = reader.lost - reader.late
+            expected = reader.received + missing
+            metrics.update(
+                loss=round(missing / expected, 4) if expected > 0 else 0.0,
+                duplicates=reader.duplicates,
+                late=reader.late,
+                rtt_ack_ms=round((self.channel.rtt or 0.0) * 1000, 2),
+                resent=self.channel.resent,
+                unacked=len(self.channel.unacked),
+            )
+        metrics.update(
+            send_queue=self.server_queue.qsize(),
+            send_latency_ms=round(self.send_latency.mean * 1000, 3),
+            update_queue=len(self.updates),
+            updates_overwritten=self.updates.overwritten,
+            updates_dropped=self.updates.dropped,
+            event_queue=len(self.events),
+            events_dropped=self.events.dropped,
+        )
+        return metrics
+
+    def dump_metrics(self, path):
+        # Aggiunge una riga JSON con le metriche correnti
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'time': round(time.time(), 3), **self.metrics()}) + '\n')
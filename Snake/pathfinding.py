@@ -0,0 +1,257 @@
+import heapq
+import time
+import weakref
+from collections import deque
+
+import numpy as np
+
+from engine import BOMB, DIRECTION_OFFSETS
+
+# Campi di distanza per i bot: per ogni cella, quanti passi servono per arrivare alla mela
+# sulla griglia toroidale (teletrasporto ai bordi, come nella tabella dei vicini del motore)
+# evitando bombe e segmenti di serpente. È una BFS all'indietro dalla mela: una sola vale per
+# tutte le teste e tutti i serpenti, e scendere di un passo alla volta segue un percorso più breve.
+#
+# Il campo non si ricalcola a ogni tick. Le celle bloccate si confrontano con quelle del tick
+# precedente (in NumPy, senza eventi: vale anche dopo un rollback o un pacchetto dalla rete) e si
+# ripara solo la parte che cambia: una cella liberata abbassa le distanze attorno a sé, una cella
+# bloccata invalida solo le celle che passavano per forza da lì. Da zero si riparte quando la mela
+# si sposta o quando la riparazione toccherebbe troppe celle; sui campi grandi la BFS completa è un
+# flood fill in NumPy, un livello di distanza alla volta, che può fermarsi a una scadenza e
+# riprendere al tick dopo. Nel frattempo first_step() trova la strada con A* dalla sola testa.
+#
+# Un campo per partita, condiviso da tutti i bot che giocano sullo stesso stato.
+
+NUMPY_MIN_CELLS = 1024  # Sotto questa dimensione la BFS in Python puro costa meno delle chiamate NumPy
+MAX_REPAIR = 8  # Una riparazione può toccare al massimo 1/MAX_REPAIR delle celle, poi si riparte da zero
+
+
+class DistanceField:
+    def __init__(self, state):
+        self.cells = state.width * state.height
+        self.unreachable = self.cells  # Distanza delle celle da cui la mela non si raggiunge
+        self.shape = (state.height, state.width)
+        self.neighbours = state.neighbours
+        self.table = None  # Gli stessi vicini in NumPy, per flood_fill
+        self.limit = max(64, self.cells // MAX_REPAIR)
+        self.target = None
+        self.blocked = None
+        self.walls = b''  # Le stesse celle bloccate, come byte: più veloci da leggere una alla volta
+        self.distances = None
+        self.filling = None  # BFS da zero in corso (flood_fill)
+        self.rebuilds = 0
+        self.repairs = 0
+
+    @property
+    def ready(self):
+        return self.distances is not None
+
+    def update(self, state, deadline=None):
+        # Allinea il campo allo stato. Sui campi grandi la BFS da zero si ferma a deadline (tempo di
+        # perf_counter) e riprende alla chiamata successiva: finché non finisce restituisce False
+        blocked = (np.frombuffer(state.grid, dtype=np.uint8) == BOMB) | (np.frombuffer(state.counts, dtype=np.uint8) > 0)
+        if state.food is not None:
+            blocked[state.food] = False  # La mela resta la sorgente anche se un serpente ci passa sopra
+        self.walls = blocked.tobytes()
+        if state.food != self.target or (self.distances is None and self.filling is None):
+            self.target = state.food
+            self.restart(blocked)
+        if self.filling is not None and not self.fill(deadline):
+            return False
+
+        # Il campo vale per le celle bloccate in self.blocked: si ripara la differenza con quelle di adesso
+        changed = np.flatnonzero(blocked != self.blocked)
+        if len(changed) > self.limit or (len(changed) and not self.repair(changed.tolist(), deadline)):
+            self.restart(blocked)
+            return self.filling is None or self.fill(deadline)
+        self.blocked = blocked
+        return True
+
+    def restart(self, blocked):
+        self.rebuilds += 1
+        self.blocked = blocked
+        self.distances = None
+        self.filling = None
+        if self.target is None:
+            self.distances = [self.unreachable] * self.cells
+        elif self.cells >= NUMPY_MIN_CELLS:
+            self.filling = self.flood_fill(blocked)
+        else:
+            self.distances = self.bfs()
+
+    def fill(self, deadline):
+        for _ in self.filling:
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+        self.filling = None
+        return True
+
+    def bfs(self):
+        distances = [self.unreachable] * self.cells
+        distances[self.target] = 0
+        neighbours, walls = self.neighbours, self.walls
+        queue = deque([self.target])
+        while queue:
+            cell = queue.popleft()
+            distance = distances[cell] + 1
+            for neighbour in neighbours[cell * 4:cell * 4 + 4]:
+                if distances[neighbour] > distance and not walls[neighbour]:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+        return distances
+
+    def flood_fill(self, blocked):
+        # BFS per livelli: a ogni passo tutta la frontiera si espande insieme. Generatore, un livello
+        # per passo; alla fine imposta distances
+        if self.table is None:
+            # Prima BFS: la tabella dei vicini si calcola qui, come un passo a sé, e non copiando la
+            # lista del motore (sui campi grandi la copia da sola supera il tempo di una mossa)
+            cells = np.arange(self.cells, dtype=np.int32).reshape(self.shape)
+            self.table = np.stack([np.roll(cells, (-dy, -dx), axis=(0, 1)) for dx, dy in DIRECTION_OFFSETS],
+                                  axis=2).reshape(self.cells, 4)
+            yield
+        distances = np.full(self.cells, self.unreachable, dtype=np.int32)
+        open_cells = ~blocked
+        distances[self.target] = 0
+        open_cells[self.target] = False
+        slots = np.empty(self.cells, dtype=np.int32)  # Per togliere i doppioni senza ordinare (np.unique)
+        frontier = np.array([self.target], dtype=np.int32)
+        distance = 0
+        while frontier.size:
+            distance += 1
+            frontier = self.table[frontier].ravel()
+            frontier = frontier[open_cells[frontier]]
+            # Una cella raggiunta da più vicini resta una volta sola: quella scritta per ultima in slots
+            order = np.arange(frontier.size, dtype=np.int32)
+            slots[frontier] = order
+            frontier = frontier[slots[frontier] == order]
+            open_cells[frontier] = False
+            distances[frontier] = distance
+            yield
+        self.distances = distances.tolist()
+
+    def repair(self, changed, deadline=None):
+        # Aggiorna solo le distanze che cambiano; False se si toccano più di limit celle o se passa deadline
+        distances, neighbours, walls = self.distances, self.neighbours, self.walls
+        unreachable = self.unreachable
+        self.repairs += 1
+
+        # Celle bloccate adesso, più quelle che arrivavano alla mela solo passando da loro: si
+        # visitano in ordine di distanza, così i vicini più vicini alla mela sono già decisi
+        heap = [(distances[cell], cell) for cell in changed if walls[cell] and distances[cell] < unreachable]
+        heapq.heapify(heap)
+        lost = {cell for _, cell in heap}
+        while heap:
+            distance, cell = heapq.heappop(heap)
+            for neighbour in neighbours[cell * 4:cell * 4 + 4]:
+                if distances[neighbour] != distance + 1 or neighbour in lost:
+                    continue
+                for other in neighbours[neighbour * 4:neighbour * 4 + 4]:
+                    if distances[other] == distance and other not in lost:
+                        break  # Ha un altro percorso altrettanto breve
+                else:
+                    lost.add(neighbour)
+                    if len(lost) > self.limit or (deadline is not None and len(lost) % 64 == 0
+                                                  and time.perf_counter() > deadline):
+                        return False
+                    heapq.heappush(heap, (distance + 1, neighbour))
+        for cell in lost:
+            distances[cell] = unreachable
+
+        # Nuove distanze provvisorie delle celle perse e di quelle liberate, dai vicini ancora validi,
+        # poi propagate come in Dijkstra (tutti i passi costano 1)
+        for seeded, cell in enumerate(lost.union(changed), 1):
+            if deadline is not None and seeded % 64 == 0 and time.perf_counter() > deadline:
+                return False
+            if walls[cell]:
+                distances[cell] = unreachable
+                continue
+            distance = min(distances[neighbour] for neighbour in neighbours[cell * 4:cell * 4 + 4]) + 1
+            if distance < distances[cell]:
+                distances[cell] = distance
+                heap.append((distance, cell))
+        heapq.heapify(heap)
+        visited = 0
+        while heap:
+            distance, cell = heapq.heappop(heap)
+            if distance > distances[cell]:
+                continue
+            visited += 1
+            if visited > self.limit or (deadline is not None and visited % 64 == 0 and time.perf_counter() > deadline):
+                return False
+            distance += 1
+            for neighbour in neighbours[cell * 4:cell * 4 + 4]:
+                if distances[neighbour] > distance and not walls[neighbour]:
+                    distances[neighbour] = distance
+                    heapq.heappush(heap, (distance, neighbour))
+        return True
+
+    def space(self, start, needed, deadline=None):
+        # Celle raggiungibili da start senza attraversare ostacoli, contate fino a needed (o fin dove
+        # si arriva prima di deadline)
+        neighbours, walls = self.neighbours, self.walls
+        seen = {start}
+        queue = deque([start])
+        visited = 0
+        while queue and len(seen) < needed:
+            visited += 1
+            if deadline is not None and visited % 64 == 0 and time.perf_counter() > deadline:
+                break
+            cell = queue.popleft()
+            for neighbour in neighbours[cell * 4:cell * 4 + 4]:
+                if neighbour not in seen and not walls[neighbour]:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return len(seen)
+
+
+def first_step(state, walls, start, goal, deadline=None):
+    # A* da start a goal con la distanza toroidale come stima: la prima cella del percorso più
+    # breve, o None se goal non si raggiunge o se passa deadline prima di trovarlo
+    if goal is None or goal == start:
+        return None
+    width, height = state.width, state.height
+    goal_y, goal_x = divmod(goal, width)
+    neighbours = state.neighbours
+
+    def estimate(cell):
+        y, x = divmod(cell, width)
+        dx = abs(x - goal_x)
+        dy = abs(y - goal_y)
+        return min(dx, width - dx) + min(dy, height - dy)
+
+    parents = {start: None}
+    costs = {start: 0}
+    heap = [(estimate(start), 0, start)]  # A parità di stima prima le celle più lontane da start
+    expanded = 0
+    while heap:
+        _, cost, cell = heapq.heappop(heap)
+        cost = -cost
+        if cell == goal:
+            while parents[cell] != start:
+                cell = parents[cell]
+            return cell
+        if cost > costs[cell]:
+            continue
+        expanded += 1
+        if deadline is not None and expanded % 64 == 0 and time.perf_counter() > deadline:
+            return None
+        cost += 1
+        for neighbour in neighbours[cell * 4:cell * 4 + 4]:
+            if not walls[neighbour] and cost < costs.get(neighbour, cost + 1):
+                costs[neighbour] = cost
+                parents[neighbour] = cell
+                heapq.heappush(heap, (cost + estimate(neighbour), -cost, neighbour))
+    return None
+
+
+_fields = weakref.WeakKeyDictionary()
+
+
+def distance_field(state, deadline=None):
+    # Campo della partita, aggiornato allo stato attuale (vedi DistanceField.update per deadline)
+    field = _fields.get(state)
+    if field is None:
+        field = _fields[state] = DistanceField(state)
+    field.update(state, deadline)
+    return field
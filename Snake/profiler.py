@@ -0,0 +1,134 @@
+import json
+import os
+import time
+from collections import deque
+
+import pygame
+
+# Profilazione del loop di gioco senza profiler esterni. Il frame viene diviso in fasi (input,
+# rete, simulazione, disegno, attesa) con mark(fase), che somma il tempo trascorso dal mark
+# precedente; per ogni fase si tengono gli ultimi PROFILE_WINDOW frame e se ne calcolano p50,
+# p95 e p99. I tempi si vedono in un riquadro sullo schermo (tasto F3) e, con la variabile
+# d'ambiente PYSNAKE_PROFILE=percorso, si salvano un frame per riga in CSV o, se il file finisce
+# con .jsonl, in JSON lines. Quando è spento ogni chiamata esce subito.
+
+PROFILE_PATH = os.environ.get('PYSNAKE_PROFILE')
+PROFILE_WINDOW = 300  # Frame considerati per i percentili
+OVERLAY_REFRESH = 0.25  # Secondi tra due aggiornamenti del riquadro: il testo costa più dei mark
+OVERLAY_COLOR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0)
+
+
+def percentile(values, fraction):
+    # Percentile nearest-rank di una lista già ordinata
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class FrameProfiler:
+    def __init__(self, path=PROFILE_PATH, window=PROFILE_WINDOW):
+        self.window = window
+        self.samples = {}  # Fase -> durate degli ultimi frame, in secondi
+        self.current = {}
+        self.start = self.last = 0.0
+        self.frames = 0
+
+        self.visible = False
+        self.surface = None
+        self.refreshed = 0.0
+
+        self.file = None
+        self.writer = None
+        self.columns = None
+        if path:
+            self.file = open(path, 'w', encoding='utf-8')
+            self.writer = self.write_json if path.endswith('.jsonl') else self.write_csv
+
+    @property
+    def enabled(self):
+        return self.visible or self.file is not None
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.surface = None
+
+    def begin(self):
+        if not self.enabled:
+            return
+        self.start = self.last = time.perf_counter()
+        self.current = {}
+
+    def mark(self, phase):
+        # Attribuisce a phase il tempo dal mark precedente
+        if not self.enabled or not self.start:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def end(self):
+        if not self.enabled or not self.start:
+            return
+        current = self.current
+        current['total'] = self.last - self.start
+        self.start = 0.0
+        self.frames += 1
+        for phase, duration in current.items():
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = deque(maxlen=self.window)
+            samples.append(duration)
+        if self.writer is not None:
+            self.writer(current)
+
+    def write_csv(self, current):
+        # Le colonne sono le fasi del primo frame; una fase mai vista lascia la cella vuota
+        if self.columns is None:
+            self.columns = list(current)
+            self.file.write(','.join(['frame', *self.columns]) + '\n')
+        values = (f'{current[phase] * 1000:.3f}' if phase in current else '' for phase in self.columns)
+        self.file.write(','.join([str(self.frames), *values]) + '\n')
+
+    def write_json(self, current):
+        row = {'frame': self.frames}
+        row.update((phase, round(duration * 1000, 3)) for phase, duration in current.items())
+        self.file.write(json.dumps(row) + '\n')
+
+    def percentiles(self, phase):
+        # (p50, p95, p99) in secondi sugli ultimi frame
+        values = sorted(self.samples.get(phase, ()))
+        return percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)
+
+    def report(self):
+        lines = [f'{"ms":<10}{"p50":>7}{"p95":>7}{"p99":>7}']
+        for phase in self.samples:
+            p50, p95, p99 = self.percentiles(phase)
+            lines.append(f'{phase:<10}{p50 * 1000:7.2f}{p95 * 1000:7.2f}{p99 * 1000:7.2f}')
+        return lines
+
+    def overlay(self, font, position, details=None):
+        # Sprite (superficie, posizione) del riquadro, da disegnare sopra la scena; la superficie
+        # resta la stessa tra un aggiornamento e l'altro, così il renderer non la ridisegna.
+        # details, se c'è, restituisce altre righe da mostrare sotto i tempi (es. la rete).
+        if not self.visible:
+            return []
+        now = time.perf_counter()
+        if self.surface is None or now - self.refreshed >= OVERLAY_REFRESH:
+            report = self.report() + (details() if details is not None else [])
+            lines = [font.render(line, True, OVERLAY_COLOR, OVERLAY_BACKGROUND) for line in report]
+            width = max(line.get_width() for line in lines)
+            height = sum(line.get_height() for line in lines)
+            self.surface = pygame.Surface((width, height))
+            self.surface.fill(OVERLAY_BACKGROUND)
+            y = 0
+            for line in lines:
+                self.surface.blit(line, (0, y))
+                y += line.get_height()
+            self.refreshed = now
+        x, y = position
+        return [(self.surface, (x, y - self.surface.get_height()))]
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
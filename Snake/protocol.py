@@ -0,0 +1,573 @@
+import struct
+import sys
+import zlib
+from array import array
+
+from engine import DIRECTIONS, advance_snake, clear_snake, place_snake, set_food, set_obstacles
+
+# Protocollo binario di PySnake. Ogni datagramma inizia con versione e tipo del messaggio;
+# le celle viaggiano come indici a 16 bit. Il serpente viene trasmesso come delta (nuova testa
+# più un flag "è cresciuto"), con un'istantanea completa solo all'inizio, periodicamente o
+# quando il destinatario ha perso un delta. Tutti i campi sono in network byte order.
+#
+# Con il server dedicato (match_server.py) i client entrano in una stanza con join e ricevono a
+# ogni tick lo stato di tutti i serpenti della stanza (room_update: nuova testa e flag di ognuno,
+# più il cibo), con un'istantanea completa (room_snapshot) periodica o su richiesta (resync).
+# Nelle stanze tutti contro tutti ogni giocatore riceve solo i serpenti vicini (area_update, vedi
+# interest.py): il delta di quelli che vedeva già, il corpo intero di quelli appena entrati nella
+# sua area e l'indice di quelli usciti. I record dei singoli serpenti si codificano una volta per
+# tick (AreaRecords) e ogni messaggio li unisce; periodicamente o su richiesta il messaggio è
+# completo (AREA_COMPLETE) e contiene il corpo intero di tutti i serpenti visibili.
+# Gli spettatori (spectate) ricevono joined con indice SPECTATOR, poi room_snapshot e room_update
+# di tutta la stanza come i giocatori delle partite a due (vedi broadcast.py), e infine leave
+# quando la stanza chiude, dopo l'ultima istantanea.
+# Prima di tutto questo il client manda hello in pacchetti con un ID di connessione scelto da lui, e
+# il server risponde con welcome sullo stesso ID: da lì in poi il client usa l'ID che il server gli ha
+# assegnato (vedi match_server.py).
+
+PROTOCOL_VERSION = 1
+
+IDENTIFY = 1
+UPDATE = 2
+SNAPSHOT = 3
+EXTRA = 4
+RESYNC = 5
+CHECKSUM = 6
+START = 7
+INPUTS = 8
+PING = 9
+PONG = 10
+JOIN = 11
+JOINED = 12
+LEAVE = 13
+ROOM_UPDATE = 14
+ROOM_SNAPSHOT = 15
+AREA_UPDATE = 16
+SPECTATE = 17
+HELLO = 18
+WELCOME = 19
+
+MESSAGE_TYPES = {IDENTIFY: 'identify', UPDATE: 'update', SNAPSHOT: 'snapshot', EXTRA: 'extra', RESYNC: 'resync',
+                 CHECKSUM: 'checksum', START: 'start', INPUTS: 'inputs', PING: 'ping', PONG: 'pong',
+                 JOIN: 'join', JOINED: 'joined', LEAVE: 'leave', ROOM_UPDATE: 'room_update',
+                 ROOM_SNAPSHOT: 'room_snapshot', AREA_UPDATE: 'area_update',
+                 SPECTATE: 'spectate', HELLO: 'hello', WELCOME: 'welcome'}
+MESSAGE_CODES = {name: code for code, name in MESSAGE_TYPES.items()}
+
+# Messaggi inviati sul canale affidabile (reliable.py): gli altri possono andare persi
+RELIABLE_TYPES = {'identify', 'extra', 'resync', 'start', 'join', 'joined', 'leave', 'spectate'}
+
+NO_CELL = 0xFFFF
+NO_DIRECTION = 0xFF
+SNAPSHOT_INTERVAL = 10  # Tick tra due istantanee complete, per recuperare i delta persi
+CHECKSUM_INTERVAL = 30  # Tick tra due checksum di cibo e bombe inviati dall'host
+
+FLAG_RUNNING = 1
+FLAG_GREW = 2
+FLAG_MOVED = 4  # Il serpente si è mosso in questo tick (era vivo)
+AREA_COMPLETE = 1  # area_update con tutti i serpenti visibili, da applicare anche dopo delta persi
+
+HEADER = struct.Struct('!BB')  # Versione, tipo
+UPDATE_BODY = struct.Struct('!IHBBH')  # Tick, testa, flag, direzione, punteggio
+SNAPSHOT_BODY = struct.Struct('!IBBHH')  # Tick, flag, direzione, punteggio, lunghezza
+EXTRA_BODY = struct.Struct('!HH')  # Cibo, numero di bombe
+CHECKSUM_BODY = struct.Struct('!I')
+START_BODY = struct.Struct('!I')  # Seed della partita in lockstep
+INPUTS_BODY = struct.Struct('!IIBB')  # Ultimo tick, ultimo tick confermato dell'altro peer, flag, numero di input
+PING_BODY = struct.Struct('!d')  # Istante di invio secondo chi manda il ping, rimandato com'è nel pong
+JOIN_BODY = struct.Struct('!H')  # Stanza richiesta, 0 per una qualsiasi
+JOINED_BODY = struct.Struct('!HBBIHHB')  # Stanza, indice del proprio serpente, giocatori, tick, larghezza, altezza, flag
+ROOM_UPDATE_BODY = struct.Struct('!IHB')  # Tick, cibo, numero di serpenti
+ROOM_SNAKE = struct.Struct('!HBBH')  # Testa, direzione, flag, punteggio
+ROOM_SNAPSHOT_BODY = struct.Struct('!IHBH')  # Tick, cibo, numero di serpenti, numero di bombe
+ROOM_SNAPSHOT_SNAKE = struct.Struct('!BBHH')  # Direzione, flag, punteggio, lunghezza
+AREA_BODY = struct.Struct('!IHBBBB')  # Tick, cibo, flag, numero di delta, di serpenti interi, di serpenti usciti
+AREA_DELTA = struct.Struct('!BHBBH')  # Indice, testa, direzione, flag, punteggio
+AREA_SNAKE = struct.Struct('!BBBHH')  # Indice, direzione, flag, punteggio, lunghezza
+
+SPECTATE_BODY = struct.Struct('!HHI')  # Stanza (0 per una qualsiasi), invii al secondo e byte al secondo (0 senza limite)
+WELCOME_BODY = struct.Struct('!Q')  # ID di connessione assegnato dal server
+
+JOINED_FREE_FOR_ALL = 1
+SPECTATOR = 0xFF  # Indice in joined per chi guarda senza giocare
+
+
+def pack_cells(cells):
+    data = array('H', cells)
+    if sys.byteorder == 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def unpack_cells(view, count):
+    cells = array('H')
+    cells.frombytes(view[:count * 2])
+    if len(cells) != count:
+        raise ValueError('truncated cell list')
+    if sys.byteorder == 'little':
+        cells.byteswap()
+    return cells
+
+
+def is_reliable(message):
+    return message['type'] in RELIABLE_TYPES
+
+
+def extra_checksum(state):
+    # CRC di cibo e bombe, indipendente dall'ordine delle bombe: se il client ha uno stato
+    # diverso da quello dell'host chiede un nuovo messaggio extra (resync)
+    food = NO_CELL if state.food is None else state.food
+    return zlib.crc32(pack_cells([food, *sorted(state.obstacles)]))
+
+
+def extra_message(state):
+    return {'type': 'extra', 'food': state.food, 'obstacles': list(state.obstacles)}
+
+
+def encode(message):
+    kind = message['type']
+    header = HEADER.pack(PROTOCOL_VERSION, MESSAGE_CODES[kind])
+    match kind:
+        case 'identify' | 'resync' | 'leave' | 'hello':
+            return header
+
+        case 'update':
+            flags = (FLAG_RUNNING if message['running'] else 0) | (FLAG_GREW if message['grew'] else 0)
+            return header + UPDATE_BODY.pack(message['tick'], message['head'], flags, message['direction'],
+                                             message['score'])
+
+        case 'snapshot':
+            cells = message['cells']
+            flags = FLAG_RUNNING if message['running'] else 0
+            return header + SNAPSHOT_BODY.pack(message['tick'], flags, message['direction'], message['score'],
+                                               len(cells)) + pack_cells(cells)
+
+        case 'extra':
+            food = NO_CELL if message['food'] is None else message['food']
+            obstacles = message['obstacles']
+            return header + EXTRA_BODY.pack(food, len(obstacles)) + pack_cells(obstacles)
+
+        case 'checksum':
+            return header + CHECKSUM_BODY.pack(message['value'])
+
+        case 'start':
+            return header + START_BODY.pack(message['seed'])
+
+        case 'inputs':
+            # Una direzione per byte, per i tick da tick - len + 1 a tick
+            directions = message['directions']
+            flags = FLAG_RUNNING if message['running'] else 0
+            return header + INPUTS_BODY.pack(message['tick'], message['confirmed'], flags, len(directions)) + bytes(
+                NO_DIRECTION if direction is None else direction for direction in directions)
+
+        case 'ping' | 'pong':
+            return header + PING_BODY.pack(message['time'])
+
+        case 'join':
+            return header + JOIN_BODY.pack(message['room'])
+
+        case 'spectate':
+            return header + SPECTATE_BODY.pack(message['room'], message['rate'], message['bandwidth'])
+
+        case 'welcome':
+            return header + WELCOME_BODY.pack(message['connection'])
+
+        case 'joined':
+            flags = JOINED_FREE_FOR_ALL if message['free_for_all'] else 0
+            return header + JOINED_BODY.pack(message['room'], message['index'], message['players'], message['tick'],
+                                             message['width'], message['height'], flags)
+
+        case 'room_update':
+            food = NO_CELL if message['food'] is None else message['food']
+            snakes = message['snakes']
+            return header + ROOM_UPDATE_BODY.pack(message['tick'], food, len(snakes)) + b''.join(
+                ROOM_SNAKE.pack(snake['head'], snake['direction'], snake['flags'], snake['score']) for snake in snakes)
+
+        case 'room_snapshot':
+            food = NO_CELL if message['food'] is None else message['food']
+            snakes = message['snakes']
+            obstacles = message['obstacles']
+            parts = [header, ROOM_SNAPSHOT_BODY.pack(message['tick'], food, len(snakes), len(obstacles)),
+                     pack_cells(obstacles)]
+            for snake in snakes:
+                cells = snake['cells']
+                parts.append(ROOM_SNAPSHOT_SNAKE.pack(snake['direction'], snake['flags'], snake['score'], len(cells)))
+                parts.append(pack_cells(cells))
+            return b''.join(parts)
+
+        case 'area_update':
+            deltas = [AREA_DELTA.pack(delta['index'], delta['head'], delta['direction'], delta['flags'],
+                                      delta['score']) for delta in message['deltas']]
+            snakes = [pack_area_snake(snake['index'], snake['direction'], snake['flags'], snake['score'],
+                                      snake['cells']) for snake in message['snakes']]
+            return pack_area_update(message['tick'], message['food'], message['complete'], deltas, snakes,
+                                    message['leaves'])
+
+
+def decode(data):
+    # Restituisce il messaggio come dizionario; ValueError se il datagramma non è valido
+    view = memoryview(data)
+    try:
+        version, code = HEADER.unpack_from(view)
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f'unsupported protocol version: {version}')
+        kind = MESSAGE_TYPES[code]
+        offset = HEADER.size
+
+        match kind:
+            case 'identify' | 'resync' | 'leave' | 'hello':
+                return {'type': kind}
+
+            case 'update':
+                tick, head, flags, direction, score = UPDATE_BODY.unpack_from(view, offset)
+                return {'type': kind, 'tick': tick, 'head': head, 'grew': bool(flags & FLAG_GREW),
+                        'direction': direction, 'score': score, 'running': bool(flags & FLAG_RUNNING)}
+
+            case 'snapshot':
+                tick, flags, direction, score, length = SNAPSHOT_BODY.unpack_from(view, offset)
+                cells = unpack_cells(view[offset + SNAPSHOT_BODY.size:], length)
+                return {'type': kind, 'tick': tick, 'cells': cells, 'direction': direction, 'score': score,
+                        'running': bool(flags & FLAG_RUNNING)}
+
+            case 'extra':
+                food, count = EXTRA_BODY.unpack_from(view, offset)
+                obstacles = unpack_cells(view[offset + EXTRA_BODY.size:], count)
+                return {'type': kind, 'food': None if food == NO_CELL else food, 'obstacles': obstacles}
+
+            case 'checksum':
+                value, = CHECKSUM_BODY.unpack_from(view, offset)
+                return {'type': kind, 'value': value}
+
+            case 'start':
+                seed, = START_BODY.unpack_from(view, offset)
+                return {'type': kind, 'seed': seed}
+
+            case 'inputs':
+                tick, confirmed, flags, count = INPUTS_BODY.unpack_from(view, offset)
+                directions = view[offset + INPUTS_BODY.size:offset + INPUTS_BODY.size + count]
+                if len(directions) != count:
+                    raise ValueError('truncated input list')
+                return {'type': kind, 'tick': tick, 'confirmed': confirmed, 'running': bool(flags & FLAG_RUNNING),
+                        'directions': [None if direction == NO_DIRECTION else direction for direction in directions]}
+
+            case 'ping' | 'pong':
+                sent_at, = PING_BODY.unpack_from(view, offset)
+                return {'type': kind, 'time': sent_at}
+
+            case 'join':
+                room, = JOIN_BODY.unpack_from(view, offset)
+                return {'type': kind, 'room': room}
+
+            case 'spectate':
+                room, rate, bandwidth = SPECTATE_BODY.unpack_from(view, offset)
+                return {'type': kind, 'room': room, 'rate': rate, 'bandwidth': bandwidth}
+
+            case 'welcome':
+                connection, = WELCOME_BODY.unpack_from(view, offset)
+                return {'type': kind, 'connection': connection}
+
+            case 'joined':
+                room, index, players, tick, width, height, flags = JOINED_BODY.unpack_from(view, offset)
+                return {'type': kind, 'room': room, 'index': index, 'players': players, 'tick': tick,
+                        'width': width, 'height': height, 'free_for_all': bool(flags & JOINED_FREE_FOR_ALL)}
+
+            case 'room_update':
+                tick, food, count = ROOM_UPDATE_BODY.unpack_from(view, offset)
+                offset += ROOM_UPDATE_BODY.size
+                snakes = []
+                for _ in range(count):
+                    head, direction, flags, score = ROOM_SNAKE.unpack_from(view, offset)
+                    offset += ROOM_SNAKE.size
+                    snakes.append({'head': head, 'direction': direction, 'flags': flags, 'score': score})
+                return {'type': kind, 'tick': tick, 'food': None if food == NO_CELL else food, 'snakes': snakes}
+
+            case 'room_snapshot':
+                tick, food, count, num_obstacles = ROOM_SNAPSHOT_BODY.unpack_from(view, offset)
+                offset += ROOM_SNAPSHOT_BODY.size
+                obstacles = unpack_cells(view[offset:], num_obstacles)
+                offset += num_obstacles * 2
+                snakes = []
+                for _ in range(count):
+                    direction, flags, score, length = ROOM_SNAPSHOT_SNAKE.unpack_from(view, offset)
+                    offset += ROOM_SNAPSHOT_SNAKE.size
+                    snakes.append({'direction': direction, 'flags': flags, 'score': score,
+                                   'cells': unpack_cells(view[offset:], length)})
+                    offset += length * 2
+                return {'type': kind, 'tick': tick, 'food': None if food == NO_CELL else food,
+                        'obstacles': obstacles, 'snakes': snakes}
+
+            case 'area_update':
+                tick, food, flags, num_deltas, count, num_leaves = AREA_BODY.unpack_from(view, offset)
+                offset += AREA_BODY.size
+                deltas = []
+                for _ in range(num_deltas):
+                    index, head, direction, snake_flags, score = AREA_DELTA.unpack_from(view, offset)
+                    offset += AREA_DELTA.size
+                    deltas.append({'index': index, 'head': head, 'direction': direction, 'flags': snake_flags,
+                                   'score': score})
+                snakes = []
+                for _ in range(count):
+                    index, direction, snake_flags, score, length = AREA_SNAKE.unpack_from(view, offset)
+                    offset += AREA_SNAKE.size
+                    snakes.append({'index': index, 'direction': direction, 'flags': snake_flags, 'score': score,
+                                   'cells': unpack_cells(view[offset:], length)})
+                    offset += length * 2
+                leaves = view[offset:offset + num_leaves]
+                if len(leaves) != num_leaves:
+                    raise ValueError('truncated leave list')
+                return {'type': kind, 'tick': tick, 'food': None if food == NO_CELL else food,
+                        'complete': bool(flags & AREA_COMPLETE), 'deltas': deltas, 'snakes': snakes,
+                        'leaves': list(leaves)}
+    except (struct.error, KeyError) as error:
+        raise ValueError(f'malformed message: {error}') from error
+
+
+class SnakeSender:
+    # Prepara i messaggi per il proprio serpente: un delta per tick, un'istantanea quando serve
+    def __init__(self, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.tick = 0
+        self.head = None
+        self.length = 0
+        self.force_snapshot = True
+
+    def message(self, snake, running):
+        self.tick += 1
+        head = snake.body.head
+        length = len(snake.body)
+        moved = self.head is not None and head != self.head and length - self.length in (0, 1)
+
+        if self.force_snapshot or not moved or self.tick % self.snapshot_interval == 0:
+            self.force_snapshot = False
+            message = {'type': 'snapshot', 'tick': self.tick, 'cells': list(snake.body),
+                       'direction': snake.direction, 'score': snake.score, 'running': running}
+        else:
+            message = {'type': 'update', 'tick': self.tick, 'head': head, 'grew': length > self.length,
+                       'direction': snake.direction, 'score': snake.score, 'running': running}
+
+        self.head = head
+        self.length = length
+        return message
+
+
+def valid_cells(state, *groups):
+    # Le celle arrivano dalla rete: un indice fuori dal campo farebbe fallire il client con
+    # IndexError, quindi chi riceve scarta il messaggio come un delta fuori ordine
+    size = state.width * state.height
+    return all(0 <= cell < size for cells in groups for cell in cells)
+
+
+def food_cells(message):
+    return () if message['food'] is None else (message['food'],)
+
+
+def valid_extra(state, message):
+    return valid_cells(state, food_cells(message), message['obstacles'])
+
+
+class SnakeReceiver:
+    # Applica i messaggi dell'altro peer al suo serpente. Un delta vale solo se segue
+    # esattamente l'ultimo tick applicato; altrimenti si aspetta la prossima istantanea.
+    def __init__(self):
+        self.tick = None  # Ultimo tick applicato al corpo del serpente
+        self.latest = None  # Tick più recente ricevuto
+
+    def apply(self, state, index, message):
+        cells = message['cells'] if message['type'] == 'snapshot' else [message['head']]
+        if message['direction'] not in DIRECTIONS or not valid_cells(state, cells):
+            return False  # Messaggio malformato: si scarta senza toccare lo stato
+
+        snake = state.snakes[index]
+        if self.latest is None or message['tick'] > self.latest:
+            # Punteggio e direzione valgono anche se il corpo non è aggiornabile
+            self.latest = message['tick']
+            snake.direction = message['direction']
+            snake.score = message['score']
+
+        if message['type'] == 'snapshot':
+            if self.tick is not None and message['tick'] <= self.tick:
+                return False  # Istantanea vecchia arrivata in ritardo
+            place_snake(state, index, message['cells'])
+        elif self.tick is None or message['tick'] != self.tick + 1:
+            return False  # Delta perso o fuori ordine: si aspetta la prossima istantanea
+        else:
+            advance_snake(state, index, message['head'], message['grew'])
+
+        self.tick = message['tick']
+        return True
+
+
+def snake_flags(snake, moved=False, grew=False):
+    return (FLAG_RUNNING if snake.alive else 0) | (FLAG_MOVED if moved else 0) | (FLAG_GREW if grew else 0)
+
+
+def room_snapshot(state):
+    return {
+        'type': 'room_snapshot',
+        'tick': state.tick,
+        'food': state.food,
+        'obstacles': list(state.obstacles),
+        'snakes': [{'direction': snake.direction, 'flags': snake_flags(snake), 'score': snake.score,
+                    'cells': list(snake.body)} for snake in state.snakes]
+    }
+
+
+def room_update(state, moved, lengths):
+    # Delta di tutti i serpenti dopo un tick; moved e lengths sono stato e lunghezze prima di step()
+    return {
+        'type': 'room_update',
+        'tick': state.tick,
+        'food': state.food,
+        'snakes': [{'head': snake.body.head, 'direction': snake.direction,
+                    'flags': snake_flags(snake, moved[i], len(snake.body) > lengths[i]), 'score': snake.score}
+                   if len(snake.body) else
+                   # Tutti contro tutti: morto e tolto dal campo in questo tick, non c'è una nuova testa
+                   {'head': NO_CELL, 'direction': snake.direction, 'flags': snake_flags(snake), 'score': snake.score}
+                   for i, snake in enumerate(state.snakes)]
+    }
+
+
+class RoomReceiver:
+    # Ricostruisce lo stato di una stanza del server dedicato: come SnakeReceiver, un delta vale
+    # solo se segue esattamente l'ultimo tick applicato, altrimenti si aspetta un'istantanea
+    def __init__(self):
+        self.tick = None
+
+    def apply(self, state, message):
+        if not self.valid(state, message):
+            return False
+        if message['type'] == 'room_snapshot':
+            if self.tick is not None and message['tick'] <= self.tick:
+                return False
+            set_obstacles(state, message['obstacles'])
+            for index, snake in enumerate(message['snakes']):
+                place_snake(state, index, snake['cells'])
+        elif self.tick is None or message['tick'] != self.tick + 1:
+            return False
+        else:
+            for index, snake in enumerate(message['snakes']):
+                if snake['flags'] & FLAG_MOVED:
+                    advance_snake(state, index, snake['head'], bool(snake['flags'] & FLAG_GREW))
+
+        set_food(state, message['food'])
+        for index, (target, snake) in enumerate(zip(state.snakes, message['snakes'])):
+            target.direction = snake['direction']
+            target.score = snake['score']
+            target.alive = bool(snake['flags'] & FLAG_RUNNING)
+            if state.free_for_all and not target.alive:
+                clear_snake(state, index)
+        state.tick = self.tick = message['tick']
+        return True
+
+    @staticmethod
+    def valid(state, message):
+        # Un record per ogni serpente della stanza, con direzioni e celle dentro il campo (la testa
+        # conta solo se il serpente si è mosso: un morto tolto dal campo ha NO_CELL)
+        snakes = message['snakes']
+        if len(snakes) != len(state.snakes) or any(snake['direction'] not in DIRECTIONS for snake in snakes):
+            return False
+        if message['type'] == 'room_snapshot':
+            cells = [message['obstacles'], *(snake['cells'] for snake in snakes)]
+        else:
+            cells = [[snake['head'] for snake in snakes if snake['flags'] & FLAG_MOVED]]
+        return valid_cells(state, food_cells(message), *cells)
+
+
+def pack_area_snake(index, direction, flags, score, cells):
+    return AREA_SNAKE.pack(index, direction, flags, score, len(cells)) + pack_cells(cells)
+
+
+def pack_area_update(tick, food, complete, deltas, snakes, leaves):
+    # deltas e snakes sono record già codificati (AREA_DELTA, pack_area_snake), leaves indici di serpenti
+    food = NO_CELL if food is None else food
+    flags = AREA_COMPLETE if complete else 0
+    return b''.join([HEADER.pack(PROTOCOL_VERSION, AREA_UPDATE),
+                     AREA_BODY.pack(tick, food, flags, len(deltas), len(snakes), len(leaves)),
+                     *deltas, *snakes, bytes(leaves)])
+
+
+class AreaRecords:
+    # Record dei serpenti dopo un tick, codificati al primo uso e poi riusati per tutti i giocatori
+    # che li vedono; moved e lengths sono stato e lunghezze prima di step()
+    def __init__(self, state, moved, lengths):
+        self.state = state
+        self.moved = moved
+        self.lengths = lengths
+        self.deltas = {}
+        self.snakes = {}
+
+    def delta(self, index):
+        record = self.deltas.get(index)
+        if record is None:
+            snake = self.state.snakes[index]
+            flags = snake_flags(snake, self.moved[index], len(snake.body) > self.lengths[index])
+            record = self.deltas[index] = AREA_DELTA.pack(index, snake.body.head, snake.direction, flags,
+                                                          snake.score)
+        return record
+
+    def snake(self, index):
+        record = self.snakes.get(index)
+        if record is None:
+            snake = self.state.snakes[index]
+            record = self.snakes[index] = pack_area_snake(index, snake.direction, snake_flags(snake), snake.score,
+                                                          list(snake.body))
+        return record
+
+
+class AreaReceiver:
+    # Ricostruisce la parte visibile di una stanza tutti contro tutti. I serpenti fuori dall'area
+    # restano senza celle; un delta vale solo se segue l'ultimo tick applicato e riguarda serpenti
+    # già noti, altrimenti si aspetta un messaggio completo (e il chiamante chiede un resync)
+    def __init__(self):
+        self.tick = None
+        self.known = set()
+
+    def apply(self, state, message):
+        if not self.valid(state, message):
+            return False
+        if message['complete']:
+            if self.tick is not None and message['tick'] <= self.tick:
+                return False
+            visible = {snake['index'] for snake in message['snakes']}
+            for index in self.known - visible:
+                place_snake(state, index, [])
+            self.known = visible
+        else:
+            if self.tick is None or message['tick'] != self.tick + 1:
+                return False
+            if any(delta['index'] not in self.known for delta in message['deltas']):
+                return False
+            for index in message['leaves']:
+                place_snake(state, index, [])
+                self.known.discard(index)
+            for delta in message['deltas']:
+                if delta['flags'] & FLAG_MOVED:
+                    advance_snake(state, delta['index'], delta['head'], bool(delta['flags'] & FLAG_GREW))
+                self.update(state, delta)
+
+        for snake in message['snakes']:
+            place_snake(state, snake['index'], snake['cells'])
+            self.update(state, snake)
+            self.known.add(snake['index'])
+        set_food(state, message['food'])
+        state.tick = self.tick = message['tick']
+        return True
+
+    @staticmethod
+    def valid(state, message):
+        # Indici dei serpenti, direzioni e celle dentro i limiti della stanza
+        records = message['deltas'] + message['snakes']
+        if any(not 0 <= index < len(state.snakes) for index in message['leaves']):
+            return False
+        if any(not 0 <= record['index'] < len(state.snakes) or record['direction'] not in DIRECTIONS
+               for record in records):
+            return False
+        heads = [delta['head'] for delta in message['deltas'] if delta['flags'] & FLAG_MOVED]
+        return valid_cells(state, food_cells(message), heads, *(snake['cells'] for snake in message['snakes']))
+
+    @staticmethod
+    def update(state, record):
+        target = state.snakes[record['index']]
+        target.direction = record['direction']
+        target.score = record['score']
+        target.alive = bool(record['flags'] & FLAG_RUNNING)
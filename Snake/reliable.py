@@ -0,0 +1,114 @@
+from framing import SEQUENCE_WINDOW
+
+# Canale affidabile sopra framing.py, per i pochi messaggi che non possono andare persi
+# (identify, cibo e bombe, richieste di risincronizzazione). Ogni messaggio riceve un ID a
+# 16 bit e resta in attesa finché il pacchetto che lo conteneva non viene confermato dagli ack
+# dell'altro peer (tutti i pacchetti, se era frammentato); se la conferma non arriva entro il
+# timeout viene ritrasmesso solo lui, nel prossimo datagramma. In ricezione i messaggi vengono
+# consegnati una volta sola e in ordine.
+
+ID_MODULO = 0x10000
+INITIAL_TIMEOUT = 0.2  # Secondi prima di ritrasmettere, finché non c'è una stima del RTT
+MIN_TIMEOUT = 0.05
+
+
+def id_distance(a, b):
+    # Distanza da b ad a sugli ID a 16 bit che ricominciano da zero: negativa se a è più vecchio
+    distance = (a - b) % ID_MODULO
+    return distance - ID_MODULO if distance >= ID_MODULO // 2 else distance
+
+
+class ReliableChannel:
+    def __init__(self):
+        self.next_id = 0
+        # ID -> [dati, istante dell'ultimo invio o None, pacchetti dell'ultimo invio non ancora confermati]
+        self.unacked = {}
+        self.in_flight = {}  # Sequenza del pacchetto -> (ID affidabili contenuti, istante di invio)
+        self.rtt = None  # Media mobile del tempo di andata e ritorno dei pacchetti
+
+        self.resent = 0
+        self.acked = 0
+        self.reset_receiver()
+
+    def reset_receiver(self):
+        # L'altro peer ha aperto una nuova connessione: i suoi ID ripartono da zero
+        self.expected = 0
+        self.early = {}
+
+    @property
+    def timeout(self):
+        return INITIAL_TIMEOUT if self.rtt is None else max(MIN_TIMEOUT, 2 * self.rtt)
+
+    def queue(self, payload):
+        reliable_id = self.next_id
+        self.next_id = (self.next_id + 1) % ID_MODULO
+        self.unacked[reliable_id] = [payload, None, set()]
+
+    def due(self, now):
+        # Messaggi mai inviati o non confermati in tempo, da includere nel prossimo datagramma
+        timeout = self.timeout
+        return [(reliable_id, entry[0]) for reliable_id, entry in self.unacked.items()
+                if entry[1] is None or now - entry[1] >= timeout]
+
+    def next_deadline(self, now):
+        # Secondi fino alla prossima ritrasmissione, None se non c'è niente da confermare
+        if not self.unacked:
+            return None
+        timeout = self.timeout
+        deadlines = (timeout if sent is None else sent + timeout - now for _, sent, _ in self.unacked.values())
+        return max(0.0, min(deadlines))
+
+    def sent(self, sequence, ids, now):
+        for reliable_id in ids:
+            entry = self.unacked.get(reliable_id)
+            if entry is not None:
+                if entry[1] != now:
+                    # Nuovo invio: i frammenti di uno precedente non bastano più a completarlo
+                    if entry[1] is not None:
+                        self.resent += 1
+                    entry[1] = now
+                    entry[2] = set()
+                entry[2].add(sequence)
+        self.in_flight[sequence] = (ids, now)
+
+    def acknowledge(self, ack, ack_bits, now):
+        for offset in range(SEQUENCE_WINDOW):
+            if not ack_bits >> offset & 1:
+                continue
+            packet = self.in_flight.pop(ack - offset, None)
+            if packet is None:
+                continue
+
+            ids, sent_at = packet
+            sample = now - sent_at
+            self.rtt = sample if self.rtt is None else self.rtt + (sample - self.rtt) / 8
+            for reliable_id in ids:
+                entry = self.unacked.get(reliable_id)
+                if entry is None:
+                    continue
+                entry[2].discard(ack - offset)
+                if not entry[2]:
+                    del self.unacked[reliable_id]
+                    self.acked += 1
+
+        # I pacchetti usciti dalla finestra degli ack non verranno più confermati
+        oldest = ack - SEQUENCE_WINDOW
+        for sequence in [sequence for sequence in self.in_flight if sequence <= oldest]:
+            del self.in_flight[sequence]
+
+    def receive(self, reliable_id, payload):
+        # Restituisce i messaggi ora consegnabili in ordine (nessuno se è un duplicato o in anticipo).
+        # I messaggi in anticipo vanno tenuti tutti: il loro pacchetto è già stato confermato.
+        distance = id_distance(reliable_id, self.expected)
+        if distance < 0:
+            return []  # Già consegnato: il suo ack era andato perso
+        if distance > 0:
+            self.early[reliable_id] = payload
+            return []
+
+        ready = [payload]
+        self.expected = (self.expected + 1) % ID_MODULO
+        while self.expected in self.early:
+            ready.append(self.early.pop(self.expected))
+            self.expected = (self.expected + 1) % ID_MODULO
+        return ready
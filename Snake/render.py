@@ -0,0 +1,161 @@
+import pygame
+
+from engine import BLOCK_SIZE, GRID_WIDTH, RIGHT, cell_to_pixel, direction_to
+
+# Renderer a rettangoli sporchi per il campo di gioco. La scena di ogni frame è un dizionario
+# cella -> superficie; confrontandola con quella del frame precedente si ridisegnano solo le
+# celle cambiate (nuova testa, coda liberata, mela spostata, bombe nuove) ripristinando lo
+# sfondo sotto di esse, e si aggiornano sullo schermo solo quei rettangoli.
+#
+# Sopra la scena si possono disegnare sprite in posizioni qualsiasi, anche a metà tra due celle
+# (i serpenti interpolati tra due tick): per quelli spostati si ridisegna, ritagliato al loro
+# rettangolo vecchio e nuovo, tutto ciò che vi compare.
+
+
+class DirtyRenderer:
+    def __init__(self, screen, background, overlay_rect):
+        self.screen = screen
+        self.background = background
+        # Area del pannello dei punteggi, disegnato sopra la scena, allargata alle celle intere che tocca
+        overlay_rect = pygame.Rect(overlay_rect)
+        self.overlay_cells = self.cells_in(overlay_rect)
+        self.overlay_area = overlay_rect.unionall([self.cell_rect(cell) for cell in self.overlay_cells])
+        self.scene = {}
+        self.sprites = []
+        self.overlay_key = None
+        self.full_redraw = True
+
+    @staticmethod
+    def cells_in(rect):
+        columns = range(rect.left // BLOCK_SIZE, (rect.right - 1) // BLOCK_SIZE + 1)
+        rows = range(rect.top // BLOCK_SIZE, (rect.bottom - 1) // BLOCK_SIZE + 1)
+        return {y * GRID_WIDTH + x for y in rows for x in columns}
+
+    @staticmethod
+    def cell_rect(cell):
+        return pygame.Rect(cell_to_pixel(cell), (BLOCK_SIZE, BLOCK_SIZE))
+
+    def invalidate(self):
+        # Da chiamare quando qualcun altro ha disegnato sullo schermo (pausa, esplosione, ...)
+        self.full_redraw = True
+
+    def render(self, scene, overlay_key, draw_overlay, sprites=()):
+        # overlay_key identifica il contenuto del pannello (es. i punteggi): se non cambia e
+        # nessuna cella sotto il pannello è cambiata, il pannello non viene ridisegnato.
+        # sprites è un elenco di (superficie, posizione in pixel), disegnati in ordine sopra la scena.
+        screen = self.screen
+        sprites = list(sprites)
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+            screen.blits([(surface, cell_to_pixel(cell)) for cell, surface in scene.items()], False)
+            screen.blits(sprites, False)
+            draw_overlay()
+            pygame.display.flip()
+            self.scene = scene
+            self.sprites = sprites
+            self.overlay_key = overlay_key
+            self.full_redraw = False
+            return
+
+        previous = self.scene
+        changed = [cell for cell, surface in previous.items() if scene.get(cell) is not surface]
+        changed.extend(cell for cell in scene if cell not in previous)
+
+        rects = []
+        if not sprites and not self.sprites:
+            # Solo celle: basta ripristinare lo sfondo e ridisegnarle
+            blits = []
+            for cell in changed:
+                rect = self.cell_rect(cell)
+                blits.append((self.background, rect, rect))
+                if cell in scene:
+                    blits.append((scene[cell], rect))
+                rects.append(rect)
+            screen.blits(blits, False)
+        else:
+            rects = [self.cell_rect(cell) for cell in changed]
+            moved = set(self.sprites).symmetric_difference(sprites)
+            rects.extend(pygame.Rect(position, surface.get_size()) for surface, position in moved)
+            self.redraw(rects, scene, sprites)
+
+        overlay_area = self.overlay_area
+        if overlay_key != self.overlay_key or overlay_area.collidelist(rects) != -1:
+            # Il pannello copre alcune celle: si ripristina ciò che c'è sotto di esso, poi il pannello
+            self.redraw([overlay_area], scene, sprites)
+            draw_overlay()
+            rects.append(overlay_area)
+            self.overlay_key = overlay_key
+
+        self.scene = scene
+        self.sprites = sprites
+        if rects:
+            pygame.display.update(rects)
+
+    def redraw(self, rects, scene, sprites):
+        # Ridisegna da zero (sfondo, celle, sprite) il contenuto di ogni rettangolo, ritagliato
+        screen = self.screen
+        bounds = screen.get_rect()
+        sprite_rects = [pygame.Rect(position, surface.get_size()) for surface, position in sprites]
+        for rect in rects:
+            rect = rect.clip(bounds)
+            screen.set_clip(rect)
+            screen.blit(self.background, rect, rect)
+            screen.blits([(scene[cell], cell_to_pixel(cell)) for cell in self.cells_in(rect) if cell in scene], False)
+            screen.blits([sprites[i] for i in rect.collidelistall(sprite_rects)], False)
+        screen.set_clip(None)
+
+
+def oriented(image):
+    # image è disegnata verso destra: restituisce le versioni per UP, RIGHT, DOWN, LEFT
+    return (
+        pygame.transform.rotate(image, 90),
+        image,
+        pygame.transform.rotate(image, -90),
+        pygame.transform.flip(image, True, False),
+    )
+
+
+class SnakeSprites:
+    # Sprite di un serpente già ruotati per le quattro direzioni: a ogni frame non serve più
+    # nessuna rotazione. Le immagini devono essere già convertite nel formato del display.
+    def __init__(self, head, body, tail):
+        self.heads = oriented(head)
+        self.bodies = oriented(body)
+        self.tails = oriented(tail)  # Orientate verso il segmento che segue la coda
+
+    def segments(self, state, snake):
+        # Coppie (cella, sprite) dalla testa alla coda: ogni segmento è orientato verso quello che lo precede
+        cells = iter(snake.body)
+        previous = next(cells)
+        yield previous, self.heads[snake.direction]
+
+        last = len(snake.body) - 2
+        for i, cell in enumerate(cells):
+            direction = direction_to(state, cell, previous)
+            if direction is None:
+                direction = RIGHT  # Segmenti non adiacenti (es. posizione ricevuta dalla rete incompleta)
+            yield cell, (self.tails if i == last else self.bodies)[direction]
+            previous = cell
+
+    def place(self, scene, state, snake):
+        # Aggiunge il serpente alla scena, un segmento per cella
+        for cell, surface in self.segments(state, snake):
+            scene[cell] = surface
+
+    def interpolated(self, state, snake, previous, alpha):
+        # Sprite del serpente a una frazione alpha (0..1) del passaggio dalle celle previous (dalla
+        # testa alla coda, al tick precedente) a quelle attuali, dalla coda alla testa perché la
+        # testa resti sopra. Ogni segmento scivola dalla cella che occupava a quella nuova; se le due
+        # celle non sono adiacenti sullo schermo (teletrasporto ai bordi) il segmento è già in quella nuova.
+        sprites = []
+        last = len(previous) - 1
+        for i, (cell, surface) in enumerate(self.segments(state, snake)):
+            x, y = cell_to_pixel(cell)
+            if last >= 0:
+                previous_x, previous_y = cell_to_pixel(previous[min(i, last)])
+                if abs(x - previous_x) + abs(y - previous_y) <= BLOCK_SIZE:
+                    x = round(previous_x + (x - previous_x) * alpha)
+                    y = round(previous_y + (y - previous_y) * alpha)
+            sprites.append((surface, (x, y)))
+        sprites.reverse()
+        return sprites
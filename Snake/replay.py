@@ -0,0 +1,402 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import protocol
+from engine import (
+    DIFFICULTY_LEVELS, EVENT_BOMB, EVENT_SELF, EVENT_SNAKE, FreeCells, load_state, new_game, save_state, set_food,
+    set_obstacles, step
+)
+from protocol import NO_CELL, NO_DIRECTION, pack_cells, unpack_cells
+
+# Replay binari delle partite. Il file contiene le impostazioni della partita, un keyframe
+# iniziale (lo stato completo, generatore casuale compreso) e poi, nell'ordine in cui il gioco
+# li ha applicati, gli input di ogni tick e i messaggi di rete che hanno cambiato lo stato
+# (cibo e bombe dell'host, serpente dell'avversario col netcode "state"). Con il lockstep si
+# registrano solo gli input confermati di entrambi i serpenti: la partita si rigioca dal seed.
+# Ogni KEYFRAME_INTERVAL tick un nuovo keyframe permette di saltare in un punto qualsiasi del
+# replay, e in riproduzione fa da controllo: se lo stato rigiocato è diverso da quello registrato
+# la partita ha divergenza (es. una collisione o una mela diverse da quelle viste dal giocatore).
+#
+# La scrittura avviene in un thread a parte: il loop di gioco accoda solo tuple già pronte
+# (input, messaggi decodificati, copie dello stato di save_state) e non tocca mai il disco.
+#
+# Con PYSNAKE_REPLAY_DIR impostata, main.py registra ogni partita in quella cartella.
+#
+# Uso senza finestra, alla massima velocità (es. per controllare che una modifica al motore non
+# cambi le partite registrate):
+#   python replay.py partita.psr [altre.psr ...] [--until TICK] [--board]
+
+logger = logging.getLogger(__name__)
+
+REPLAY_DIR = os.environ.get('PYSNAKE_REPLAY_DIR')
+REPLAY_SUFFIX = '.psr'
+REPLAY_MAGIC = b'PSRP'
+REPLAY_VERSION = 1
+KEYFRAME_INTERVAL = 100  # Tick tra due keyframe
+MAX_CELLS = NO_CELL  # Le celle si registrano come indici a 16 bit, NO_CELL escluso
+
+REPLAY_LOCKSTEP = 1
+REPLAY_RESHUFFLE = 2
+REPLAY_FREE_FOR_ALL = 4
+SNAKE_REMOTE = 1
+
+RECORD_TICK = 1
+RECORD_MESSAGE = 2
+RECORD_KEYFRAME = 3
+
+# Magic, versione, flag, tick al secondo, serpenti, serpente locale, larghezza, altezza, bombe iniziali, seed;
+# segue un byte di flag per serpente
+REPLAY_HEADER = struct.Struct('!4sBBBBBHHHI')
+MESSAGE_RECORD = struct.Struct('!BBH')  # Tipo, serpente, lunghezza del messaggio (codificato come in rete)
+KEYFRAME_RECORD = struct.Struct('!BII')  # Tipo, tick, lunghezza del keyframe compresso
+
+KEYFRAME_BODY = struct.Struct('!IHHBd')  # Tick, cibo, bombe da mantenere, gauss_next presente, gauss_next
+RNG_STATE = struct.Struct('!625I')  # Stato interno del Mersenne Twister (random.getstate()[1])
+RECEIVER_BODY = struct.Struct('!II')  # Ultimo tick applicato e più recente ricevuto dell'avversario
+KEYFRAME_SNAKE = struct.Struct('!BBBHH')  # Direzione, flag, causa della morte, punteggio, lunghezza
+NO_TICK = 0xFFFFFFFF
+
+SNAKE_GROWING = 1
+SNAKE_ALIVE = 2
+DEATH_CAUSES = [None, EVENT_BOMB, EVENT_SELF, EVENT_SNAKE]
+
+
+def replay_path(directory=REPLAY_DIR):
+    return os.path.join(directory, time.strftime('replay-%Y%m%d-%H%M%S') + REPLAY_SUFFIX)
+
+
+def encode_keyframe(saved, receiver=(None, None)):
+    # saved è una copia di save_state(); receiver i tick (tick, latest) dello SnakeReceiver dell'avversario
+    (tick, rng, food, obstacles, num_obstacles, free_cells, _, grid, counts, snakes) = saved
+    _, internal, gauss_next = rng
+    parts = [KEYFRAME_BODY.pack(tick, NO_CELL if food is None else food, num_obstacles, gauss_next is not None,
+                                gauss_next or 0.0),
+             RNG_STATE.pack(*internal),
+             RECEIVER_BODY.pack(*(NO_TICK if value is None else value for value in receiver)),
+             struct.pack('!H', len(obstacles)), pack_cells(obstacles),
+             struct.pack('!H', len(free_cells)), pack_cells(free_cells),
+             bytes(grid), bytes(counts)]
+    for cells, _, start, length, direction, growing, score, alive, death_cause, _ in snakes:
+        capacity = len(cells)
+        body = [cells[(start + length - 1 - i) % capacity] for i in range(length)]  # Dalla testa alla coda
+        flags = (SNAKE_GROWING if growing else 0) | (SNAKE_ALIVE if alive else 0)
+        parts.append(KEYFRAME_SNAKE.pack(direction, flags, DEATH_CAUSES.index(death_cause), score, length))
+        parts.append(pack_cells(body))
+    return b''.join(parts)
+
+
+def decode_keyframe(state, data, receiver=None):
+    # Ripristina su state (creato con le impostazioni del replay) un keyframe di encode_keyframe()
+    view = memoryview(data)
+    tick, food, num_obstacles, has_gauss, gauss_next = KEYFRAME_BODY.unpack_from(view)
+    offset = KEYFRAME_BODY.size
+    internal = RNG_STATE.unpack_from(view, offset)
+    offset += RNG_STATE.size
+    receiver_tick, latest = RECEIVER_BODY.unpack_from(view, offset)
+    offset += RECEIVER_BODY.size
+    count, = struct.unpack_from('!H', view, offset)
+    obstacles = dict.fromkeys(unpack_cells(view[offset + 2:], count))
+    offset += 2 + count * 2
+    count, = struct.unpack_from('!H', view, offset)
+    free_cells = array('i', unpack_cells(view[offset + 2:], count))
+    offset += 2 + count * 2
+    size = state.width * state.height
+    grid = bytearray(view[offset:offset + size])
+    counts = bytearray(view[offset + size:offset + 2 * size])
+    offset += 2 * size
+
+    positions = FreeCells(size, state.blocked).positions
+    for cell in range(size):
+        if positions[cell] != FreeCells.EXCLUDED:
+            positions[cell] = -1
+    for i, cell in enumerate(free_cells):
+        positions[cell] = i
+
+    snakes = []
+    for _ in state.snakes:
+        direction, flags, cause, score, length = KEYFRAME_SNAKE.unpack_from(view, offset)
+        offset += KEYFRAME_SNAKE.size
+        body = unpack_cells(view[offset:], length)
+        offset += length * 2
+        cells = array('i', bytes(4 * (size + 1)))
+        occupied = bytearray(size)
+        for i, cell in enumerate(reversed(body)):
+            cells[i] = cell
+            occupied[cell] += 1
+        # La lunghezza alla morte non è nel keyframe: per un serpente morto vale il corpo rimasto
+        alive = bool(flags & SNAKE_ALIVE)
+        snakes.append((cells, occupied, 0, length, direction, bool(flags & SNAKE_GROWING), score, alive,
+                       DEATH_CAUSES[cause], None if alive else length))
+
+    rng = (3, internal, gauss_next if has_gauss else None)
+    load_state(state, (tick, rng, None if food == NO_CELL else food, obstacles, num_obstacles, free_cells, positions,
+                       grid, counts, snakes))
+    if receiver is not None:
+        receiver.tick = None if receiver_tick == NO_TICK else receiver_tick
+        receiver.latest = None if latest == NO_TICK else latest
+
+
+class ReplayRecorder:
+    def __init__(self, path, state, fps, local=0, lockstep=False, seed=0, receiver=None,
+                 interval=KEYFRAME_INTERVAL):
+        # ValueError se il campo ha più celle di quante un replay ne possa indicare
+        if state.width * state.height > MAX_CELLS:
+            raise ValueError(f'board too large for a replay: {state.width}x{state.height} '
+                             f'(at most {MAX_CELLS} cells)')
+        self.path = path
+        self.players = len(state.snakes)
+        self.tick = state.tick  # Ultimo tick registrato
+        self.interval = interval
+        self.last_keyframe = None
+        self.queue = queue.SimpleQueue()
+
+        flags = ((REPLAY_LOCKSTEP if lockstep else 0) | (REPLAY_RESHUFFLE if state.reshuffle_obstacles else 0) |
+                 (REPLAY_FREE_FOR_ALL if state.free_for_all else 0))
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, flags, fps, self.players, local, state.width,
+                                    state.height, state.num_obstacles, seed or 0)
+        header += bytes(SNAKE_REMOTE if snake.remote else 0 for snake in state.snakes)
+        self.thread = threading.Thread(target=self.write, args=(header,), name='replay-writer', daemon=True)
+        self.thread.start()
+        self.keyframe(state, receiver)
+
+    @property
+    def keyframe_due(self):
+        return self.tick - self.last_keyframe >= self.interval
+
+    def inputs(self, directions):
+        # Direzioni di tutti i serpenti per il prossimo tick, come passate a step()
+        directions = list(directions) + [None] * (self.players - len(directions))
+        self.queue.put((RECORD_TICK, directions))
+        self.tick += 1
+
+    def message(self, index, message):
+        # Messaggio di rete (già decodificato, non più modificato) applicato allo stato, per il serpente index
+        self.queue.put((RECORD_MESSAGE, (index, message)))
+
+    def keyframe(self, state, receiver=None):
+        # Lo stato deve essere quello dell'ultimo tick registrato
+        self.last_keyframe = self.tick
+        ticks = (receiver.tick, receiver.latest) if receiver is not None else (None, None)
+        self.queue.put((RECORD_KEYFRAME, (save_state(state), ticks)))
+
+    def close(self, state=None, receiver=None):
+        # Chiude il file dopo aver scritto tutto; con lo stato finale aggiunge l'ultimo keyframe
+        if state is not None and state.tick == self.tick and self.last_keyframe != self.tick:
+            self.keyframe(state, receiver)
+        self.queue.put(None)
+        self.thread.join()
+
+    def write(self, header):
+        try:
+            with open(self.path, 'wb') as file:
+                file.write(header)
+                while True:
+                    item = self.queue.get()
+                    if item is None:
+                        return
+                    file.write(self.encode(*item))
+                    if self.queue.empty():
+                        file.flush()  # Niente di pronto: il replay su disco arriva fino a qui
+        except OSError as error:
+            logger.warning('replay not saved path=%s error=%s', self.path, error)
+        except (struct.error, OverflowError, ValueError) as error:
+            # Un valore che non sta nel formato: il file vale fino al record precedente
+            logger.warning('replay truncated path=%s error=%s', self.path, error)
+        while self.queue.get() is not None:
+            pass  # Il gioco continua ad accodare: si scarta tutto fino alla chiusura
+
+    @staticmethod
+    def encode(kind, data):
+        if kind == RECORD_TICK:
+            return bytes([RECORD_TICK]) + bytes(NO_DIRECTION if direction is None else direction for direction in data)
+        if kind == RECORD_MESSAGE:
+            index, message = data
+            payload = protocol.encode(message)
+            return MESSAGE_RECORD.pack(RECORD_MESSAGE, index, len(payload)) + payload
+        saved, receiver = data
+        payload = zlib.compress(encode_keyframe(saved, receiver))
+        return KEYFRAME_RECORD.pack(RECORD_KEYFRAME, saved[0], len(payload)) + payload
+
+
+class ReplayPlayer:
+    # Rigioca un replay: step() avanza di un tick, seek() salta a un tick qualsiasi partendo dal
+    # keyframe precedente. Durante la riproduzione in avanti ogni keyframe registrato viene
+    # confrontato con lo stato rigiocato; il primo tick diverso resta in diverged.
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        view = memoryview(data)
+        try:
+            (magic, version, flags, self.fps, players, self.local, width, height, num_obstacles,
+             self.seed) = REPLAY_HEADER.unpack_from(view)
+        except struct.error as error:
+            raise ValueError(f'not a replay: {path}') from error
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f'unsupported replay: {path}')
+        offset = REPLAY_HEADER.size
+        self.snake_flags = bytes(view[offset:offset + players])
+        offset += players
+
+        self.lockstep = bool(flags & REPLAY_LOCKSTEP)
+        self.state = new_game(players, width=width, height=height, num_obstacles=num_obstacles,
+                              reshuffle_obstacles=bool(flags & REPLAY_RESHUFFLE), spawn=False,
+                              free_for_all=bool(flags & REPLAY_FREE_FOR_ALL))
+        for snake, snake_flags in zip(self.state.snakes, self.snake_flags):
+            snake.remote = bool(snake_flags & SNAKE_REMOTE)
+        self.receiver = protocol.SnakeReceiver()
+
+        # Record in ordine: (RECORD_TICK, direzioni), (RECORD_MESSAGE, (serpente, messaggio)),
+        # (RECORD_KEYFRAME, (tick, keyframe compresso)). Un replay troncato (es. gioco chiuso di colpo)
+        # vale fino all'ultimo record completo.
+        self.records = []
+        self.keyframes = []  # (tick, indice del record)
+        while offset < len(view):
+            kind = view[offset]
+            if kind == RECORD_TICK:
+                directions = view[offset + 1:offset + 1 + players]
+                if len(directions) < players:
+                    break
+                self.records.append((kind, [None if direction == NO_DIRECTION else direction
+                                            for direction in directions]))
+                offset += 1 + players
+            elif kind == RECORD_MESSAGE:
+                if offset + MESSAGE_RECORD.size > len(view):
+                    break
+                _, index, length = MESSAGE_RECORD.unpack_from(view, offset)
+                offset += MESSAGE_RECORD.size
+                if offset + length > len(view):
+                    break
+                self.records.append((kind, (index, protocol.decode(view[offset:offset + length]))))
+                offset += length
+            elif kind == RECORD_KEYFRAME:
+                if offset + KEYFRAME_RECORD.size > len(view):
+                    break
+                _, tick, length = KEYFRAME_RECORD.unpack_from(view, offset)
+                offset += KEYFRAME_RECORD.size
+                if offset + length > len(view):
+                    break
+                self.keyframes.append((tick, len(self.records)))
+                self.records.append((kind, (tick, bytes(view[offset:offset + length]))))
+                offset += length
+            else:
+                raise ValueError(f'corrupted replay: {path} (record type {kind} at {offset})')
+        if not self.keyframes or self.keyframes[0][1] != 0:
+            raise ValueError(f'corrupted replay: {path} (no initial keyframe)')
+
+        self.first_tick = self.keyframes[0][0]
+        self.last_tick = self.first_tick + sum(kind == RECORD_TICK for kind, _ in self.records)
+        self.diverged = None
+        self.position = 0
+        self.load_keyframe(0)
+
+    @property
+    def difficulty(self):
+        return next((name for name, fps in DIFFICULTY_LEVELS.items() if fps == self.fps), None)
+
+    @property
+    def ended(self):
+        return self.position >= len(self.records)
+
+    def load_keyframe(self, number):
+        tick, index = self.keyframes[number]
+        decode_keyframe(self.state, zlib.decompress(self.records[index][1][1]), self.receiver)
+        self.position = index + 1
+
+    def step(self):
+        # Applica i record fino al prossimo tick compreso; restituisce gli eventi di step(), None a fine replay
+        state = self.state
+        while self.position < len(self.records):
+            kind, data = self.records[self.position]
+            self.position += 1
+            if kind == RECORD_TICK:
+                return step(state, data)
+            if kind == RECORD_MESSAGE:
+                index, message = data
+                if message['type'] == 'extra':
+                    set_food(state, message['food'])
+                    set_obstacles(state, message['obstacles'])
+                else:
+                    self.receiver.apply(state, index, message)
+            elif self.diverged is None:
+                tick, payload = data
+                ticks = (self.receiver.tick, self.receiver.latest)
+                if state.tick != tick or encode_keyframe(save_state(state), ticks) != zlib.decompress(payload):
+                    self.diverged = tick
+        return None
+
+    def seek(self, tick):
+        # Porta lo stato al tick indicato (o all'ultimo del replay)
+        tick = max(self.first_tick, min(tick, self.last_tick))
+        number = max(i for i, (keyframe_tick, _) in enumerate(self.keyframes) if keyframe_tick <= tick)
+        if not self.keyframes[number][0] <= self.state.tick <= tick:
+            self.load_keyframe(number)  # Indietro, o avanti oltre un keyframe: si riparte da lì
+        while self.state.tick < tick and self.step() is not None:
+            pass
+        return self.state.tick
+
+
+def board_text(state):
+    # Il campo come testo: cifre per le teste, lettere minuscole per i corpi, * cibo, # bombe
+    rows = [['.'] * state.width for _ in range(state.height)]
+    for cell in state.obstacles:
+        rows[cell // state.width][cell % state.width] = '#'
+    if state.food is not None:
+        rows[state.food // state.width][state.food % state.width] = '*'
+    for i, snake in enumerate(state.snakes):
+        for cell in snake.body:
+            rows[cell // state.width][cell % state.width] = chr(ord('a') + i % 26)
+    for i, snake in enumerate(state.snakes):
+        if len(snake.body):
+            rows[snake.body.head // state.width][snake.body.head % state.width] = str(i % 10)
+    return '\n'.join(''.join(row) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Riproduce replay di PySnake senza finestra, alla massima velocità')
+    parser.add_argument('replays', nargs='+')
+    parser.add_argument('--until', type=int, help='si ferma a questo tick')
+    parser.add_argument('--board', action='store_true', help='stampa il campo a fine riproduzione')
+    args = parser.parse_args()
+
+    diverged = False
+    for path in args.replays:
+        player = ReplayPlayer(path)
+        start_time = time.perf_counter()
+        if args.until is not None:
+            player.seek(args.until)
+        else:
+            while player.step() is not None:
+                pass  # L'ultima chiamata controlla anche il keyframe finale
+        elapsed = time.perf_counter() - start_time
+        state = player.state
+        played = state.tick - player.first_tick
+        print(json.dumps({
+            'replay': path,
+            'difficulty': player.difficulty,
+            'lockstep': player.lockstep,
+            'seed': player.seed,
+            'ticks': state.tick,
+            'last_tick': player.last_tick,
+            'diverged_at': player.diverged,
+            'players': [{'score': snake.score, 'length': len(snake) if snake.alive else snake.death_length,
+                         'alive': snake.alive,
+                         'death': snake.death_cause} for snake in state.snakes],
+            'ticks_per_second': round(played / elapsed) if elapsed else None,
+        }))
+        if args.board:
+            print(board_text(state))
+        diverged = diverged or player.diverged is not None
+    sys.exit(1 if diverged else 0)
+
+
+if __name__ == '__main__':
+    main()
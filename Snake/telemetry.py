@@ -0,0 +1,123 @@
+import time
+
+# Misure della rete per ServerTask: pacchetti e byte al secondo, tempi di codifica e decodifica,
+# RTT e jitter misurati con i ping, più un log limitato per i messaggi che potrebbero ripetersi
+# a ogni pacchetto (es. datagrammi scartati) senza intasare stdout dal thread di rete.
+
+LOG_INTERVAL = 5.0  # Secondi minimi tra due messaggi di log con la stessa chiave
+
+
+class LatencyStats:
+    # Statistiche essenziali su un ritardo misurato molte volte (in secondi)
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class RateMeter:
+    # Totale di una quantità e sua frequenza al secondo sull'ultimo intervallo completo
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.total = 0
+        self.count = 0  # Quantità dall'inizio dell'intervallo corrente
+        self.start = None
+        self.rate = 0.0
+
+    def add(self, amount, now):
+        self.update(now)
+        if self.start is None:
+            self.start = now
+        self.total += amount
+        self.count += amount
+
+    def update(self, now):
+        if self.start is not None and now - self.start >= self.interval:
+            self.rate = self.count / (now - self.start)
+            self.count = 0
+            self.start = now
+
+    def per_second(self, now):
+        self.update(now)
+        return self.rate
+
+
+class RateLimitedLog:
+    # Al più un messaggio per chiave ogni interval secondi; quelli soppressi vengono contati e
+    # riportati insieme al successivo
+    def __init__(self, logger, interval=LOG_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self.last = {}  # Chiave -> (istante dell'ultimo messaggio, messaggi soppressi da allora)
+
+    def log(self, level, key, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        last, suppressed = self.last.get(key, (None, 0))
+        if last is not None and now - last < self.interval:
+            self.last[key] = (last, suppressed + 1)
+            return
+        if suppressed:
+            message += ' suppressed=%d'
+            args += (suppressed,)
+        self.last[key] = (now, 0)
+        self.logger.log(level, message, *args)
+
+
+class NetworkMetrics:
+    def __init__(self):
+        self.packets_in = RateMeter()
+        self.packets_out = RateMeter()
+        self.bytes_in = RateMeter()
+        self.bytes_out = RateMeter()
+        self.encode = LatencyStats()  # Secondi per messaggio
+        self.decode = LatencyStats()
+        self.rtt = LatencyStats()  # Dai ping
+        self.jitter = 0.0  # Variazione media tra RTT consecutivi, come in RTCP (RFC 3550)
+        self.discarded = 0  # Datagrammi non validi
+
+    def received(self, size, now):
+        self.packets_in.add(1, now)
+        self.bytes_in.add(size, now)
+
+    def sent(self, size, now):
+        self.packets_out.add(1, now)
+        self.bytes_out.add(size, now)
+
+    def pong(self, rtt):
+        if self.rtt.count:
+            self.jitter += (abs(rtt - self.rtt.last) - self.jitter) / 16
+        self.rtt.add(rtt)
+
+    def snapshot(self, now):
+        # Valori correnti come dizionario piatto (tempi in millisecondi), da leggere o salvare in JSON
+        return {
+            'packets_in_per_s': round(self.packets_in.per_second(now), 1),
+            'packets_out_per_s': round(self.packets_out.per_second(now), 1),
+            'bytes_in_per_s': round(self.bytes_in.per_second(now), 1),
+            'bytes_out_per_s': round(self.bytes_out.per_second(now), 1),
+            'packets_in': self.packets_in.total,
+            'packets_out': self.packets_out.total,
+            'bytes_in': self.bytes_in.total,
+            'bytes_out': self.bytes_out.total,
+            'encode_ms': round(self.encode.mean * 1000, 4),
+            'decode_ms': round(self.decode.mean * 1000, 4),
+            'rtt_ms': round(self.rtt.last * 1000, 2),
+            'rtt_mean_ms': round(self.rtt.mean * 1000, 2),
+            'rtt_max_ms': round(self.rtt.max * 1000, 2),
+            'jitter_ms': round(self.jitter * 1000, 2),
+            'discarded': self.discarded,
+        }
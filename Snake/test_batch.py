@@ -0,0 +1,22 @@
+import unittest
+
+import batch
+
+# Il motore batch deve seguire le regole di engine.step() tick per tick: eventi, morte, causa
+# della morte, punteggio e corpo del serpente, su più seed e numeri di partite.
+
+
+class BatchMatchesEngineTest(unittest.TestCase):
+    def test_batch_matches_engine(self):
+        for seed in range(4):
+            for boards in (1, 7, 64):
+                with self.subTest(seed=seed, boards=boards):
+                    found = batch.divergence(boards=boards, ticks=600, seed=seed)
+                    if found is not None:
+                        board, tick, field, scalar, batched = found
+                        self.fail(f'board {board}, tick {tick}: {field} is {scalar!r} in engine.step, '
+                                  f'{batched!r} in the batch engine')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from match_server import MatchServer, Peer
+
+# Il server deve restare in piedi qualunque cosa chieda un client: join di una stanza già
+# iniziata da cui un giocatore è uscito, svolte con direzioni che non esistono.
+
+
+class JoinTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MatchServer('127.0.0.1', 0, players=2, seed=1)
+        self.addCleanup(self.server.close)
+        self.address = ('127.0.0.1', self.server.port)  # I messaggi del server tornano a lui, e nessuno li legge
+
+    def peer(self, connection):
+        peer = self.server.peers[connection] = Peer(connection, self.address)
+        return peer
+
+    def test_join_started_room_with_free_slot(self):
+        server = self.server
+        first, second = self.peer(1), self.peer(2)
+        server.handle(first, {'type': 'join', 'room': 0}, 0.0)
+        server.handle(second, {'type': 'join', 'room': 0}, 0.0)
+        started = first.room
+        self.assertIsNotNone(started.state)
+        for _ in range(3):
+            started.tick()
+
+        server.handle(first, {'type': 'leave'}, 0.0)
+        self.assertFalse(started.full)
+
+        late = self.peer(3)
+        server.handle(late, {'type': 'join', 'room': started.id}, 0.0)
+        self.assertIsNot(late.room, started)
+        self.assertIn(late.room, server.waiting)
+        self.assertEqual(started.state.tick, 3)
+        self.assertIs(started.members[1], second)
+
+    def test_inputs_out_of_range(self):
+        server = self.server
+        first, second = self.peer(1), self.peer(2)
+        server.handle(first, {'type': 'join', 'room': 0}, 0.0)
+        server.handle(second, {'type': 'join', 'room': 0}, 0.0)
+        room = first.room
+        direction = room.state.snakes[0].direction
+        server.handle(first, {'type': 'inputs', 'tick': 2, 'confirmed': 0, 'directions': [7, 255],
+                              'running': True}, 0.0)
+        self.assertEqual(len(first.inputs), 0)
+        room.tick()
+        room.tick()
+        self.assertEqual(room.state.snakes[0].direction, direction)
+
+
+if __name__ == '__main__':
+    unittest.main()
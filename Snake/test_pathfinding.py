@@ -0,0 +1,71 @@
+import gc
+import time
+import unittest
+
+import engine
+from bots import PATH_BUDGET, PathBot
+from pathfinding import first_step
+
+# PathBot deve scegliere ogni mossa entro PATH_BUDGET anche su un campo grande, prima mossa
+# compresa (quando il campo di distanze non esiste ancora). Il tempo si misura in CPU del
+# processo e senza garbage collector: le pause dello scheduler su una macchina carica e quelle del
+# collector (che dipendono da tutti gli oggetti del processo, qui quelli di pytest) non sono del bot.
+
+
+class PathBotBudgetTest(unittest.TestCase):
+    def worst_move(self, players, ticks):
+        state = engine.new_game(players, 1, 200, 200, num_obstacles=5 if players == 1 else 0,
+                                reshuffle_obstacles=players == 1, free_for_all=players > 2)
+        bots = [PathBot(i) for i in range(players)]
+        worst = (0.0, None)
+        while not state.over and state.tick < ticks:
+            inputs = []
+            for i, bot in enumerate(bots):
+                if not state.snakes[i].alive:
+                    inputs.append(None)
+                    continue
+                gc.disable()
+                start = time.process_time()
+                inputs.append(bot.move(state, i))
+                worst = max(worst, (time.process_time() - start, state.tick))
+                gc.enable()
+            engine.step(state, inputs)
+        return worst
+
+    def test_single_player(self):
+        elapsed, tick = self.worst_move(1, 1000)
+        self.assertLess(elapsed, PATH_BUDGET, f'move at tick {tick} took {elapsed * 1e3:.2f} ms')
+
+    def test_free_for_all(self):
+        elapsed, tick = self.worst_move(8, 300)
+        self.assertLess(elapsed, PATH_BUDGET, f'move at tick {tick} took {elapsed * 1e3:.2f} ms')
+
+    def test_long_snake(self):
+        # Mezzo campo occupato dal corpo: contare lo spazio libero per ogni mossa costerebbe da
+        # solo più del tempo disponibile
+        state = engine.new_game(1, 1, 200, 200)
+        body = []
+        for y in range(100, 200):
+            body += [state.cell(x, y) for x in (range(200) if y % 2 == 0 else range(199, -1, -1))]
+        engine.place_snake(state, 0, body, engine.UP)
+        engine.set_food(state, state.cell(100, 10))
+        bot = PathBot(0)
+        for _ in range(5):
+            gc.disable()
+            start = time.process_time()
+            direction = bot.move(state, 0)
+            elapsed = time.process_time() - start
+            gc.enable()
+            self.assertLess(elapsed, PATH_BUDGET, f'move at tick {state.tick} took {elapsed * 1e3:.2f} ms')
+            engine.step(state, [direction])
+
+
+class FirstStepTest(unittest.TestCase):
+    def test_start_is_goal(self):
+        state = engine.new_game(1, 1)
+        head = state.snakes[0].body.head
+        self.assertIsNone(first_step(state, bytes(len(state.grid)), head, head))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import protocol
+from engine import new_game
+
+# Le celle e le direzioni ricevute dalla rete non sono mai fidate: un messaggio con un indice fuori
+# dal campo si scarta (apply restituisce False, come per un delta perso) senza toccare lo stato.
+
+
+def received(message):
+    return protocol.decode(protocol.encode(message))
+
+
+class ReceiverBoundsTest(unittest.TestCase):
+    def setUp(self):
+        self.state = new_game(players=2, seed=1)
+        self.cells = self.state.width * self.state.height
+
+    def test_snake_receiver(self):
+        state, receiver = self.state, protocol.SnakeReceiver()
+        body = list(state.snakes[1].body)
+        snapshot = {'type': 'snapshot', 'tick': 1, 'cells': [self.cells], 'direction': 0, 'score': 0, 'running': True}
+        self.assertFalse(receiver.apply(state, 1, received(snapshot)))
+        self.assertEqual(list(state.snakes[1].body), body)
+
+        snapshot['cells'] = body
+        self.assertTrue(receiver.apply(state, 1, received(snapshot)))
+        update = {'type': 'update', 'tick': 2, 'head': self.cells + 5, 'grew': False, 'direction': 0, 'score': 0,
+                  'running': True}
+        self.assertFalse(receiver.apply(state, 1, received(update)))
+        self.assertEqual(list(state.snakes[1].body), body)
+
+        snapshot.update(tick=3, direction=9)
+        self.assertFalse(receiver.apply(state, 1, snapshot))
+
+    def test_room_receiver(self):
+        state, receiver = self.state, protocol.RoomReceiver()
+        snapshot = protocol.room_snapshot(state)
+        snapshot['snakes'][1]['cells'].append(self.cells)
+        self.assertFalse(receiver.apply(state, received(snapshot)))
+        self.assertIsNone(receiver.tick)
+
+        snapshot = protocol.room_snapshot(state)
+        snapshot['food'] = self.cells
+        self.assertFalse(receiver.apply(state, received(snapshot)))
+        self.assertTrue(receiver.apply(state, received(protocol.room_snapshot(state))))
+
+    def test_area_receiver(self):
+        state, receiver = self.state, protocol.AreaReceiver()
+        snakes = [protocol.pack_area_snake(9, 0, protocol.FLAG_RUNNING, 0, [0, 1])]
+        self.assertFalse(receiver.apply(state, protocol.decode(protocol.pack_area_update(1, None, True, [], snakes,
+                                                                                         []))))
+        snakes = [protocol.pack_area_snake(0, 0, protocol.FLAG_RUNNING, 0, [self.cells - 1, self.cells])]
+        self.assertFalse(receiver.apply(state, protocol.decode(protocol.pack_area_update(1, None, True, [], snakes,
+                                                                                         []))))
+        self.assertIsNone(receiver.tick)
+
+    def test_extra(self):
+        self.assertFalse(protocol.valid_extra(self.state, received({'type': 'extra', 'food': 3,
+                                                                     'obstacles': [self.cells]})))
+        self.assertTrue(protocol.valid_extra(self.state, received(protocol.extra_message(self.state))))
+
+
+if __name__ == '__main__':
+    unittest.main()
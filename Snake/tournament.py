@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import engine
+from bots import make_bot
+from engine import DIFFICULTY_LEVELS, SINGLE_PLAYER_OBSTACLES, board_size
+from replay import MAX_CELLS, ReplayRecorder
+
+# Torneo tra bot: gioca molte partite con seed fissato, Single Player e Multiplayer, su tutti
+# i core disponibili. Le regole sono quelle di game(): in Single Player 5 bombe iniziali e una
+# in più (rimescolate) a ogni mela, in Multiplayer nessuna bomba; la partita finisce quando
+# un serpente muore. La difficoltà decide quanti tick dura il tempo limite della partita.
+# Con --players oltre 2 il Multiplayer diventa tutti contro tutti sul campo grande
+# (engine.FREE_FOR_ALL_SIZE), finché resta un solo serpente. --board cambia il campo di tutte le
+# partite (es. 200x200 per mettere alla prova i bot sui campi grandi).
+#
+# Ogni risultato viene scritto come una riga JSON non appena la partita finisce. Con --replay-dir
+# ogni partita viene anche registrata (replay.py), per rigiocarla dopo una modifica al motore.
+
+MODES = {"single": "Single Player", "multi": "Multiplayer"}
+
+
+def play_match(job):
+    match_id, seed, mode, difficulty, bot_names, max_seconds, players, board, replay_dir = job
+    fps = DIFFICULTY_LEVELS[difficulty]
+    max_ticks = max_seconds * fps  # Tempo limite di gioco convertito in tick alla velocità scelta
+    single = mode == MODES["single"]
+
+    free_for_all = not single and players > 2
+    width, height = board or (engine.FREE_FOR_ALL_SIZE if free_for_all else (engine.GRID_WIDTH, engine.GRID_HEIGHT))
+    state = engine.new_game(
+        players=1 if single else players,
+        seed=seed,
+        width=width,
+        height=height,
+        num_obstacles=SINGLE_PLAYER_OBSTACLES if single else 0,
+        reshuffle_obstacles=single,
+        free_for_all=free_for_all
+    )
+    bots = [make_bot(name, seed * 31 + i) for i, name in enumerate(bot_names[:len(state.snakes)])]
+
+    recorder = None
+    if replay_dir:
+        recorder = ReplayRecorder(os.path.join(replay_dir, f'match-{match_id:06d}.psr'), state, fps, seed=seed)
+
+    start_time = time.perf_counter()
+    while not state.over and state.tick < max_ticks:
+        inputs = [bot.move(state, i) if state.snakes[i].alive else None for i, bot in enumerate(bots)]
+        engine.step(state, inputs)
+        if recorder is not None:
+            recorder.inputs(inputs)
+            if recorder.keyframe_due:
+                recorder.keyframe(state)
+    elapsed = time.perf_counter() - start_time
+    if recorder is not None:
+        recorder.close(state)
+
+    return {
+        'match': match_id,
+        'seed': seed,
+        'mode': mode,
+        'difficulty': difficulty,
+        'ticks': state.tick,
+        'timeout': not state.over,
+        'players': [{
+            'bot': bot_names[i],
+            'score': snake.score,
+            'length': len(snake) if snake.alive else snake.death_length,  # Anche tutti contro tutti
+            'alive': snake.alive,
+            'death': snake.death_cause,
+        } for i, snake in enumerate(state.snakes)],
+        'ticks_per_second': round(state.tick / elapsed) if elapsed else None,
+    }
+
+
+def make_jobs(args):
+    modes = list(MODES.values()) if args.mode == 'both' else [MODES[args.mode]]
+    match_id = 0
+    for mode in modes:
+        for i in range(args.matches):
+            bot_names = [args.bots[(i + j) % len(args.bots)] for j in range(args.players)]
+            yield (match_id, args.seed + i, mode, args.difficulty, bot_names, args.max_seconds, args.players,
+                   args.board, args.replay_dir)
+            match_id += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Torneo tra bot di PySnake')
+    parser.add_argument('--matches', type=int, default=1000, help='partite per modalità')
+    parser.add_argument('--mode', choices=['single', 'multi', 'both'], default='both')
+    parser.add_argument('--difficulty', choices=list(DIFFICULTY_LEVELS), default='Media')
+    parser.add_argument('--max-seconds', type=int, default=600, help='tempo limite di gioco per partita')
+    parser.add_argument('--bots', nargs='+', default=['greedy', 'random'],
+                        help='bot registrati in bots.BOTS o "modulo:Classe"')
+    parser.add_argument('--players', type=int, default=2, help='serpenti per partita Multiplayer (oltre 2: tutti '
+                                                               'contro tutti)')
+    parser.add_argument('--board', type=board_size, help='campo LARGHEZZAxALTEZZA di tutte le partite')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='results.jsonl')
+    parser.add_argument('--replay-dir', help='cartella in cui registrare il replay di ogni partita')
+    args = parser.parse_args()
+    if not 2 <= args.players <= engine.MAX_SNAKES:
+        parser.error(f'--players must be between 2 and {engine.MAX_SNAKES}')
+    if args.replay_dir and args.board and args.board[0] * args.board[1] > MAX_CELLS:
+        parser.error(f'--board too large for --replay-dir (replays support at most {MAX_CELLS} cells)')
+
+    if args.replay_dir:
+        os.makedirs(args.replay_dir, exist_ok=True)
+    for name in args.bots:
+        make_bot(name)  # Errore subito, prima di avviare i processi, se un bot non esiste
+
+    start_time = time.perf_counter()
+    matches = 0
+    ticks = 0
+    with open(args.output, 'w') as output, Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_match, make_jobs(args), chunksize=16):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            matches += 1
+            ticks += result['ticks']
+
+    elapsed = time.perf_counter() - start_time
+    print(f'{matches} partite, {ticks} tick in {elapsed:.1f}s '
+          f'({matches / elapsed:.0f} partite/s, {ticks / elapsed:.0f} tick/s) -> {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()